@@ -0,0 +1,147 @@
+import numpy as np
+try:
+    import scipy.sparse as sp
+except ImportError: # scipy is only needed for sparse inputs
+    sp = None
+import config
+#-------------------------------------------------------------------------
+'''
+    The ndarray engine of the models.
+    The public functions of logistic.py, softmax.py and neuralnet.py take and return np.matrix objects. np.matrix is deprecated and slow to work with:
+    every * and .T creates a new matrix object, a scalar * matrix product goes through np.dot, and iterating over a matrix yields 1 by p matrices.
+    The training loops (train_pass()) and predict() therefore run on plain numpy arrays, with the functions below:
+        - a vector (the biases, the weights of logistic regression, an instance) is a 1-dimensional array;
+        - a set of instances is a C-contiguous 2-dimensional array with one instance per row, so that X[i] and X[i:j] are views without any copy;
+        - the products use the @ operator.
+    The adapters convert at the boundary of the public functions: as_rows() and as_vector() on the way in, as_column() and np.asmatrix() on the way out.
+    Both are views whenever the memory layout allows it, so the conversions cost no copy of the data.
+
+    Notations:
+            X: a set of instances, a float numpy array of shape (n by p), or a scipy sparse (CSR) matrix.
+            W: a weight matrix, a float numpy array of shape (c by p).
+            b: a bias vector, a float numpy array of length c.
+            z: the logits, a float numpy array of shape (n by c), or of length n for a single output.
+'''
+
+#--------------------------
+def issparse(X):
+    '''
+        Check whether a feature matrix is a scipy sparse matrix.
+        Input:
+            X: a feature matrix, a numpy matrix or array, or a scipy sparse matrix.
+        Output:
+            True if X is a scipy sparse matrix, a boolean.
+    '''
+    return sp is not None and sp.issparse(X)
+
+#--------------------------
+def as_rows(X, dtype=None):
+    '''
+        Convert a set of instances to the layout of the engine. Nothing is copied if X is already a C-contiguous array of the dtype.
+        Input:
+            X: the instances, a numpy matrix or array of shape (n by p), or a scipy sparse matrix.
+            dtype: the floating point type, or None to keep the dtype of X.
+        Output:
+            X: a C-contiguous numpy array of shape (n by p), or a scipy CSR matrix.
+    '''
+    if issparse(X):
+        X = X.tocsr()
+        return X if dtype is None else config.cast(X, dtype)
+    # one copy at most, for the layout and the dtype together
+    return np.ascontiguousarray(X, dtype=dtype)
+
+#--------------------------
+def as_vector(v, dtype=None):
+    '''
+        Convert a column vector (for example the biases b, a numpy matrix of shape c by 1) to a 1-dimensional array, as a view when possible.
+        Input:
+            v: a vector, a numpy matrix or array of shape c by 1, 1 by c or c, or a list.
+            dtype: the floating point type, or None to keep the dtype of v.
+        Output:
+            v: a numpy array of length c.
+    '''
+    return np.asarray(v, dtype=dtype).reshape(-1)
+
+#--------------------------
+def as_column(v):
+    '''
+        Convert a 1-dimensional array back to the column vector of the public functions, as a view.
+        Input:
+            v: a numpy array of length c.
+        Output:
+            v: a numpy matrix of shape c by 1.
+    '''
+    return np.asmatrix(np.asarray(v).reshape((-1, 1)))
+
+#--------------------------
+def linear(X, W, b):
+    '''
+        Compute the logits of a fully connected layer for a set of instances. z = X W^T + b
+        Input:
+            X: the instances, a float numpy array of shape (n by p), or a scipy sparse matrix.
+            W: the weight matrix, a float numpy array of shape (c by p).
+            b: the biases, a float numpy array of length c.
+        Output:
+            z: the logits, a float numpy array of shape (n by c).
+    '''
+    z = X @ W.T
+    z += b
+    return z
+
+#--------------------------
+def gradient_step(param, grad, alpha):
+    '''
+        Take one gradient descent step, param - alpha * grad, in the dtype of the parameter.
+        The step is scaled with np.multiply instead of alpha * grad: np.matrix computes a scalar product with np.dot, which turns float32 into float64.
+        Input:
+            param: the parameter, a float numpy matrix or array.
+            grad: the gradient of the loss w.r.t. the parameter, of the same shape.
+            alpha: the step-size, a float scalar.
+        Output:
+            param: the updated parameter, a new numpy matrix or array of the type and dtype of param.
+    '''
+    return param - np.multiply(alpha, grad)
+
+#--------------------------
+def sigmoid(z):
+    '''
+        Compute the sigmoid of logits of any shape. The exponential is only evaluated on -|z|, so large logits can neither overflow nor raise.
+        Input:
+            z: the logits, a float numpy array.
+        Output:
+            a: the activations, a float numpy array of the shape and dtype of z.
+    '''
+    with np.errstate(under='ignore'):
+        e = np.exp(-np.abs(z))
+    return np.where(z >= 0, 1. / (1. + e), e / (1. + e))
+
+#--------------------------
+def softmax(z):
+    '''
+        Compute the softmax of each row of the logits. The largest logit of each row is subtracted before the exponential,
+        so the result is stable for logits of any magnitude.
+        Input:
+            z: the logits, a float numpy array of shape (n by c).
+        Output:
+            a: the activations, a float numpy array of shape (n by c). Each row sums to 1.
+    '''
+    z = z - np.max(z, axis=1, keepdims=True)
+    with np.errstate(under='ignore'):
+        e_z = np.exp(z)
+    return e_z / np.sum(e_z, axis=1, keepdims=True)
+
+#--------------------------
+def linear_gradients(X, dL_dz):
+    '''
+        Compute the gradients of the average loss over a set of instances w.r.t. the weights and biases of a fully connected layer.
+        Input:
+            X: the inputs of the layer, a float numpy array of shape (n by p), or a scipy sparse matrix.
+            dL_dz: the gradients of the loss w.r.t. the logits of the layer, a float numpy array of shape (n by c).
+        Output:
+            dL_dW: the gradient of the average loss w.r.t. the weights, a float numpy array of shape (c by p).
+            dL_db: the gradient of the average loss w.r.t. the biases, a float numpy array of length c.
+    '''
+    n = X.shape[0]
+    dL_dW = (X.T @ dL_dz).T / n
+    dL_db = np.sum(dL_dz, axis=0) / n
+    return dL_dW, dL_db
@@ -0,0 +1,112 @@
+import numbers
+import zlib
+import numpy as np
+try:
+    import scipy.sparse as sp
+except ImportError: # scipy is only needed to build the sparse feature matrices
+    sp = None
+#-------------------------------------------------------------------------
+'''
+    Feature hashing (the hashing trick).
+    Map raw categorical records directly to a fixed number of features, without building a vocabulary or a one-hot encoded dense matrix.
+    Each (field, value) pair is hashed to a column index in 0, 1, ..., n_features-1, so the memory used by the models only
+    depends on n_features, not on the number of distinct values. The output is a scipy sparse (CSR) matrix,
+    which logistic.train() and softmax.train() consume one nonzero feature at a time.
+
+    Notations:
+            record: one data instance, a dictionary {field: value} or a list of (field, value) pairs.
+                    A string value is a categorical feature: the pair "field=value" is hashed and gets the value 1.
+                    A numeric value is a numerical feature: the field name is hashed and gets the given value.
+            n_features: the number of columns of the hashed feature matrix, an integer scalar. A power of 2 is recommended.
+            alternate_sign: whether to multiply each hashed feature by a sign (+1 or -1) derived from its hash, a boolean.
+                    Then colliding features tend to cancel out instead of adding up, which keeps inner products unbiased.
+'''
+
+#--------------------------
+def hash_key(key, n_features=2**20, alternate_sign=True):
+    '''
+        Hash one feature name to a column index and a sign.
+        The CRC32 checksum is used (instead of the built-in hash()), so the mapping is the same in every process and every run.
+        Input:
+            key: the feature name, a string.
+            n_features: the number of columns, an integer scalar.
+            alternate_sign: whether to derive a sign from the hash, a boolean.
+        Output:
+            i: the column index of the feature, an integer scalar between 0 and n_features-1.
+            s: the sign of the feature, 1. or -1. (always 1. if alternate_sign is False).
+    '''
+    h = zlib.crc32(key.encode('utf-8'))
+    i = h % n_features
+    s = -1. if alternate_sign and (h >> 31) & 1 else 1.
+    return i, s
+
+#--------------------------
+def hash_record(record, n_features=2**20, alternate_sign=True):
+    '''
+        Hash one record into the column indices and values of its nonzero features.
+        Input:
+            record: a dictionary {field: value} or a list of (field, value) pairs (see the notations above).
+            n_features: the number of columns, an integer scalar.
+            alternate_sign: whether to derive a sign from the hash, a boolean.
+        Output:
+            idx: the column indices of the nonzero features, an integer numpy array of length nnz. Indices can repeat when two features collide.
+            val: the values of the nonzero features, a float numpy array of length nnz.
+    '''
+    items = record.items() if isinstance(record, dict) else record
+    idx, val = [], []
+    for field, value in items:
+        if value is None:
+            continue
+        if isinstance(value, numbers.Number) and not isinstance(value, bool):
+            key, v = str(field), float(value)
+        else:
+            key, v = '%s=%s' % (field, value), 1.
+        i, s = hash_key(key, n_features, alternate_sign)
+        idx.append(i)
+        val.append(s * v)
+    return np.array(idx, dtype=int), np.array(val, dtype=float)
+
+#--------------------------
+def transform(records, n_features=2**20, alternate_sign=True):
+    '''
+        Hash a list of records into a sparse feature matrix.
+        Input:
+            records: the data instances, an iterable of records (see the notations above).
+            n_features: the number of columns, an integer scalar.
+            alternate_sign: whether to derive a sign from the hash, a boolean.
+        Output:
+            X: the hashed feature matrix, a scipy sparse (CSR) matrix of shape (n by n_features).
+               The values of colliding features within a record are summed.
+    '''
+    if sp is None:
+        raise ImportError('feature hashing requires scipy')
+    indptr, indices, data = [0], [], []
+    for record in records:
+        idx, val = hash_record(record, n_features, alternate_sign)
+        indices.append(idx)
+        data.append(val)
+        indptr.append(indptr[-1] + len(idx))
+    indices = np.concatenate(indices) if indices else np.zeros(0, dtype=int)
+    data = np.concatenate(data) if data else np.zeros(0)
+    X = sp.csr_matrix((data, indices, np.array(indptr)), shape=(len(indptr) - 1, n_features))
+    X.sum_duplicates()
+    return X
+
+#--------------------------
+def hash_stream(source, n_features=2**20, alternate_sign=True):
+    '''
+        Wrap a stream of raw records, so that it can be passed to train_stream() of the models.
+        Input:
+            source: the raw training data, a list of (records, Y) blocks or a function with no input that returns a new iterable of such blocks.
+                    Here records is a list of records and Y the labels of the block, an integer array-like.
+            n_features: the number of columns, an integer scalar.
+            alternate_sign: whether to derive a sign from the hash, a boolean.
+        Output:
+            stream: a function with no input that returns a new generator of (X_chunk, Y_chunk) pairs,
+                    where X_chunk is the hashed feature matrix of a block, a scipy sparse (CSR) matrix of shape (m by n_features).
+    '''
+    def stream():
+        blocks = source() if callable(source) else source
+        for records, Y in blocks:
+            yield transform(records, n_features, alternate_sign), np.asarray(Y, dtype=int).ravel()
+    return stream
@@ -0,0 +1,142 @@
+import numpy as np
+try:
+    import numba
+except ImportError: # numba is optional, the models fall back to the Python training loop
+    numba = None
+#-------------------------------------------------------------------------
+'''
+    Compiled per-sample SGD kernels.
+    Each kernel runs one epoch of per-sample stochastic gradient descent (forward pass, fused backward pass and update)
+    over a dense training set, in the same order and with the same arithmetic as train_pass() of the model.
+    The kernels are plain Python functions on numpy arrays; when numba is installed they are compiled with numba.njit,
+    which removes the overhead of the ~15 helper calls per instance of the Python training loop.
+    The matrix-vector products use np.dot (BLAS, like the Python loop), so that the sums are accumulated in the same order:
+    SGD amplifies rounding differences over many updates, and a different summation order would drift away from the reference.
+    The results match train_pass() within 1e-10 as long as the step-size is small enough for SGD to be stable; with a step-size
+    so large that SGD is chaotic, a rounding difference of 1e-16 (even within the Python loop) grows to a visible difference.
+    Select them with train(..., backend='numba'). Without numba, train() falls back to the Python training loop.
+
+    Notations:
+            X: the feature matrix, a C-contiguous float numpy array of shape (n by p).
+            Y: the labels, an integer numpy array of length n.
+            The parameters are float numpy arrays, updated in place: vectors are 1-dimensional arrays.
+'''
+
+#--------------------------
+def logistic_epoch(X, Y, w, b, alpha):
+    '''
+        One epoch of per-sample SGD for logistic regression (see logistic.train_pass()).
+        Input:
+            X: the feature matrix, a float numpy array of shape (n by p).
+            Y: the labels, an integer numpy array of length n. The values can be 0 or 1.
+            w: the weights, a float numpy array of length p, updated in place.
+            b: the bias, a float scalar.
+            alpha: the step-size parameter of gradient descent, a float scalar.
+        Output:
+            b: the updated bias, a float scalar.
+    '''
+    n, p = X.shape
+    for i in range(n):
+        # Forward pass
+        z = np.dot(X[i], w) + b
+        a = 1. / (1. + np.exp(-z))
+
+        # Back propagation: dL_da * da_dz, with the same guards as logistic.compute_dL_da()
+        if Y[i] == 0:
+            dL_da = 1. / (1. - a) if a != 1. else 1e6
+        else:
+            dL_da = -1. / a if a != 0. else 1e-6
+        dL_dz = dL_da * (a * (1. - a))
+
+        # update the parameters
+        for j in range(p):
+            w[j] -= alpha * (dL_dz * X[i, j])
+        b -= alpha * dL_dz
+    return b
+
+#--------------------------
+def softmax_epoch(X, Y, W, b, alpha):
+    '''
+        One epoch of per-sample SGD for softmax regression (see softmax.train_pass()).
+        Input:
+            X: the feature matrix, a float numpy array of shape (n by p).
+            Y: the labels, an integer numpy array of length n. The values can be 0,1,2, ..., or (c-1).
+            W: the weights, a float numpy array of shape (c by p), updated in place.
+            b: the biases, a float numpy array of length c, updated in place.
+            alpha: the step-size parameter of gradient descent, a float scalar.
+    '''
+    n, p = X.shape
+    c = W.shape[0]
+    for i in range(n):
+        # Forward pass
+        a = np.exp(np.dot(W, X[i]) + b)
+        a /= a.sum()
+
+        # fused softmax and cross entropy gradient a - onehot(y), then update
+        a[Y[i]] -= 1.
+        for k in range(c):
+            for j in range(p):
+                W[k, j] -= alpha * (a[k] * X[i, j])
+            b[k] -= alpha * a[k]
+
+#--------------------------
+def neuralnet_epoch(X, Y, W1, b1, W2, b2, alpha):
+    '''
+        One epoch of per-sample SGD for the fully connected network (see neuralnet.train_pass()).
+        Input:
+            X: the feature matrix, a float numpy array of shape (n by p).
+            Y: the labels, an integer numpy array of length n. The values can be 0,1,2, ..., or (c-1).
+            W1, b1: the parameters of the 1st layer, float numpy arrays of shapes (h by p) and h, updated in place.
+            W2, b2: the parameters of the 2nd layer, float numpy arrays of shapes (c by h) and c, updated in place.
+            alpha: the step-size parameter of gradient descent, a float scalar.
+    '''
+    n, p = X.shape
+    h = W1.shape[0]
+    c = W2.shape[0]
+    for i in range(n):
+        # Forward pass
+        a1 = 1. / (1. + np.exp(-(np.dot(W1, X[i]) + b1)))
+        a2 = np.exp(np.dot(W2, a1) + b2)
+        a2 /= a2.sum()
+
+        # Back Propagation, starting from the fused gradient a2 - onehot(y)
+        a2[Y[i]] -= 1.
+        dL_dz1 = np.dot(W2.T, a2) * (a1 * (1. - a1))
+
+        # update the parameters
+        for k in range(c):
+            for j in range(h):
+                W2[k, j] -= alpha * (a2[k] * a1[j])
+            b2[k] -= alpha * a2[k]
+        for k in range(h):
+            for j in range(p):
+                W1[k, j] -= alpha * (dL_dz1[k] * X[i, j])
+            b1[k] -= alpha * dL_dz1[k]
+
+
+#-------------------------------------------------------------------------
+_compiled = {}
+
+#--------------------------
+def available():
+    '''
+        Check whether the compiled kernels can be used.
+        Output:
+            True if numba is installed, a boolean.
+    '''
+    return numba is not None
+
+#--------------------------
+def get_kernel(kernel):
+    '''
+        Get the compiled version of a kernel. It is compiled on first use and then cached.
+        Input:
+            kernel: one of the kernels above, a function.
+        Output:
+            the compiled kernel, or None if numba is not installed.
+    '''
+    if numba is None:
+        return None
+    if kernel not in _compiled:
+        _compiled[kernel] = numba.njit(cache=True)(kernel)
+    return _compiled[kernel]
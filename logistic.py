@@ -1,5 +1,12 @@
 import math
 import numpy as np
+import stream
+import parallel
+import jit
+import config
+import engine
+from workspace import Workspace
+from engine import issparse
 #-------------------------------------------------------------------------
 '''
     Logistic Regression:
@@ -262,7 +269,7 @@ def compute_dL_dw(dL_da, da_dz, dz_dw):
     '''
     #########################################
 
-    dL_dw = dL_da * da_dz * dz_dw
+    dL_dw = np.multiply(dL_da * da_dz, dz_dw)
 
     #########################################
     return dL_dw
@@ -308,7 +315,7 @@ def update_w(w, dL_dw, alpha=0.001):
 
     #########################################
    
-    w = w - alpha * dL_dw
+    w = engine.gradient_step(w, dL_dw, alpha)
 
 
     #########################################
@@ -336,55 +343,601 @@ def update_b(b, dL_db, alpha=0.001):
     return  b
 
 
+#-----------------------------------------------------------------
+# Mini-batch
+#-----------------------------------------------------------------
+
+#--------------------------
+def compute_z_batch(X, w, b):
+    '''
+        Compute the linear logit values of a mini-batch of data instances with one matrix-vector product. z = X w + b
+        Input:
+            X: the feature matrix of a mini-batch, a float numpy matrix of shape (B by p). Here B is the number of instances in the mini-batch.
+            w: the weights parameter of the logistic model, a float numpy matrix of shape p by 1.
+            b: the bias value of the logistic model, a float scalar.
+        Output:
+            z: the logit values of the mini-batch, a float numpy matrix of shape B by 1.
+    '''
+    z = engine.as_rows(X) @ engine.as_vector(w) + b
+    return engine.as_column(z)
+
+#--------------------------
+def compute_a_batch(z):
+    '''
+        Compute the sigmoid activations of a mini-batch of logits.
+        The exponential is only evaluated on -|z|, so large logits can neither overflow nor raise.
+        Input:
+            z: the logit values of the mini-batch, a float numpy matrix of shape B by 1.
+        Output:
+            a: the activations of the mini-batch, a float numpy matrix of shape B by 1.
+    '''
+    a = np.asmatrix(engine.sigmoid(np.asarray(z)))
+    return a
+
+#--------------------------
+def compute_dL_dz_batch(a, y):
+    '''
+        Compute the gradients of the cross entropy loss w.r.t. the logits of a mini-batch.
+        The sigmoid and cross entropy gradients are combined in closed form: dL_dz = dL_da * da_dz = a - y.
+        Input:
+            a: the activations of the mini-batch, a float numpy matrix of shape B by 1.
+            y: the labels of the mini-batch, a float numpy matrix of shape B by 1. The values can be 0 or 1.
+        Output:
+            dL_dz: the gradients of the loss w.r.t. the logits, a float numpy matrix of shape B by 1.
+    '''
+    dL_dz = a - y
+    return dL_dz
+
+#--------------------------
+def compute_L_batch(a, y):
+    '''
+        Compute the average cross entropy loss over a mini-batch.
+        The activations are clipped to [1e-15, 1-1e-15], so a confident wrong prediction gives a large but finite loss.
+        Input:
+            a: the activations of the mini-batch, a float numpy matrix of shape B by 1.
+            y: the labels of the mini-batch, an array-like of length B. The values can be 0 or 1.
+        Output:
+            L: the average loss over the mini-batch, a float scalar.
+    '''
+    a = np.clip(np.asarray(a, dtype=float).ravel(), 1e-15, 1. - 1e-15)
+    y = np.asarray(y, dtype=float).ravel()
+    L = -float(np.mean(y * np.log(a) + (1. - y) * np.log(1. - a)))
+    return L
+
+#--------------------------
+def compute_gradients_batch(X, dL_dz):
+    '''
+        Compute the gradients of the average loss over a mini-batch w.r.t. the weights w and bias b.
+        Input:
+            X: the feature matrix of a mini-batch, a float numpy matrix of shape (B by p).
+            dL_dz: the gradients of the loss w.r.t. the logits, a float numpy matrix of shape B by 1.
+        Output:
+            dL_dw: the gradient of the average loss w.r.t. the weight vector, a numpy float matrix of shape (p by 1).
+            dL_db: the gradient of the average loss w.r.t. the bias, a float scalar.
+    '''
+    dL_dw, dL_db = compute_gradients_array(engine.as_rows(X), engine.as_vector(dL_dz))
+    return engine.as_column(dL_dw), dL_db
+
+#--------------------------
+def forward_array(X, w, b):
+    '''
+        Compute the sigmoid activations of a mini-batch on the plain arrays of the engine (see engine.py). It is compute_a_batch(compute_z_batch(X, w, b)) without the np.matrix wrappers.
+        Input:
+            X: the feature matrix of a mini-batch, a float numpy array of shape (B by p), or a scipy sparse (CSR) matrix.
+            w: the weight vector, a float numpy array of length p.
+            b: the bias value, a float scalar.
+        Output:
+            a: the activations of the mini-batch, a float numpy array of length B.
+    '''
+    return engine.sigmoid(X @ w + b)
+
+#--------------------------
+def compute_gradients_array(X, dL_dz):
+    '''
+        Compute the gradients of the average loss over a mini-batch w.r.t. the weights w and bias b on the plain arrays of the engine.
+        Input:
+            X: the feature matrix of a mini-batch, a float numpy array of shape (B by p), or a scipy sparse (CSR) matrix.
+            dL_dz: the gradients of the loss w.r.t. the logits, a float numpy array of length B.
+        Output:
+            dL_dw: the gradient of the average loss w.r.t. the weight vector, a float numpy array of length p.
+            dL_db: the gradient of the average loss w.r.t. the bias, a float scalar.
+    '''
+    B = X.shape[0]
+    dL_dw = X.T @ dL_dz / B
+    dL_db = float(np.sum(dL_dz)) / B
+    return dL_dw, dL_db
+
+
+#-----------------------------------------------------------------
+# Sparse input
+#-----------------------------------------------------------------
+
+#--------------------------
+def train_sparse_instance(idx, val, y, w, b, alpha=0.001, stats=None, optimizer=None):
+    '''
+       Update the weights w and bias b on one training instance stored as its nonzero features only.
+       Both the logit and the weight update only touch the nonzero features, so the cost is O(nnz) instead of O(p).
+       It works on the plain arrays of the engine (see engine.py), and the weights are updated in place.
+        Input:
+            idx: the column indices of the nonzero features, an integer numpy array of length nnz.
+                 For a dense instance, idx can be slice(None) and val the whole feature vector.
+            val: the values of the nonzero features, a float numpy array of length nnz.
+            y: the label of the training instance, an integer scalar value. The values can be 0 or 1.
+            w: the weight vector, a float numpy array of length p.
+            b: the bias value, a float scalar.
+            alpha: the step-size parameter of gradient descent, a float scalar.
+            stats: an object collecting the running epoch loss (see stopping.EarlyStopping), or None.
+            optimizer: an optim.Optimizer object, or None for plain gradient descent (see train()).
+                       The optimizer only updates the weights (and their state) at the nonzero features.
+        Output:
+            w: the updated weight vector, a float numpy array of length p.
+            b: the updated bias, a float scalar.
+    '''
+    z = float(w[idx] @ val) + b
+    a = compute_a(z)
+    if stats is not None:
+        stats.record(compute_L(a, y), alpha=alpha)
+    dL_dz = compute_dL_da(a, y) * compute_da_dz(a)
+    if optimizer is not None:
+        optimizer.update_sparse('w', w, idx, dL_dz * val, alpha)
+        b = optimizer.update('b', b, dL_dz * compute_dz_db(), alpha)
+        return w, b
+    w[idx] -= alpha * (dL_dz * val)
+    b = update_b(b, dL_dz * compute_dz_db(), alpha)
+    return w, b
+
+
 #--------------------------
-def train(X, Y, alpha=0.001, n_epoch=100):
+def train_step(x, y, w, b, alpha, workspace):
+    '''
+       One step of per-sample gradient descent, done in place: the same arithmetic as forward(), backward(), compute_dL_dw() and update_w(),
+       but the gradient dL_dw is written into a buffer of the workspace, and w is updated in place. Once the buffers exist, a step allocates no new array.
+        Input:
+            x: the feature vector of a training instance, a float numpy array of shape p by 1, of the same dtype as w.
+            y: the label of the training instance, an integer scalar value. The values can be 0 or 1.
+            w: the weight vector, a float numpy array of shape p by 1, updated in place.
+            b: the bias, a float scalar.
+            alpha: the step-size parameter of gradient descent, a float scalar.
+            workspace: the buffers of the intermediate results, a workspace.Workspace object.
+        Output:
+            b: the updated bias, a float scalar.
+            a: the activation of the instance (before the update), a float scalar.
+    '''
+    # Forward pass
+    z = np.dot(w.T, x, out=workspace.get('z', (1,1), w.dtype))[0,0] + b
+    a = compute_a(z)
+
+    # Back propagation: dL_dz = dL_da * da_dz, then dL_dw = dL_dz * x
+    dL_dz = compute_dL_da(a, y) * compute_da_dz(a)
+    dL_dw = np.multiply(x, dL_dz, out=workspace.get('dL_dw', w.shape, w.dtype))
+
+    # update the parameters, with the same arithmetic as update_w(): w - alpha * dL_dw
+    dL_dw *= alpha
+    w -= dL_dw
+    b = update_b(b, dL_dz * compute_dz_db(), alpha)
+    return b, a
+
+#--------------------------
+def train_pass(X, Y, w, b, alpha=0.001, batch_size=1, stats=None, backend='python', optimizer=None, workspace=None):
+    '''
+       Go through the given training instances once and update the weights w and bias b using gradient descent.
+       This is one epoch of train(), and is also applied to each chunk of data by train_stream().
+       The pass runs on the plain arrays of the engine (see engine.py): the weights are converted on entry and wrapped again as a numpy matrix on return.
+        Input:
+            X: the feature matrix of training instances, a float numpy matrix of shape (n by p), or a scipy sparse matrix.
+               It is converted to a C-contiguous array of the dtype of w (no copy if train() already did it), so every instance is a row view.
+            Y: the labels of training instance, a numpy integer matrix of shape n by 1. The values can be 0 or 1.
+            w: the current weight vector, a numpy float matrix of shape p by 1.
+            b: the current bias, a float scalar.
+            alpha: the step-size parameter of gradient descent, a float scalar, or a schedules.Schedule object, called at each step to get the step-size alpha_t.
+            batch_size: the number of instances used in each gradient descent step, an integer scalar.
+            stats: an object collecting the running epoch loss from the forward passes (see stopping.EarlyStopping), or None.
+            backend: 'python' or 'numba' (see train()).
+            optimizer: an optim.Optimizer object, or None for plain gradient descent (see train()).
+                       The optimizer sees the weights as a vector of length p.
+            workspace: the buffers of the per-sample steps, a workspace.Workspace object, or None to create one for this pass.
+        Output:
+            w: the updated weight vector, a numpy float matrix of shape p by 1.
+            b: the updated bias, a float scalar.
+    '''
+    dtype = config.float_dtype(w)
+    X = engine.as_rows(X, dtype)
+    if backend == 'numba' and batch_size == 1 and stats is None and optimizer is None and not callable(alpha) and not issparse(X) and dtype == np.float64 and jit.available():
+        return train_pass_compiled(X, Y, w, b, alpha)
+
+    # the weights are copied once per pass, so the given w is not modified
+    w = np.array(w, dtype=dtype).reshape(-1)
+
+    if batch_size > 1:
+        Y = np.asarray(Y, dtype=dtype).ravel()
+        for i in range(0, X.shape[0], batch_size):
+            alpha_t = alpha() if callable(alpha) else alpha
+            Xb, Yb = X[i:i+batch_size], Y[i:i+batch_size]
+
+            # Forward pass on the whole block
+            a = forward_array(Xb, w, b)
+            if stats is not None:
+                stats.record(compute_L_batch(a, Yb) * Xb.shape[0], Xb.shape[0], alpha_t)
+
+            # average gradients over the block, from dL_dz = a - y (see compute_dL_dz_batch())
+            a -= Yb
+            dL_dw, dL_db = compute_gradients_array(Xb, a)
+
+            if optimizer is None:
+                w = update_w(w, dL_dw, alpha_t)
+                b = update_b(b, dL_db, alpha_t)
+            else:
+                w = optimizer.update('w', w, dL_dw, alpha_t)
+                b = optimizer.update('b', b, dL_db, alpha_t)
+
+    elif issparse(X):
+        Y = np.asarray(Y).ravel()
+        for i in range(X.shape[0]):
+            alpha_t = alpha() if callable(alpha) else alpha
+            lo, hi = X.indptr[i], X.indptr[i+1]
+            w, b = train_sparse_instance(X.indices[lo:hi], X.data[lo:hi], Y[i], w, b, alpha_t, stats, optimizer)
+
+    elif optimizer is None:
+        # per-sample gradient descent in place (see train_step()), on column views of the rows of X and of w
+        if workspace is None:
+            workspace = Workspace()
+        w_ = w[:, None]
+        for x,y in zip(X, np.asarray(Y).ravel()):
+            alpha_t = alpha() if callable(alpha) else alpha
+            b, a = train_step(x[:, None], y, w_, b, alpha_t, workspace)
+            if stats is not None:
+                stats.record(compute_L(a, y), alpha=alpha_t)
+
+    else:
+        # go through each training instance: a dense instance is a sparse one with all its features
+        for x,y in zip(X, np.asarray(Y).ravel()):
+            alpha_t = alpha() if callable(alpha) else alpha
+            w, b = train_sparse_instance(slice(None), x, y, w, b, alpha_t, stats, optimizer)
+
+    return engine.as_column(w), b
+
+
+#--------------------------
+def train_pass_compiled(X, Y, w, b, alpha=0.001):
+    '''
+       One epoch of per-sample gradient descent on dense data with the compiled kernel jit.logistic_epoch() (requires numba).
+       The updates are the same, in the same order, as in train_pass().
+        Input:
+            X, Y, w, b, alpha: see train_pass().
+        Output:
+            w: the updated weight vector, a numpy float matrix of shape p by 1.
+            b: the updated bias, a float scalar.
+    '''
+    w_ = np.array(w, dtype=float).reshape(-1)
+    b = jit.get_kernel(jit.logistic_epoch)(np.ascontiguousarray(X, dtype=float), np.asarray(Y, dtype=np.int64).ravel(), w_, float(b), alpha)
+    return np.asmatrix(w_).T, b
+
+#--------------------------
+def train(X, Y, alpha=0.001, n_epoch=100, batch_size=1, early_stopping=None, backend='python', optimizer=None, dtype=None):
     '''
        Given a training dataset, train the logistic regression model by iteratively updating the weights w and bias b using the gradients computed over each data instance.
 We repeat n_epoch passes over all the training instances.
         Input:
             X: the feature matrix of training instances, a float numpy matrix of shape (n by p). Here n is the number of data instance in the training set, p is the number of features/dimensions.
+               X can also be a scipy sparse matrix (CSR), in which case each update only touches the nonzero features.
             Y: the labels of training instance, a numpy integer matrix of shape n by 1. The values can be 0 or 1.
-            alpha: the step-size parameter of gradient descent, a float scalar.
+            alpha: the step-size parameter of gradient descent, a float scalar, or a schedules.Schedule object to change the step-size during the training (see schedules.py).
+                   The schedule is restarted before the first epoch. The compiled kernel is not used with a schedule.
             n_epoch: the number of passes to go through the training set, an integer scalar.
+            batch_size: the number of instances used in each gradient descent step, an integer scalar.
+                    With batch_size=1 the parameters are updated after every instance (stochastic gradient descent).
+                    With a larger batch_size, each step uses the average gradient over a block of consecutive rows.
+            early_stopping: a stopping.EarlyStopping object, or None to always run n_epoch passes.
+                    The running loss of each epoch is collected from the forward passes, and the training stops early once it converges.
+                    After training, the object records why and when the training stopped.
+            backend: 'python' for the training loop above, or 'numba' for a compiled epoch kernel (see jit.py).
+                    The compiled kernel is only used for per-sample updates on dense data without early stopping, and only if numba is installed;
+                    otherwise the Python training loop is used. Both give the same parameters up to rounding (within 1e-10).
+            optimizer: an optim.Optimizer object (for example optim.Adam()), or None for plain gradient descent with the step-size alpha.
+                    The state of the optimizer is reset before the first epoch. The compiled kernel is not used with an optimizer.
+            dtype: the floating point type of the weights and of the computations, 'float32' or 'float64', or None for the global dtype (see config.py).
+                    X is converted to it once. The bias stays a float scalar. The compiled kernel is only used in float64.
         Output:
             w: the weight vector trained on the training set, a numpy float matrix of shape p by 1.
             b: the bias, a float scalar.
     '''
+    dtype = config.get_dtype(dtype)
 
     # initialize weights and biases as 0
-    w, b = np.mat(np.zeros(X.shape[1])).T, 0.
+    w, b = np.mat(np.zeros(X.shape[1], dtype=dtype)).T, 0.
+
+    X = engine.as_rows(X, dtype)
 
+    if optimizer is not None:
+        optimizer.reset()
+    if callable(alpha):
+        alpha.reset()
+    if early_stopping is not None:
+        early_stopping.reset((w, b), optimizer)
+    workspace = Workspace()
     for _ in range(n_epoch):
-        for x,y in zip(X,Y):
-            x = x.T # convert to column vector
-  
-            # Forward pass: compute the logit, sigmoid activation and cross_entropy loss function.
-            z = compute_z(x, w, b)
-            a = compute_a(z)
-            L = compute_L(a, y)
-            # Back propagation: compute local gradients
-            dL_da, da_dz, dz_dw, dz_db = backward(x,y, a)
-
-            # compute the global gradients using chain rule
-            dL_dw = compute_dL_dw(dL_da, da_dz, dz_dw)
-            dL_db = compute_dL_db(dL_da, da_dz, dz_db)
-
-            # update the parameters w and b
-            w = update_w(w, dL_dw, alpha)
-            b = update_b(b, dL_db, alpha)
-            #########################################
+        w, b = train_pass(X, Y, w, b, alpha, batch_size, early_stopping, backend, optimizer, workspace)
+        if callable(alpha):
+            alpha.end_epoch()
+        if early_stopping is not None and early_stopping.end((w, b), getattr(alpha, 'last', alpha), compute_loss):
+            w, b = early_stopping.params
+            break
     return w, b
 
 
+#--------------------------
+def partial_fit(X, Y, w=None, b=None, alpha=0.001, n_epoch=1, batch_size=1, optimizer=None, dtype=None):
+    '''
+       Continue training the logistic regression model on a new batch of data, starting from the given parameters instead of zeros.
+       Calling partial_fit() on consecutive batches with n_epoch=1 gives the same result as one epoch of train() on all of them.
+       The given parameters are not modified.
+        Input:
+            X: the feature matrix of the new training instances, a float numpy matrix of shape (n by p), or a scipy sparse (CSR) matrix.
+            Y: the labels of the new training instances, a numpy integer matrix of shape n by 1. The values can be 0 or 1.
+            w: the current weight vector, a numpy float matrix of shape p by 1. If None, the weights start as 0.
+            b: the current bias, a float scalar. If None, the bias starts as 0.
+            alpha: the step-size parameter of gradient descent, a float scalar, or a schedules.Schedule object. The schedule continues from where the previous call left it.
+            n_epoch: the number of passes to go through the new batch, an integer scalar.
+            batch_size: the number of instances used in each gradient descent step, an integer scalar.
+            optimizer: an optim.Optimizer object, or None for plain gradient descent.
+                    Its state is kept between calls, so pass the same object with each batch.
+            dtype: the floating point type of the computations, or None for the global dtype (see train()). The given weights are converted to it.
+        Output:
+            w: the updated weight vector, a numpy float matrix of shape p by 1.
+            b: the updated bias, a float scalar.
+    '''
+    dtype = config.get_dtype(dtype)
+    w = np.mat(np.zeros(X.shape[1], dtype=dtype)).T if w is None else np.asmatrix(w).astype(dtype)
+    b = 0. if b is None else float(b)
+
+    X = engine.as_rows(X, dtype)
+
+    workspace = Workspace()
+    for _ in range(n_epoch):
+        w, b = train_pass(X, Y, w, b, alpha, batch_size, optimizer=optimizer, workspace=workspace)
+        if callable(alpha):
+            alpha.end_epoch()
+    return w, b
 
 #--------------------------
-def predict(Xtest, w, b):
+def train_stream(source, alpha=0.001, n_epoch=100, batch_size=1, chunk_size=10000, early_stopping=None, optimizer=None, dtype=None):
+    '''
+       Train the logistic regression model on a dataset that does not fit in memory.
+       The data is read one chunk at a time (see stream.iter_chunks), so only one chunk of rows is resident in memory.
+       Within each chunk, the updates are the same as in train(); a dataset given as one chunk gives the same result as train().
+        Input:
+            source: the training data. It can be a pair (X, Y) of arrays such as np.memmap, a pair of paths to .npy files
+                    (memory-mapped), a list of (X_chunk, Y_chunk) blocks, or a function returning a new iterable of blocks for each epoch.
+            alpha: the step-size parameter of gradient descent, a float scalar, or a schedules.Schedule object (see train()).
+            n_epoch: the number of passes to go through the training set, an integer scalar.
+            batch_size: the number of instances used in each gradient descent step, an integer scalar.
+            chunk_size: the number of rows read into memory at a time from arrays or .npy files, an integer scalar.
+            early_stopping: a stopping.EarlyStopping object, or None to always run n_epoch passes (see train()).
+            optimizer: an optim.Optimizer object, or None for plain gradient descent (see train()).
+            dtype: the floating point type of the computations, or None for the global dtype (see train()). Each chunk is converted to it.
+        Output:
+            w: the weight vector trained on the training set, a numpy float matrix of shape p by 1.
+            b: the bias, a float scalar.
+    '''
+    dtype = config.get_dtype(dtype)
+    w, b = None, 0.
+    workspace = Workspace()
+    for _ in range(n_epoch):
+        for X, Y in stream.iter_chunks(source, chunk_size):
+            if w is None:
+                # initialize weights as 0 once the number of features is known
+                w = np.mat(np.zeros(X.shape[1], dtype=dtype)).T
+                if optimizer is not None:
+                    optimizer.reset()
+                if callable(alpha):
+                    alpha.reset()
+                if early_stopping is not None:
+                    early_stopping.reset((w, b), optimizer)
+            w, b = train_pass(X, Y, w, b, alpha, batch_size, early_stopping, optimizer=optimizer, workspace=workspace)
+        if callable(alpha):
+            alpha.end_epoch()
+        if early_stopping is not None and early_stopping.end((w, b), getattr(alpha, 'last', alpha), compute_loss):
+            w, b = early_stopping.params
+            break
+    return w, b
+
+
+
+#-----------------------------------------------------------------
+# Newton's method (IRLS)
+#-----------------------------------------------------------------
+
+#--------------------------
+def compute_hessian_batch(X, a, l2=0.):
+    '''
+        Compute the Hessian matrix of the average loss over a set of instances w.r.t. the parameters (w, b).
+        The second derivative of the loss w.r.t. the logit of one instance is a (1-a), so the Hessian is X~^T S X~ / n,
+        where X~ is X with a column of ones appended (for the bias) and S is the diagonal matrix of a (1-a).
+        Input:
+            X: the feature matrix, a float numpy matrix of shape (n by p), or a scipy sparse matrix.
+            a: the activations of the instances, a float numpy matrix of shape n by 1.
+            l2: the weight of the L2 penalty l2/2 ||w||^2 added to the loss (the bias is not penalized), a float scalar.
+        Output:
+            H: the Hessian matrix, a float numpy matrix of shape (p+1 by p+1). The last row and column correspond to the bias.
+    '''
+    n, p = X.shape
+    s = np.asarray(np.multiply(a, 1. - a)).reshape((-1, 1))
+    if issparse(X):
+        Xs = X.multiply(s).tocsr()
+        H_ww = (X.T * Xs).toarray()
+    else:
+        Xs = np.multiply(X, s)
+        H_ww = np.asarray(X.T * Xs)
+    H_wb = np.asarray(Xs.sum(axis=0)).reshape((p, 1))
+    H = np.block([[H_ww + n * l2 * np.eye(p), H_wb],
+                  [H_wb.T, np.array([[s.sum()]])]])
+    return np.asmatrix(H / n)
+
+#--------------------------
+def train_newton(X, Y, tol=1e-6, max_iter=50, l2=1e-6, max_halving=30):
+    '''
+       Given a training dataset, train the logistic regression model with Newton's method (iteratively reweighted least squares).
+       Each iteration computes the gradient and the Hessian of the average loss over the whole training set and
+       moves (w, b) to the minimum of the local quadratic approximation. No step-size has to be tuned, and for a small
+       number of features it typically converges in fewer than 10 iterations.
+       Far from the solution (for example on linearly separable data) the full Newton step can overshoot and increase the loss,
+       so the step is halved until the (penalized) loss does not increase: the loss never goes up from one iteration to the next.
+       The cost of one iteration is O(n p^2 + p^3), so this is meant for p up to a few thousand.
+        Input:
+            X: the feature matrix of training instances, a float numpy matrix of shape (n by p), or a scipy sparse matrix.
+            Y: the labels of training instance, a numpy integer matrix of shape n by 1. The values can be 0 or 1.
+            tol: the tolerance of convergence, a float scalar. We stop when no parameter changes by more than tol in one iteration,
+                 or when no step along the Newton direction lowers the loss any more.
+            max_iter: the maximum number of Newton iterations, an integer scalar.
+            l2: the weight of a small L2 penalty l2/2 ||w||^2 on the weights, a float scalar.
+                It keeps the Hessian invertible when the classes are linearly separable (where the unpenalized weights grow without limit).
+            max_halving: the maximum number of times the step is halved in one iteration, an integer scalar.
+        Output:
+            w: the weight vector trained on the training set, a numpy float matrix of shape p by 1.
+            b: the bias, a float scalar.
+    '''
+    n, p = X.shape
+    if issparse(X):
+        X = X.tocsr()
+    Y = np.asmatrix(np.asarray(Y, dtype=float).reshape(-1, 1))
+
+    # initialize weights and biases as 0
+    w, b = np.asmatrix(np.zeros((p, 1))), 0.
+    a = compute_a_batch(compute_z_batch(X, w, b))
+    L = compute_L_batch(a, Y)
+
+    for _ in range(max_iter):
+        # gradient of the (penalized) average loss
+        dL_dw, dL_db = compute_gradients_batch(X, compute_dL_dz_batch(a, Y))
+        g = np.vstack([dL_dw + l2 * w, [[dL_db]]])
+
+        # Newton step: solve H d = g
+        H = compute_hessian_batch(X, a, l2)
+        try:
+            d = np.linalg.solve(H, g)
+        except np.linalg.LinAlgError:
+            d = np.linalg.lstsq(H, g, rcond=None)[0]
+
+        # step halving: take the largest step 1, 1/2, 1/4, ... that does not increase the penalized loss
+        t = 1.
+        for _ in range(max_halving):
+            w_new, b_new = w - t * d[:p], b - t * float(d[p, 0])
+            a_new = compute_a_batch(compute_z_batch(X, w_new, b_new))
+            L_new = compute_L_batch(a_new, Y) + l2 / 2. * float(np.sum(np.square(w_new)))
+            if L_new <= L:
+                break
+            t /= 2.
+        else:
+            # no step lowers the loss: (w, b) is the minimum up to rounding
+            break
+        w, b, a, L = w_new, b_new, a_new, L_new
+        if t * np.max(np.abs(d)) < tol:
+            break
+    return w, b
+
+
+#-----------------------------------------------------------------
+# Parallel training
+#-----------------------------------------------------------------
+
+#--------------------------
+def hogwild_pass(theta, X, Y, lo, hi, alpha=0.001):
+    '''
+       Go through the rows lo, ..., hi-1 once with stochastic gradient descent, updating the shared parameters in place without any locking.
+        Input:
+            theta: the shared parameters, a float numpy array of length p+1. The first p elements are the weights w, the last one is the bias b.
+            X: the feature matrix of training instances, a float numpy array of shape (n by p), or a scipy sparse (CSR) matrix.
+            Y: the labels of training instance, a numpy array of length n. The values can be 0 or 1.
+            lo, hi: the rows of this worker's shard, integer scalars.
+            alpha: the step-size parameter of gradient descent, a float scalar.
+    '''
+    p = theta.shape[0] - 1
+    # a view of the shared block: the updates of w go straight to the shared memory
+    w = theta[:p]
+    sparse = issparse(X)
+    for i in range(lo, hi):
+        if sparse:
+            idx, val = X.indices[X.indptr[i]:X.indptr[i+1]], X.data[X.indptr[i]:X.indptr[i+1]]
+        else:
+            idx, val = slice(None), X[i]
+        w, theta[p] = train_sparse_instance(idx, val, Y[i], w, theta[p], alpha)
+
+#--------------------------
+def hogwild_worker(name, X, Y, lo, hi, alpha=0.001, n_epoch=100):
+    '''
+       The worker process of train_hogwild(): attach to the shared parameters and run n_epoch passes over its own shard of the data.
+        Input:
+            name: the name of the shared memory block holding the parameters, a string.
+            X, Y: the training data (see hogwild_pass()).
+            lo, hi: the rows of this worker's shard, integer scalars.
+            alpha: the step-size parameter of gradient descent, a float scalar.
+            n_epoch: the number of passes to go through the shard, an integer scalar.
+    '''
+    X = X.tocsr() if issparse(X) else np.asarray(X, dtype=float)
+    Y = np.asarray(Y).ravel()
+    shm, theta = parallel.attach_shared(name, (X.shape[1] + 1,))
+    for _ in range(n_epoch):
+        hogwild_pass(theta, X, Y, lo, hi, alpha)
+    del theta
+    shm.close()
+
+#--------------------------
+def train_hogwild(X, Y, alpha=0.001, n_epoch=100, n_jobs=None):
+    '''
+       Train the logistic regression model with lock-free parallel stochastic gradient descent (Hogwild).
+       The weights and bias live in shared memory. Each worker process goes through its own contiguous shard of the rows
+       and updates the shared parameters after every instance without any synchronization.
+       On sparse data, updates from different workers rarely touch the same weights, so the result is close to train().
+        Input:
+            X: the feature matrix of training instances, a float numpy matrix of shape (n by p), or a scipy sparse (CSR) matrix.
+            Y: the labels of training instance, a numpy integer matrix of shape n by 1. The values can be 0 or 1.
+            alpha: the step-size parameter of gradient descent, a float scalar.
+            n_epoch: the number of passes each worker makes over its shard, an integer scalar.
+            n_jobs: the number of worker processes, an integer scalar. None means one worker per CPU core.
+        Output:
+            w: the weight vector trained on the training set, a numpy float matrix of shape p by 1.
+            b: the bias, a float scalar.
+    '''
+    n, p = X.shape
+    shards = parallel.split_rows(n, parallel.get_n_jobs(n_jobs))
+    shm, theta = parallel.create_shared((p + 1,))
+    try:
+        parallel.run_workers(hogwild_worker, [(shm.name, X, Y, lo, hi, alpha, n_epoch) for lo, hi in shards])
+        w, b = np.asmatrix(theta[:p].copy()).T, float(theta[p])
+    finally:
+        del theta
+        shm.close()
+        shm.unlink()
+    return w, b
+
+#--------------------------
+def compare_hogwild(X, Y, alpha=0.001, n_epoch=100, n_jobs=None):
+    '''
+       Train the model with both train() and train_hogwild() and report the speedup and the final training loss of each.
+        Input:
+            X, Y, alpha, n_epoch: see train().
+            n_jobs: the number of worker processes of train_hogwild(), an integer scalar.
+        Output:
+            report: a dictionary with the keys 'serial_time', 'parallel_time', 'speedup', 'serial_loss' and 'parallel_loss' (see parallel.benchmark()).
+    '''
+    return parallel.benchmark(lambda: train(X, Y, alpha, n_epoch),
+                              lambda: train_hogwild(X, Y, alpha, n_epoch, n_jobs),
+                              lambda w, b: compute_loss(X, Y, w, b))
+
+
+#--------------------------
+def predict(Xtest, w, b, chunk_size=1024, n_jobs=1):
     '''
        Predict the labels of the instances in a test dataset using logistic regression.
+       The test instances are scored in blocks of chunk_size rows (on n_jobs threads, see parallel.map_chunks()), and each block writes straight into the preallocated outputs.
+       The scores are computed in the dtype of w (see config.py) on the plain arrays of the engine (see engine.py): each block of Xtest is converted to a C-contiguous array of that dtype.
         Input:
             Xtest: the feature matrix of testing instances, a float numpy matrix of shape (n_test by p). Here n_test is the number of data instance in the test set, p is the number of features/dimensions.
+                   Xtest can also be a scipy sparse matrix (CSR).
             w: the weight vector of the logistic model, a float numpy matrix of shape p by 1.
             b: the bias value of the logistic model, a float scalar.
+            chunk_size: the number of test instances scored together, an integer scalar.
+            n_jobs: the number of threads, an integer scalar. None means one thread per CPU core.
         Output:
             Y: the predicted labels of test data, an integer numpy array of length ntest.
                     If the predicted label is positive, the value is 1. If the label is negative, the value is 0.
@@ -393,22 +946,31 @@ def predict(Xtest, w, b):
             Note: If the activation is 0.5, we consider the prediction as positive (instead of negative).
     '''
     n = Xtest.shape[0]
-    Y = np.zeros(n) # initialize as all zeros
-    P = np.mat(np.zeros((n,1)))
-    for i, x in enumerate(Xtest):
-        x = x.T # convert to column vector
-        #########################################
-        
-        z = compute_z(x, w, b)
-        a = compute_a(z)
+    dtype = config.float_dtype(w)
+    w = engine.as_vector(w)
+    P = np.empty((n, 1), dtype=dtype)
+    Y = np.empty(n)
+    def score(lo, hi):
+        a = forward_array(engine.as_rows(Xtest[lo:hi], dtype), w, b)
+        P[lo:hi, 0] = a
+        Y[lo:hi] = a >= 0.5
+    parallel.map_chunks(score, n, chunk_size, n_jobs)
+    return Y, np.asmatrix(P)
 
-        P[i, 0] = a
-        if (a >= 0.5):
-            Y[i] = 1
-        else:
-            Y[i] = 0
-        #########################################
-    return Y, P
+
+#--------------------------
+def compute_loss(X, Y, w, b):
+    '''
+       Compute the average cross entropy loss of the logistic regression model on a dataset, for example a held-out split.
+        Input:
+            X: the feature matrix, a float numpy matrix of shape (n by p), or a scipy sparse (CSR) matrix.
+            Y: the labels, an array-like of length n. The values can be 0 or 1.
+            w, b: the parameters of the logistic regression model.
+        Output:
+            L: the average loss, a float scalar.
+    '''
+    Yp, P = predict(X, w, b)
+    return compute_L_batch(P, Y)
 
 
 #-----------------------------------------------------------------
@@ -0,0 +1,487 @@
+import numpy as np
+import softmax as sr # sr = softmax regression
+import neuralnet as nn
+import stream
+import config
+import engine
+#-------------------------------------------------------------------------
+'''
+    Fully connected networks of any depth.
+    A network is a stack of layers: fully connected layers (Dense) and activation layers (Sigmoid, ReLU, LeakyReLU, Tanh).
+    The last layer produces the logits z, which are turned into class probabilities by softmax. The loss is the multi-class cross entropy.
+    The math of each layer is the mini-batch math of neuralnet.py, and the two-layer model of neuralnet.py is
+    Sequential([Dense(p, h), Sigmoid(), Dense(h, c)]) (see two_layer()).
+
+    Notations:
+            X: the feature matrix of a mini-batch, a float numpy matrix of shape (B by p), or a scipy sparse matrix.
+            y: the labels of a mini-batch, an integer numpy array of length B. The values can be 0,1,2, ..., or (c-1).
+            For each layer, the input of its forward pass is a float numpy array of shape (B by n_in), and the output is of shape (B by n_out).
+            Backward passes go the other way: given the gradient of the loss w.r.t. the output of a layer, the layer computes the gradients
+            of its parameters and returns the gradient w.r.t. its input.
+    The layers work on the plain arrays of the engine (see engine.py): the weights are arrays of shape (n_out by n_in), the biases arrays of length n_out.
+    Sequential converts at its public boundary: forward(), predict(), params() and grads() take and return numpy matrices, as the models of neuralnet.py.
+'''
+
+#-----------------------------------------------------------------
+# Layers
+#-----------------------------------------------------------------
+
+#--------------------------
+class Dense:
+    '''
+        A fully connected layer: z = x W^T + b^T for each row x of the input.
+        Attributes:
+            W: the weights, a float numpy array of shape (n_out by n_in).
+            b: the biases, a float numpy array of length n_out.
+            dL_dW, dL_db: the gradients of the average loss w.r.t. W and b, set by the last backward pass, of the same shapes.
+    '''
+    #--------------------------
+    def __init__(self, n_in, n_out, W=None, b=None, init=None, seed=None, activation='sigmoid', dtype=None):
+        '''
+            Input:
+                n_in: the number of inputs, an integer scalar.
+                n_out: the number of outputs, an integer scalar.
+                W: the initial weights, a float numpy matrix or array of shape (n_out by n_in). If None, the weights are initialized with init.
+                b: the initial biases, a float numpy vector of shape n_out by 1 (or an array of length n_out). If None, the biases start as 0.
+                init: the initialization scheme of the weights, a string: 'zeros', 'uniform', 'xavier' or 'he' (see neuralnet.init_weights()),
+                      or None for the default one of the activation (see neuralnet.get_init()).
+                seed: the random seed, an integer scalar, or a np.random.RandomState object shared by the layers of a network.
+                activation: the activation function of the layer that follows, a string, used to choose the default init.
+                dtype: the floating point type of the parameters (see config.py), or None: the dtype of W if it is given (see config.float_dtype()),
+                       the global dtype otherwise.
+        '''
+        if dtype is None:
+            dtype = config.get_dtype() if W is None else config.float_dtype(W)
+        self.W = np.asarray(nn.init_weights(n_out, n_in, init, seed, dtype, activation) if W is None else W, dtype=dtype)
+        self.b = engine.as_vector(np.zeros(n_out) if b is None else b, dtype)
+
+    #--------------------------
+    def forward(self, X):
+        '''
+            Compute the logits of a mini-batch, and keep the input for the backward pass.
+            Input:
+                X: the input of the layer, a float numpy array of shape (B by n_in), or a scipy sparse (CSR) matrix.
+            Output:
+                z: the logits, a float numpy array of shape (B by n_out).
+        '''
+        self.X = X
+        return engine.linear(X, self.W, self.b)
+
+    #--------------------------
+    def backward(self, dL_dz, need_input_gradient=True):
+        '''
+            Compute the gradients of the weights and biases, and the gradient w.r.t. the input.
+            Input:
+                dL_dz: the gradients of the loss w.r.t. the logits, summed so that dL_dW is the average over the mini-batch,
+                       a float numpy array of shape (B by n_out).
+                need_input_gradient: whether to compute the gradient w.r.t. the input (not needed for the first layer), a boolean.
+            Output:
+                dL_dX: the gradients of the loss w.r.t. the input, a float numpy array of shape (B by n_in), or None.
+        '''
+        self.dL_dW = (self.X.T @ dL_dz).T
+        self.dL_db = np.sum(dL_dz, axis=0)
+        if need_input_gradient:
+            return dL_dz @ self.W
+        return None
+
+    #--------------------------
+    def params(self):
+        '''
+            Output:
+                params: the parameters of the layer, a list [W, b].
+        '''
+        return [self.W, self.b]
+
+    #--------------------------
+    def grads(self):
+        '''
+            Output:
+                grads: the gradients of the parameters from the last backward pass, a list [dL_dW, dL_db].
+        '''
+        return [self.dL_dW, self.dL_db]
+
+    #--------------------------
+    def set_params(self, params):
+        '''
+            Input:
+                params: the new parameters of the layer, a list [W, b]. Numpy matrices are converted to the arrays of the layer without a copy.
+        '''
+        W, b = params
+        self.W, self.b = np.asarray(W), engine.as_vector(b)
+
+
+#--------------------------
+class Activation:
+    '''
+        An activation layer, applied element-wise (see neuralnet.compute_a1() for the supported functions).
+        The local gradient is computed from the activations only, so the layer keeps the output of its forward pass.
+        Attributes:
+            activation: the name of the activation function, a string: 'sigmoid', 'relu', 'leaky_relu' or 'tanh'.
+    '''
+    activation = 'sigmoid'
+
+    #--------------------------
+    def forward(self, z):
+        '''
+            Input:
+                z: the logits, a float numpy array of shape (B by n).
+            Output:
+                a: the activations, a float numpy array of shape (B by n).
+        '''
+        self.a = engine.sigmoid(z) if self.activation == 'sigmoid' else nn.compute_a1(z, self.activation)
+        return self.a
+
+    #--------------------------
+    def backward(self, dL_da, need_input_gradient=True):
+        '''
+            Input:
+                dL_da: the gradients of the loss w.r.t. the activations, a float numpy array of shape (B by n).
+            Output:
+                dL_dz: the gradients of the loss w.r.t. the logits, a float numpy array of shape (B by n).
+        '''
+        return dL_da * nn.compute_da1_dz1(self.a, self.activation)
+
+    #--------------------------
+    def params(self):
+        ''' An activation layer has no parameters.'''
+        return []
+
+    #--------------------------
+    def grads(self):
+        return []
+
+    #--------------------------
+    def set_params(self, params):
+        pass
+
+
+#--------------------------
+class Sigmoid(Activation):
+    '''
+        The sigmoid activation layer, applied element-wise: a = 1 / (1 + exp(-z)).
+    '''
+    activation = 'sigmoid'
+
+#--------------------------
+class ReLU(Activation):
+    '''
+        The rectified linear activation layer, applied element-wise: a = max(z, 0).
+    '''
+    activation = 'relu'
+
+#--------------------------
+class LeakyReLU(Activation):
+    '''
+        The leaky rectified linear activation layer, applied element-wise: a = z if z > 0, else neuralnet.LEAKY_SLOPE * z.
+    '''
+    activation = 'leaky_relu'
+
+#--------------------------
+class Tanh(Activation):
+    '''
+        The hyperbolic tangent activation layer, applied element-wise: a = tanh(z).
+    '''
+    activation = 'tanh'
+
+# the activation layers by name, as in neuralnet.train(..., activation=...)
+ACTIVATIONS = {'sigmoid': Sigmoid, 'relu': ReLU, 'leaky_relu': LeakyReLU, 'tanh': Tanh}
+
+
+#-----------------------------------------------------------------
+# Networks
+#-----------------------------------------------------------------
+
+#--------------------------
+class Sequential:
+    '''
+        A stack of layers followed by softmax and the multi-class cross entropy loss.
+        The computations run in the dtype of the parameters of the first layer (see Dense and config.py): the features are converted to it.
+        Attributes:
+            layers: the layers, a list. The first layer takes the features, the last layer produces the logits of the c classes.
+    '''
+    #--------------------------
+    def __init__(self, layers):
+        '''
+            Input:
+                layers: the layers, a list of Dense and activation layer objects.
+        '''
+        self.layers = list(layers)
+
+    #--------------------------
+    def forward(self, X):
+        '''
+            Forward pass on a mini-batch through all the layers.
+            Input:
+                X: the feature matrix of a mini-batch, a float numpy matrix of shape (B by p), or a scipy sparse matrix.
+            Output:
+                a: the softmax activations (the class probabilities), a float numpy matrix of shape (B by c).
+        '''
+        return np.asmatrix(self.forward_array(engine.as_rows(X)))
+
+    #--------------------------
+    def forward_array(self, X):
+        '''
+            Forward pass on a mini-batch on the plain arrays of the engine (see engine.py). It is forward() without the np.matrix wrappers.
+            Input:
+                X: the feature matrix of a mini-batch, a float numpy array of shape (B by p), or a scipy sparse (CSR) matrix.
+            Output:
+                a: the softmax activations, a float numpy array of shape (B by c).
+        '''
+        for layer in self.layers:
+            X = layer.forward(X)
+        return engine.softmax(X)
+
+    #--------------------------
+    def backward(self, y, a):
+        '''
+            Back propagation on a mini-batch through all the layers, starting from the fused softmax and cross entropy gradient a - onehot(y).
+            The gradients of the average loss over the mini-batch are stored in the layers (see grads()).
+            Input:
+                y: the labels of the mini-batch, an integer numpy array of length B.
+                a: the softmax activations from forward(), a float numpy matrix of shape (B by c).
+        '''
+        self.backward_array(np.asarray(y, dtype=int).ravel(), np.array(a))
+
+    #--------------------------
+    def backward_array(self, y, a):
+        '''
+            Back propagation on a mini-batch on the plain arrays of the engine. It is backward() without the np.matrix wrappers.
+            The activations are overwritten by the gradients w.r.t. the logits, so that no array of the size of a is allocated.
+            Input:
+                y: the labels of the mini-batch, an integer numpy array of length B.
+                a: the softmax activations from forward_array(), a float numpy array of shape (B by c). It is overwritten.
+        '''
+        a[np.arange(a.shape[0]), y] -= 1.
+        a /= a.shape[0]
+        dL_dz = a
+        for i in range(len(self.layers) - 1, -1, -1):
+            dL_dz = self.layers[i].backward(dL_dz, need_input_gradient=i > 0)
+
+    #--------------------------
+    def params(self):
+        '''
+            Output:
+                params: the parameters of all the layers in order, a list of numpy matrices (the biases are column vectors), as views of the arrays of the layers.
+        '''
+        return [as_matrix(param) for layer in self.layers for param in layer.params()]
+
+    #--------------------------
+    def grads(self):
+        '''
+            Output:
+                grads: the gradients of the parameters from the last backward pass, in the same order as params(), a list of numpy matrices.
+        '''
+        return [as_matrix(grad) for layer in self.layers for grad in layer.grads()]
+
+    #--------------------------
+    def get_dtype(self):
+        '''
+            Output:
+                dtype: the floating point type of the computations, the dtype of the first parameter (see config.float_dtype()).
+        '''
+        return config.float_dtype(self.layers[0].params()[0])
+
+    #--------------------------
+    def set_params(self, params):
+        '''
+            Input:
+                params: the new parameters of all the layers, in the same order as params(), a list of numpy matrices (or of the arrays of the layers).
+        '''
+        i = 0
+        for layer in self.layers:
+            k = len(layer.params())
+            layer.set_params(list(params[i:i+k]))
+            i += k
+
+    #--------------------------
+    def train_pass(self, X, Y, alpha=0.01, batch_size=1, stats=None, optimizer=None):
+        '''
+            Go through the given training instances once and update the parameters of all the layers using gradient descent.
+            The pass runs on the plain arrays of the engine (see engine.py): X is converted once to a C-contiguous array of the dtype of the network.
+            Input:
+                X: the feature matrix of training instances, a float numpy matrix of shape (n by p), or a scipy sparse (CSR) matrix.
+                Y: the labels of training instance, an integer numpy array of length n. The values can be 0,1,2, ..., or (c-1).
+                alpha: the step-size parameter of gradient descent, a float scalar, or a schedules.Schedule object called at each step.
+                batch_size: the number of instances used in each gradient descent step, an integer scalar.
+                stats: an object collecting the running epoch loss from the forward passes (see stopping.EarlyStopping), or None.
+                optimizer: an optim.Optimizer object, or None for plain gradient descent. The state of the i-th parameter is stored under the key i.
+        '''
+        n = X.shape[0]
+        X = engine.as_rows(X, self.get_dtype())
+        Y = np.asarray(Y, dtype=int).ravel()
+        for i in range(0, n, batch_size):
+            alpha_t = alpha() if callable(alpha) else alpha
+            Xb, Yb = X[i:i+batch_size], Y[i:i+batch_size]
+            a = self.forward_array(Xb)
+            if stats is not None:
+                stats.record(sr.compute_L_batch(a, Yb) * Xb.shape[0], Xb.shape[0], alpha_t)
+            self.backward_array(Yb, a)
+            params = [param for layer in self.layers for param in layer.params()]
+            grads = [grad for layer in self.layers for grad in layer.grads()]
+            if optimizer is None:
+                self.set_params([engine.gradient_step(param, grad, alpha_t) for param, grad in zip(params, grads)])
+            else:
+                self.set_params([optimizer.update(k, param, grad, alpha_t) for k, (param, grad) in enumerate(zip(params, grads))])
+
+    #--------------------------
+    def train(self, X, Y, alpha=0.01, n_epoch=100, batch_size=1, early_stopping=None, optimizer=None):
+        '''
+            Train the network by gradient descent, starting from the current parameters of the layers.
+            Input:
+                X: the feature matrix of training instances, a float numpy matrix of shape (n by p), or a scipy sparse (CSR) matrix.
+                Y: the labels of training instance, an integer numpy array of length n. The values can be 0,1,2, ..., or (c-1).
+                alpha: the step-size parameter of gradient descent, a float scalar, or a schedules.Schedule object (see neuralnet.train()).
+                        As in neuralnet.train(), the schedule starts over at each call.
+                n_epoch: the number of passes to go through the training set, an integer scalar.
+                batch_size: the number of instances used in each gradient descent step, an integer scalar.
+                early_stopping: a stopping.EarlyStopping object, or None to always run n_epoch passes (see neuralnet.train()).
+                optimizer: an optim.Optimizer object, or None for plain gradient descent (see neuralnet.train()).
+                        Its state is cleared at each call; use partial_fit() to continue with the same state.
+            Output:
+                self: the trained network.
+        '''
+        if engine.issparse(X):
+            X = X.tocsr()
+        if optimizer is not None:
+            optimizer.reset()
+        if callable(alpha):
+            alpha.reset()
+        if early_stopping is not None:
+            early_stopping.reset(tuple(self.params()), optimizer)
+        for _ in range(n_epoch):
+            self.train_pass(X, Y, alpha, batch_size, early_stopping, optimizer)
+            if callable(alpha):
+                alpha.end_epoch()
+            if early_stopping is not None and early_stopping.end(tuple(self.params()), getattr(alpha, 'last', alpha), self.compute_loss):
+                self.set_params(list(early_stopping.params))
+                break
+        return self
+
+    #--------------------------
+    def partial_fit(self, X, Y, alpha=0.01, n_epoch=1, batch_size=1, optimizer=None):
+        '''
+            Continue training the network on a new batch of data (see neuralnet.partial_fit()).
+            Unlike train(), the optimizer and the schedule are not reset, so that consecutive calls continue with the same state.
+            Input:
+                X: the feature matrix of the new training instances, a float numpy matrix of shape (n by p), or a scipy sparse (CSR) matrix.
+                Y: the labels of the new training instances, an integer numpy array of length n.
+                alpha: the step-size parameter of gradient descent, a float scalar, or a schedules.Schedule object. The schedule continues from where the previous call left it.
+                n_epoch: the number of passes to go through the new batch, an integer scalar.
+                batch_size: the number of instances used in each gradient descent step, an integer scalar.
+                optimizer: an optim.Optimizer object, or None for plain gradient descent. Pass the same object with each batch.
+            Output:
+                self: the updated network.
+        '''
+        if engine.issparse(X):
+            X = X.tocsr()
+        for _ in range(n_epoch):
+            self.train_pass(X, Y, alpha, batch_size, optimizer=optimizer)
+            if callable(alpha):
+                alpha.end_epoch()
+        return self
+
+    #--------------------------
+    def train_stream(self, source, alpha=0.01, n_epoch=100, batch_size=1, chunk_size=10000, early_stopping=None, optimizer=None):
+        '''
+            Train the network on a dataset that does not fit in memory, one chunk at a time (see stream.iter_chunks).
+            Input:
+                source: the training data (see stream.py).
+                alpha, n_epoch, batch_size, early_stopping, optimizer: see train().
+                chunk_size: the number of rows read into memory at a time from arrays or .npy files, an integer scalar.
+            Output:
+                self: the trained network.
+        '''
+        if optimizer is not None:
+            optimizer.reset()
+        if callable(alpha):
+            alpha.reset()
+        if early_stopping is not None:
+            early_stopping.reset(tuple(self.params()), optimizer)
+        for _ in range(n_epoch):
+            for X, Y in stream.iter_chunks(source, chunk_size):
+                self.train_pass(X, Y, alpha, batch_size, early_stopping, optimizer)
+            if callable(alpha):
+                alpha.end_epoch()
+            if early_stopping is not None and early_stopping.end(tuple(self.params()), getattr(alpha, 'last', alpha), self.compute_loss):
+                self.set_params(list(early_stopping.params))
+                break
+        return self
+
+    #--------------------------
+    def predict(self, Xtest):
+        '''
+            Predict the labels of the instances in a test dataset.
+            Input:
+                Xtest: the feature matrix of testing instances, a float numpy matrix of shape (n_test by p), or a scipy sparse (CSR) matrix.
+                       It is converted to the dtype of the network (see get_dtype()).
+            Output:
+                Y: the predicted labels of test data, a numpy array of length n_test. Each element can be 0, 1, ..., or (c-1).
+                P: the predicted probabilities of test data to be in different classes, a float numpy matrix of shape (n_test by c), in the dtype of the network.
+        '''
+        P = self.forward_array(engine.as_rows(Xtest, self.get_dtype()))
+        Y = np.argmax(P, axis=1).astype(float)
+        return Y, np.asmatrix(P)
+
+    #--------------------------
+    def compute_loss(self, X, Y, *params):
+        '''
+            Compute the average multi-class cross entropy of the network on a dataset, for example a held-out split.
+            Input:
+                X: the feature matrix, a float numpy matrix of shape (n by p), or a scipy sparse (CSR) matrix.
+                Y: the labels, an integer array-like of length n.
+                params: the parameters to evaluate, in the same order as params(). If not given, the current parameters are used.
+            Output:
+                L: the average loss, a float scalar.
+        '''
+        if params:
+            current = self.params()
+            self.set_params(list(params))
+        Yp, P = self.predict(X)
+        if params:
+            self.set_params(current)
+        return sr.compute_L_batch(P, Y)
+
+
+#--------------------------
+def as_matrix(param):
+    '''
+        Convert a parameter (or gradient) of a layer to the numpy matrix of the public functions, as a view.
+        Input:
+            param: a float numpy array, of shape (n_out by n_in) for weights, or of length n_out for biases.
+        Output:
+            param: a numpy matrix of the same shape for weights, or a column vector of shape n_out by 1 for biases.
+    '''
+    return engine.as_column(param) if param.ndim == 1 else np.asmatrix(param)
+
+#--------------------------
+def two_layer(p, h, c, activation='sigmoid', init=None, seed=None, dtype=None):
+    '''
+        Build the two-layer network of neuralnet.py: a fully connected layer with h sigmoid units, then a fully connected layer with c outputs.
+        Input:
+            p: the number of features, an integer scalar.
+            h: the number of neurons in the first layer, an integer scalar.
+            c: the number of classes, an integer scalar.
+            activation: the activation function of the first layer, a string (see neuralnet.compute_a1()).
+            init, seed: the initialization scheme and random seed of the weights, with the same default as neuralnet.train() (see neuralnet.get_init()).
+                    The initial parameters are the same as neuralnet.initialize().
+            dtype: the floating point type of the parameters, or None for the global dtype (see config.py).
+        Output:
+            model: the network, a Sequential object with the biases starting as 0.
+    '''
+    init = nn.get_init(init, activation)
+    rng = None if init == 'zeros' else np.random.RandomState(seed)
+    return Sequential([Dense(p, h, init=init, seed=rng, dtype=dtype), ACTIVATIONS[activation](), Dense(h, c, init=init, seed=rng, dtype=dtype)])
+
+#--------------------------
+def from_neuralnet(W1, b1, W2, b2, activation='sigmoid'):
+    '''
+        Build a Sequential network from the parameters of the two-layer model of neuralnet.py.
+        Input:
+            W1, b1, W2, b2: the parameters of the two layers (see neuralnet.train()).
+            activation: the activation function of the first layer the model was trained with, a string (see neuralnet.compute_a1()).
+        Output:
+            model: the network, a Sequential object. model.params() returns [W1, b1, W2, b2].
+    '''
+    h, p = W1.shape
+    c = W2.shape[0]
+    return Sequential([Dense(p, h, W1, b1), ACTIVATIONS[activation](), Dense(h, c, W2, b2)])
@@ -1,13 +1,21 @@
 import math
+import functools
 import numpy as np
 
 import softmax as sr # sr = softmax regression
+import stream
+import parallel
+import jit
+import config
+import engine
+from workspace import Workspace
 #-------------------------------------------------------------------------
 '''
     two-layer fully connected neural network.
     implement a classification method using fully-connected neural network (FC) with two layers.
     The main goal of this problem is to extend the softmax regression method in the previous problem to having multiple layers (instead of one layer in softmax regression).
     In the first layer, the sigmoid activation function will be used to convert the linear logits into a non-linear activation.
+    Other hidden activations can be selected with the activation parameter: 'relu', 'leaky_relu' or 'tanh' (see compute_a1()).
     In the second layer, we will use softmax as the activation function (the same as softmax regression in the previous problem).
     We will use multi-class cross entropy as the loss function and stochastic gradient descent to train the model parameters.
     You could test the correctness of your code by typing `nosetests test3.py` in the terminal.
@@ -73,8 +81,15 @@ import softmax as sr # sr = softmax regression
             ---------- training ----------------------
             alpha: the step-size parameter of gradient ascent, a float scalar.
             n_epoch: the number of passes to go through the training set, an integer scalar.
+            activation: the activation function of the 1st layer, a string: 'sigmoid' (default), 'relu', 'leaky_relu' or 'tanh'.
 '''
 
+# the slope of the leaky ReLU activation for negative logits
+LEAKY_SLOPE = 0.01
+
+# the activation functions of the 1st layer (see compute_a1())
+ACTIVATIONS = ('sigmoid', 'relu', 'leaky_relu', 'tanh')
+
 #-----------------------------------------------------------------
 # Forward Pass
 #-----------------------------------------------------------------
@@ -93,34 +108,57 @@ def compute_z1(x,W1,b1):
     '''
     #########################################
   
-    z1 = W1 * x + b1
+    z1 = np.dot(W1, x) + b1
     #########################################
     return z1
 
 
 #-----------------------------------------------------------------
-def compute_a1(z1):
+def compute_a1(z1, activation='sigmoid', out=None):
     '''
         Compute the sigmoid activations a1 from the linear logits z1 in the first layer.
         Input:
             z1: linear logits in the first layer, a float numpy vector of shape h by 1.
                 Here h is the number of outputs in the 1st fully connected layer.
+            activation: the activation function, a string:
+                    'sigmoid': a1 = 1 / (1 + exp(-z1)).
+                    'relu': a1 = max(z1, 0). It needs no exponential, and its gradient does not vanish for large logits.
+                    'leaky_relu': a1 = z1 for positive logits, LEAKY_SLOPE * z1 otherwise, so that a unit never stops learning.
+                    'tanh': a1 = tanh(z1), a zero-centered sigmoid with values between -1 and 1.
+            out: a float numpy array of shape h by 1 to write the activations into (see train_step()), or None to allocate a new one.
         Output:
             a1: the non-linear activations in the first layer, a float numpy vector of shape h by 1.
                The i-th element represents the sigmoid of the i-th logit z1[i].
         Note: this function is different from the sigmoid function in problem 1.
               In problem 1, the input z to the sigmoid function is a scalar, but here the input z is a vector.
     '''
+    if activation == 'relu':
+        return np.maximum(z1, 0., out=out)
+    if activation == 'leaky_relu':
+        a1 = np.multiply(z1, LEAKY_SLOPE, out=out)
+        return np.maximum(z1, a1, out=a1)
+    if activation == 'tanh':
+        return np.tanh(z1, out=out)
+    if activation != 'sigmoid':
+        raise ValueError('unknown activation %r' % (activation,))
     #########################################
 
     try:
-        a1 = 1/(1 + np.exp(-1*z1))
+        # 1/(1 + exp(-z1)), computed in one buffer
+        a1 = np.multiply(-1., z1, out=out)
+        np.exp(a1, out=a1)
+        a1 += 1
+        a1 = np.divide(1, a1, out=a1)
     # except OverflowError:
     except FloatingPointError:
-        if np.max(z1) > 100:
-            a1 = np.ones(z1.shape)
-        if np.min(z1) < -100:
-            a1 = np.zeros(z1.shape)
+        # exp(-z1) overflowed (above 709 in float64, but already above 88 in float32):
+        # use the stable form of compute_a1_batch(), which only evaluates exp(-|z1|)
+        with np.errstate(under='ignore'):
+            e = np.exp(-np.abs(z1))
+            a1 = np.where(z1 >= 0, 1. / (1. + e), e / (1. + e))
+        if out is not None:
+            out[...] = a1
+            a1 = out
     #########################################
     return a1
 
@@ -138,7 +176,7 @@ def compute_z2(a1,W2,b2):
     #########################################
 
 
-    z2 = W2 * a1 + b2
+    z2 = np.dot(W2, a1) + b2
 
     #########################################
     return z2
@@ -146,35 +184,27 @@ def compute_z2(a1,W2,b2):
 
 
 #-----------------------------------------------------------------
-def compute_a2(z2):
+def compute_a2(z2, out=None):
     '''
         Compute the softmax activations a2 from the linear logits z2 in the second layer.
         Input:
             z2: linear logits in the second layer, a float numpy vector of shape c by 1.
                 Here c is the number of classes.
+            out: a float numpy array of shape c by 1 to write the activations into (see train_step()), or None to allocate a new one.
         Output:
             a2: the non-linear activations in the 2nd layer, a float numpy vector of shape c by 1.
     '''
     #########################################
 
-    try:
-        e_z = np.exp(z2)
-        e_sum = np.sum(e_z)
-        a2 = e_z / e_sum
-    except FloatingPointError:
-        if (z2 == z2[0]).all():
-            a2 = np.ones((z2.shape))
-            a2 = a2 / z2.shape[0]
-        else:
-            a2 = np.zeros((z2.shape))
-            a2[np.argmax(z2)] = 1.
+    # the same softmax as in softmax regression, including its float32 guard
+    a2 = sr.compute_a(z2, out)
 
     #########################################
     return a2
 
 
 #-----------------------------------------------------------------
-def forward(x, W1, b1, W2, b2):
+def forward(x, W1, b1, W2, b2, activation='sigmoid'):
     '''
        Forward pass: given an instance in the training data, compute the logits z, activations a in each layer.
         Input:
@@ -184,6 +214,7 @@ def forward(x, W1, b1, W2, b2):
             b1: the biases in the 1st layer.
             W2: the weight matrix in the 2nd layer.
             b2: the biases in the 2nd layer.
+            activation: the activation function of the 1st layer, a string (see compute_a1()).
         Output:
             z1: the linear logits in the 1st layer.
             a1: the non-linear activations in the 1st layer.
@@ -193,7 +224,7 @@ def forward(x, W1, b1, W2, b2):
     #########################################
     # first layer
     z1 = compute_z1(x,W1,b1)
-    a1 = compute_a1(z1)
+    a1 = compute_a1(z1, activation)
 
     # second layer
     z2 = compute_z2(a1, W2, b2)
@@ -230,16 +261,20 @@ def compute_dL_da2(a2, y):
     return dL_da2
 
 #-----------------------------------------------------------------
-def compute_da2_dz2(a2):
+def compute_da2_dz2(a2, lazy=False):
     '''
         Compute local gradient of the softmax activations a2 w.r.t. the logits z2 in the 2nd layer.
         Input:
             a2: the activation values of softmax function, a numpy float vector of shape c by 1. Here c is the number of classes.
+            lazy: if True, return a sr.SoftmaxJacobian operator instead of the dense matrix, a boolean.
         Output:
             da2_dz2: the local gradient of the activations a2 w.r.t. the logits z2, a float numpy matrix of shape (c by c).
                    The (i,j)-th element represents the partial gradient ( d_a2[i]  / d_z2[j] )
     '''
     #########################################
+    if lazy:
+        return sr.SoftmaxJacobian(a2)
+
     mat1 = -1 * a2* a2.T
     mat2 = a2 * (1- a2).T
 
@@ -260,32 +295,33 @@ def compute_da2_dz2(a2):
 def compute_dz2_dW2(a1,c):
     '''
         Compute local gradient of the logits function z2 w.r.t. the weights W2.
+        Every row of dz2_dW2 is a1^T, so it is returned as a read-only broadcasting view of a1 (see sr.compute_dz_dW()).
         Input:
             a1: the activations of sigmoid function, a numpy float vector of shape h by 1.
+            c: the number of classes, an integer.
         Output:
             dz2_dW2: the partial gradient of logits z2 w.r.t. the weight matrix W2, a numpy float matrix of shape (c by h).
                    The (i,j)-th element represents the partial gradient of the i-th logit (z2[i]) w.r.t. the weight W2[i,j]:   d_z2[i] / d_W2[i,j]
     '''
     #########################################
-    result_list = a1.T.tolist() * c
-    dz2_dW2 = np.mat(result_list)
+    dz2_dW2 = sr.compute_dz_dW(a1, c)
     #########################################
     return dz2_dW2
 
 
 #-----------------------------------------------------------------
-def compute_dz2_db2(c):
+def compute_dz2_db2(c, workspace=None):
     '''
         Compute local gradient of the logits function z2 w.r.t. the biases b2.
         Input:
             c: the number of classes, an integer.
+            workspace: a workspace.Workspace object to take the vector of ones from, or None (see sr.compute_dz_db()).
         Output:
             dz2_db2: the partial gradient of the logits z2 w.r.t. the biases b2, a float vector of shape c by 1.
                    Each element represents the partial gradient of the i-th logit z2[i] w.r.t. the i-th bias b2[i]:  d_z2[i] / d_b2[i]
     '''
     #########################################
-    dz2_db2 = np.mat(np.array([1] * c))
-    dz2_db2 = dz2_db2.T
+    dz2_db2 = sr.compute_dz_db(c, workspace)
     #########################################
     return dz2_db2
 
@@ -309,18 +345,37 @@ def compute_dz2_da1(W2):
 
 
 #-----------------------------------------------------------------
-def compute_da1_dz1(a1):
+def compute_da1_dz1(a1, activation='sigmoid', out=None):
     '''
         Compute local gradient of the sigmoid activations a1 w.r.t. the logits z1 in the first layer.
+        For every supported activation, the local gradient only depends on the activations, so the logits need not be kept:
+            sigmoid: a1 (1 - a1);   tanh: 1 - a1^2;   relu: 1 if a1 > 0, else 0;   leaky_relu: 1 if a1 > 0, else LEAKY_SLOPE.
         Input:
             a1: the activations of sigmoid function, a numpy float vector of shape h by 1.
             a1: the non-linear activations in the 1st layer.
+                It can also be a mini-batch of activations, a float numpy matrix of shape (B by h).
+            activation: the activation function of the 1st layer, a string (see compute_a1()).
+            out: a float numpy array of the shape of a1 to write the local gradient into (see train_step()), or None to allocate a new one.
         Output:
             da1_dz1: the local gradient of the activations a1 w.r.t. the logits z1, a float numpy vector of shape h by 1.
                    The i-th element of da1_dz1 represents the partial gradient ( d_a1[i]  / d_z1[i] )
     '''
+    if activation == 'relu':
+        # the step function: 1 if a1 > 0, else 0
+        return np.heaviside(a1, 0., out=out)
+    if activation == 'leaky_relu':
+        da1_dz1 = np.heaviside(a1, 0., out=out)
+        da1_dz1 *= 1. - LEAKY_SLOPE
+        da1_dz1 += LEAKY_SLOPE
+        return da1_dz1
+    if activation == 'tanh':
+        da1_dz1 = np.multiply(a1, a1, out=out)
+        return np.subtract(1., da1_dz1, out=da1_dz1)
+    if activation != 'sigmoid':
+        raise ValueError('unknown activation %r' % (activation,))
     #########################################
-    da1_dz1 = np.multiply(a1 , (1-a1))
+    da1_dz1 = np.subtract(1, a1, out=out)
+    da1_dz1 = np.multiply(a1 , da1_dz1, out=da1_dz1)
 
 
     #########################################
@@ -331,6 +386,7 @@ def compute_da1_dz1(a1):
 def compute_dz1_dW1(x,h):
     '''
         Compute local gradient of the logits function z1 w.r.t. the weights W1 in the 1st layer.
+        Every row of dz1_dW1 is x^T, so it is returned as a read-only broadcasting view of x (see sr.compute_dz_dW()).
         Input:
             x: the feature vector of a data instance, a float numpy vector of shape p by 1. Here p is the number of features/dimensions.
             h: the number of output activations in the first layer, an integer.
@@ -339,32 +395,31 @@ def compute_dz1_dW1(x,h):
                    The (i,j)-th element represents the partial gradient of the i-th logit (z1[i]) w.r.t. the weight W1[i,j]:   d_z1[i] / d_W1[i,j]
     '''
     #########################################
-    result_list = x.T.tolist() * h
-    dz1_dW1 = np.mat(result_list)
+    dz1_dW1 = sr.compute_dz_dW(x, h)
     #########################################
     return dz1_dW1
 
 
 #-----------------------------------------------------------------
-def compute_dz1_db1(h):
+def compute_dz1_db1(h, workspace=None):
     '''
         Compute local gradient of the logits function z2 w.r.t. the biases b2.
         Input:
             h: the number of output activations in the first layer, an integer.
+            workspace: a workspace.Workspace object to take the vector of ones from, or None (see sr.compute_dz_db()).
         Output:
             dz1_db1: the partial gradient of the logits z1 w.r.t. the biases b1, a float vector of shape h by 1.
                    Each element represents the partial gradient of the i-th logit z1[i] w.r.t. the i-th bias b1[i]:  d_z1[i] / d_b1[i]
     '''
     #########################################
 
-    dz1_db1 = np.mat(np.array([1] * h))
-    dz1_db1 = dz1_db1.T
+    dz1_db1 = sr.compute_dz_db(h, workspace)
 
     #########################################
     return dz1_db1
 
 #-----------------------------------------------------------------
-def backward(x,y,a1,a2,W2):
+def backward(x,y,a1,a2,W2,lazy=False,activation='sigmoid',workspace=None):
     '''
        Back Propagation: given an instance in the training data, compute the local gradients of the logits z, activations a, weights W and biases b in the two layers.
         Input:
@@ -372,6 +427,10 @@ def backward(x,y,a1,a2,W2):
             y: the label of a training instance, an integer scalar value. The values can be 0,1,2, ..., or (c-1).
             a1: the activations of a training instance in the 1st layer, a float numpy vector of shape h by 1.
             a2: the activations of a training instance in the 2nd layer, a float numpy vector of shape c by 1.
+            lazy: if True, da2_dz2 is returned as a sr.SoftmaxJacobian operator, a boolean.
+            activation: the activation function of the 1st layer, a string (see compute_a1()).
+            workspace: a workspace.Workspace object keeping the constant local gradients, or None (see sr.compute_dz_db()).
+                   Pass the same workspace for every instance, so that the constants are built only once.
         Output:
             dL_da2: the local gradients of the loss function w.r.t. the activations in the 2nd layer, a float numpy vector of shape c by 1.
             da2_dz2: the local gradient of the activation a2 w.r.t. the logits z2, a float numpy matrix of shape (c by c).
@@ -389,18 +448,18 @@ def backward(x,y,a1,a2,W2):
     # 2nd layer
 
     dL_da2 = compute_dL_da2(a2, y)
-    da2_dz2 = compute_da2_dz2(a2)
+    da2_dz2 = compute_da2_dz2(a2, lazy)
     dz2_dW2 = compute_dz2_dW2(a1,c)
-    dz2_db2  = compute_dz2_db2(c)
+    dz2_db2  = compute_dz2_db2(c, workspace)
 
 
 
     # 1st layer
 
     dz2_da1 = compute_dz2_da1(W2)
-    da1_dz1 = compute_da1_dz1(a1)
+    da1_dz1 = compute_da1_dz1(a1, activation)
     dz1_dW1 = compute_dz1_dW1(x,h)
-    dz1_db1 = compute_dz1_db1(h)
+    dz1_db1 = compute_dz1_db1(h, workspace)
 
 
 
@@ -424,7 +483,7 @@ def compute_dL_da1(dL_dz2,dz2_da1):
     '''
     #########################################
 
-    dL_da1 = dL_dz2.T * dz2_da1
+    dL_da1 = np.dot(dL_dz2.T, dz2_da1)
     dL_da1 = dL_da1.T
     #########################################
     return dL_da1
@@ -464,6 +523,30 @@ def compute_gradients(dL_da2, da2_dz2, dz2_dW2, dz2_db2, dz2_da1, da1_dz1, dz1_d
 
     # the 2nd layer
     dL_dz2 = sr.compute_dL_dz(dL_da2, da2_dz2)
+
+    #########################################
+
+    return compute_gradients_from_dz2(dL_dz2, dz2_dW2, dz2_db2, dz2_da1, da1_dz1, dz1_dW1, dz1_db1)
+
+
+#-----------------------------------------------------------------
+def compute_gradients_from_dz2(dL_dz2, dz2_dW2, dz2_db2, dz2_da1, da1_dz1, dz1_dW1, dz1_db1):
+    '''
+       Given the gradient of the loss w.r.t. the logits z2 and the remaining local gradients, compute the gradient of the loss function L w.r.t. the model parameters.
+       This is the part of compute_gradients() after the softmax layer, so it can start from the fused softmax + cross entropy gradient (sr.compute_dL_dz_fused).
+        Input:
+            dL_dz2: the gradient of the loss function L w.r.t. the logits z2, a float numpy vector of shape c by 1.
+            the other inputs: see details in the above functions.
+        Output:
+            dL_dW2: the gradient of the loss function L w.r.t. the weight matrix W2
+            dL_db2: the gradient of the loss function L w.r.t. the biases b2
+            dL_dW1: the gradient of the loss function L w.r.t. the weight matrix W1
+            dL_db1: the gradient of the loss function L w.r.t. the biases b1
+    '''
+
+    #########################################
+
+    # the 2nd layer
     dL_dW2 = sr.compute_dL_dW(dL_dz2, dz2_dW2)
 
     dL_db2 = sr.compute_dL_db(dL_dz2, dz2_db2)
@@ -480,17 +563,524 @@ def compute_gradients(dL_da2, da2_dz2, dz2_dW2, dz2_db2, dz2_da1, da1_dz1, dz1_d
     return dL_dW2, dL_db2, dL_dW1, dL_db1
 
 
+
+#-----------------------------------------------------------------
+def compute_gradients_fused(x, y, a1, a2, W2, activation='sigmoid'):
+    '''
+       Fused back propagation: compute the global gradients of all the parameters in one pass from the cached activations of the forward pass.
+       The local gradients dz2_dW2 and dz1_dW1 are never built: every row of them is a copy of a1^T (or x^T),
+       so the weight gradients are the outer products dL_dz2 a1^T and dL_dz1 x^T. The results are the same as compute_gradients().
+       The inputs can be numpy matrices or plain 2-dimensional numpy arrays; the outputs have the same type.
+        Input:
+            x: the feature vector of a training instance, a float numpy vector of shape p by 1.
+            y: the label of a training instance, an integer scalar value. The values can be 0,1,2, ..., or (c-1).
+            a1: the activations of the instance in the 1st layer, a float numpy vector of shape h by 1.
+            a2: the activations of the instance in the 2nd layer, a float numpy vector of shape c by 1.
+            W2: the weights in the 2nd layer, a float numpy matrix of shape (c by h).
+            activation: the activation function of the 1st layer, a string (see compute_a1()).
+        Output:
+            dL_dW2: the gradient of the loss function w.r.t. the weights W2, a float numpy matrix of shape (c by h).
+            dL_db2: the gradient of the loss function w.r.t. the biases b2, a float numpy vector of shape c by 1.
+            dL_dW1: the gradient of the loss function w.r.t. the weights W1, a float numpy matrix of shape (h by p).
+            dL_db1: the gradient of the loss function w.r.t. the biases b1, a float numpy vector of shape h by 1.
+    '''
+    # the 2nd layer: the softmax and cross entropy gradients are fused into a2 - onehot(y)
+    dL_dz2 = a2.copy()
+    dL_dz2[y] -= 1.
+    dL_dW2 = np.dot(dL_dz2, a1.T)
+    dL_db2 = dL_dz2
+
+    # the 1st layer
+    dL_da1 = compute_dL_da1(dL_dz2, W2)
+    dL_dz1 = compute_dL_dz1(dL_da1, compute_da1_dz1(a1, activation))
+    dL_dW1 = np.dot(dL_dz1, x.T)
+    dL_db1 = dL_dz1
+    return dL_dW2, dL_db2, dL_dW1, dL_db1
+
+#-----------------------------------------------------------------
+# Mini-batch
+#-----------------------------------------------------------------
+
+#-----------------------------------------------------------------
+def compute_z1_batch(X, W1, b1):
+    '''
+        Compute the linear logits of the first layer for a mini-batch of data instances. z1 = X W1^T + b1^T
+        Input:
+            X: the feature matrix of a mini-batch, a float numpy matrix of shape (B by p). Here B is the number of instances in the mini-batch.
+            W1: the weight matrix of the first layer, a float numpy matrix of shape (h by p).
+            b1: the bias values of the first layer, a float numpy vector of shape h by 1.
+        Output:
+            z1: the linear logits of the mini-batch, a float numpy matrix of shape (B by h).
+    '''
+    z1 = sr.compute_z_batch(X, W1, b1)
+    return z1
+
+
+#-----------------------------------------------------------------
+def compute_a1_batch(z1, activation='sigmoid'):
+    '''
+        Compute the sigmoid activations of the first layer for a mini-batch of logits.
+        The exponential is only evaluated on -|z1|, so large logits can neither overflow nor raise.
+        Input:
+            z1: the linear logits of the mini-batch, a float numpy matrix of shape (B by h).
+            activation: the activation function of the 1st layer, a string (see compute_a1()).
+        Output:
+            a1: the sigmoid activations of the mini-batch, a float numpy matrix of shape (B by h).
+    '''
+    if activation != 'sigmoid':
+        # the other activations are element-wise without an exponential, so the per-instance function applies as is
+        return compute_a1(z1, activation)
+    a1 = np.asmatrix(engine.sigmoid(np.asarray(z1)))
+    return a1
+
+
+#-----------------------------------------------------------------
+def compute_z2_batch(a1, W2, b2):
+    '''
+        Compute the linear logits of the second layer for a mini-batch. z2 = a1 W2^T + b2^T
+        Input:
+            a1: the sigmoid activations of the mini-batch, a float numpy matrix of shape (B by h).
+            W2: the weight matrix of the 2nd layer, a float numpy matrix of shape (c by h).
+            b2: the bias values of the 2nd layer, a float numpy vector of shape c by 1.
+        Output:
+            z2: the linear logits of the mini-batch, a float numpy matrix of shape (B by c).
+    '''
+    z2 = sr.compute_z_batch(a1, W2, b2)
+    return z2
+
+
+#-----------------------------------------------------------------
+def compute_a2_batch(z2):
+    '''
+        Compute the softmax activations of the second layer for each row of a mini-batch of logits.
+        Input:
+            z2: the linear logits of the mini-batch, a float numpy matrix of shape (B by c).
+        Output:
+            a2: the softmax activations of the mini-batch, a float numpy matrix of shape (B by c).
+    '''
+    a2 = sr.compute_a_batch(z2)
+    return a2
+
+
+#-----------------------------------------------------------------
+def forward_batch(X, W1, b1, W2, b2, activation='sigmoid'):
+    '''
+       Forward pass on a mini-batch: compute the logits and activations of both layers for a block of instances.
+        Input:
+            X: the feature matrix of a mini-batch, a float numpy matrix of shape (B by p).
+            W1, b1, W2, b2: the parameters of the two layers.
+            activation: the activation function of the 1st layer, a string (see compute_a1()).
+        Output:
+            z1: the linear logits in the 1st layer, a float numpy matrix of shape (B by h).
+            a1: the non-linear activations in the 1st layer, a float numpy matrix of shape (B by h).
+            z2: the linear logits in the 2nd layer, a float numpy matrix of shape (B by c).
+            a2: the non-linear activations in the 2nd layer, a float numpy matrix of shape (B by c).
+    '''
+    z1 = compute_z1_batch(X, W1, b1)
+    a1 = compute_a1_batch(z1, activation)
+    z2 = compute_z2_batch(a1, W2, b2)
+    a2 = compute_a2_batch(z2)
+    return z1, a1, z2, a2
+
+#-----------------------------------------------------------------
+def compute_gradients_batch(X, y, a1, a2, W2, activation='sigmoid'):
+    '''
+       Back propagation on a mini-batch: compute the gradients of the average loss over the mini-batch w.r.t. the parameters of both layers.
+       The gradients of all the instances are accumulated by matrix products (GEMMs) instead of a loop over the instances.
+        Input:
+            X: the feature matrix of a mini-batch, a float numpy matrix of shape (B by p), or a scipy sparse matrix.
+            y: the labels of the mini-batch, an integer numpy array of length B. The values can be 0,1,2, ..., or (c-1).
+            a1: the activations in the 1st layer, a float numpy matrix of shape (B by h).
+            a2: the activations in the 2nd layer, a float numpy matrix of shape (B by c).
+            W2: the weights in the 2nd layer, a float numpy matrix of shape (c by h).
+            activation: the activation function of the 1st layer, a string (see compute_a1()).
+        Output:
+            dL_dW2: the gradient of the average loss w.r.t. the weights W2, a float numpy matrix of shape (c by h).
+            dL_db2: the gradient of the average loss w.r.t. the biases b2, a float numpy vector of shape c by 1.
+            dL_dW1: the gradient of the average loss w.r.t. the weights W1, a float numpy matrix of shape (h by p).
+            dL_db1: the gradient of the average loss w.r.t. the biases b1, a float numpy vector of shape h by 1.
+    '''
+    # a2 is copied, as compute_gradients_array() overwrites it
+    dL_dW2, dL_db2, dL_dW1, dL_db1 = compute_gradients_array(engine.as_rows(X), np.asarray(y, dtype=int).ravel(), np.asarray(a1), np.array(a2), np.asarray(W2), activation)
+    return np.asmatrix(dL_dW2), engine.as_column(dL_db2), np.asmatrix(dL_dW1), engine.as_column(dL_db1)
+
+
+#-----------------------------------------------------------------
+def forward_array(X, W1, b1, W2, b2, activation='sigmoid'):
+    '''
+       Forward pass on a mini-batch on the plain arrays of the engine (see engine.py). It is forward_batch() without the np.matrix wrappers and the logits.
+        Input:
+            X: the feature matrix of a mini-batch, a float numpy array of shape (B by p), or a scipy sparse (CSR) matrix.
+            W1, b1, W2, b2: the parameters of the two layers, float numpy arrays. The biases are arrays of length h and c.
+            activation: the activation function of the 1st layer, a string (see compute_a1()).
+        Output:
+            a1: the non-linear activations in the 1st layer, a float numpy array of shape (B by h).
+            a2: the non-linear activations in the 2nd layer, a float numpy array of shape (B by c).
+    '''
+    z1 = engine.linear(X, W1, b1)
+    a1 = engine.sigmoid(z1) if activation == 'sigmoid' else compute_a1(z1, activation)
+    a2 = sr.forward_array(a1, W2, b2)
+    return a1, a2
+
+
+#-----------------------------------------------------------------
+def compute_gradients_array(X, y, a1, a2, W2, activation='sigmoid'):
+    '''
+       Back propagation on a mini-batch on the plain arrays of the engine: the same gradients as compute_gradients_batch().
+       The activations a2 are overwritten by the gradients w.r.t. the logits z2.
+        Input:
+            X: the feature matrix of a mini-batch, a float numpy array of shape (B by p), or a scipy sparse (CSR) matrix.
+            y: the labels of the mini-batch, an integer numpy array of length B. The values can be 0,1,2, ..., or (c-1).
+            a1: the activations in the 1st layer, a float numpy array of shape (B by h).
+            a2: the activations in the 2nd layer, a float numpy array of shape (B by c). It is overwritten by dL_dz2.
+            W2: the weights in the 2nd layer, a float numpy array of shape (c by h).
+            activation: the activation function of the 1st layer, a string (see compute_a1()).
+        Output:
+            dL_dW2, dL_db2, dL_dW1, dL_db1: the gradients of the average loss w.r.t. the parameters, float numpy arrays. The bias gradients are arrays of length c and h.
+    '''
+    # the 2nd layer: the softmax and cross entropy gradients are fused into a2 - onehot(y)
+    dL_dW2, dL_db2 = sr.compute_gradients_array(a1, y, a2)
+    dL_dz2 = a2
+
+    # the 1st layer
+    dL_dz1 = dL_dz2 @ W2
+    dL_dz1 *= compute_da1_dz1(a1, activation)
+    dL_dW1, dL_db1 = engine.linear_gradients(X, dL_dz1)
+    return dL_dW2, dL_db2, dL_dW1, dL_db1
+
+
+#-----------------------------------------------------------------
+# Initialization
+#-----------------------------------------------------------------
+
+# the default initialization scheme of the weights for each activation of the 1st layer (see get_init())
+DEFAULT_INIT = {'sigmoid': 'zeros', 'relu': 'he', 'leaky_relu': 'he', 'tanh': 'xavier'}
+
+#--------------------------
+def get_init(init=None, activation='sigmoid'):
+    '''
+       Get the initialization scheme of the weights of a layer: the given one, or the default one of the activation that follows the layer.
+       relu, leaky_relu and tanh map 0 to 0, so if all the weights start as 0 their hidden layer never learns:
+       they default to the random scheme suited to them ('he' for relu and leaky_relu, 'xavier' for tanh), and 'zeros' is rejected.
+       sigmoid defaults to 'zeros'.
+        Input:
+            init: the initialization scheme, a string (see init_weights()), or None for the default one of the activation.
+            activation: the activation function that follows the layer, a string (see compute_a1()).
+        Output:
+            init: the initialization scheme, a string.
+        Raise:
+            ValueError if the activation is unknown, or if init is 'zeros' with an activation other than sigmoid.
+    '''
+    if activation not in ACTIVATIONS:
+        raise ValueError('unknown activation %r' % (activation,))
+    if init == 'zeros' and activation != 'sigmoid':
+        raise ValueError("the %s hidden layer cannot learn from zero weights: use init='he' or 'xavier' (or None for the default)" % (activation,))
+    return DEFAULT_INIT[activation] if init is None else init
+
+#--------------------------
+def init_weights(n_out, n_in, init=None, seed=None, dtype=None, activation='sigmoid'):
+    '''
+       Create the initial weight matrix of a fully connected layer.
+       If all the weights start as 0, all the neurons of the layer get the same gradients and stay the same, so the layer
+       has the capacity of a single neuron. Random initial weights break this symmetry. The random schemes scale the weights with
+       the number of inputs (fan_in) and outputs (fan_out) of the layer, so that the logits neither vanish nor saturate.
+        Input:
+            n_out: the number of outputs of the layer, an integer scalar.
+            n_in: the number of inputs of the layer, an integer scalar.
+            init: the initialization scheme, a string, or None for the default one of the activation (see get_init()):
+                    'zeros': all the weights are 0.
+                    'uniform': uniform between -1/sqrt(fan_in) and 1/sqrt(fan_in).
+                    'xavier': uniform between -sqrt(6/(fan_in+fan_out)) and sqrt(6/(fan_in+fan_out)) (Glorot), suited to sigmoid and tanh.
+                    'he': normal with mean 0 and variance 2/fan_in, suited to relu and leaky_relu.
+            seed: the random seed, an integer scalar, or a np.random.RandomState object to draw from. The same seed gives the same weights in every run and every process.
+            dtype: the floating point type of the weights, or None for the global dtype (see config.py).
+                   The random weights are drawn in float64, so float32 weights are the rounded float64 ones.
+            activation: the activation function that follows the layer, a string, used to choose the default init (see get_init()).
+        Output:
+            W: the weight matrix, a float numpy matrix of shape (n_out by n_in).
+    '''
+    dtype = config.get_dtype(dtype)
+    init = get_init(init, activation)
+    if init == 'zeros':
+        return np.asmatrix(np.zeros((n_out, n_in), dtype=dtype))
+    rng = seed if isinstance(seed, np.random.RandomState) else np.random.RandomState(seed)
+    if init == 'uniform':
+        limit = 1. / math.sqrt(n_in)
+        W = rng.uniform(-limit, limit, (n_out, n_in))
+    elif init == 'xavier':
+        limit = math.sqrt(6. / (n_in + n_out))
+        W = rng.uniform(-limit, limit, (n_out, n_in))
+    elif init == 'he':
+        W = rng.normal(0., math.sqrt(2. / n_in), (n_out, n_in))
+    else:
+        raise ValueError('unknown initialization %r' % (init,))
+    return np.asmatrix(W, dtype=dtype)
+
+#--------------------------
+def initialize(p, h, c, init=None, seed=None, dtype=None, activation='sigmoid'):
+    '''
+       Create the initial parameters of the two layers. The biases start as 0, the weights follow the initialization scheme (see init_weights()).
+        Input:
+            p: the number of features, an integer scalar.
+            h: the number of neurons in the first layer, an integer scalar.
+            c: the number of classes, an integer scalar.
+            init: the initialization scheme of the weights of both layers, a string (see init_weights()), or None for the default one of the activation (see get_init()).
+            seed: the random seed, an integer scalar or None. W1 is drawn first, then W2 from the same random stream.
+            dtype: the floating point type of the parameters, or None for the global dtype (see config.py).
+            activation: the activation function of the 1st layer, a string (see compute_a1()).
+        Output:
+            W1, b1, W2, b2: the initial parameters of the two layers.
+    '''
+    dtype = config.get_dtype(dtype)
+    init = get_init(init, activation)
+    rng = None if init == 'zeros' else np.random.RandomState(seed)
+    W1 = init_weights(h, p, init, rng, dtype)
+    W2 = init_weights(c, h, init, rng, dtype)
+    return W1, np.asmatrix(np.zeros((h,1), dtype=dtype)), W2, np.asmatrix(np.zeros((c,1), dtype=dtype))
+
+
+#-----------------------------------------------------------------
+# Sparse input
+#-----------------------------------------------------------------
+
+#-----------------------------------------------------------------
+def train_sparse_instance(idx, val, y, W1, b1, W2, b2, alpha=0.01, stats=None, activation='sigmoid', optimizer=None):
+    '''
+       Update the parameters of both layers on one training instance stored as its nonzero features only.
+       The first layer only reads and writes the columns of W1 at the nonzero features, so its cost is O(h nnz) instead of O(h p).
+       It works on the plain arrays of the engine (see engine.py), and the weights W1 are updated in place.
+        Input:
+            idx: the column indices of the nonzero features, an integer numpy array of length nnz.
+                 For a dense instance, idx can be slice(None) and val the whole feature vector.
+            val: the values of the nonzero features, a float numpy array of length nnz.
+            y: the label of the training instance, an integer scalar value. The values can be 0,1,2, ..., or (c-1).
+            W1, b1, W2, b2: the current parameters of the two layers, float numpy arrays. The biases are arrays of length h and c.
+            alpha: the step-size parameter of gradient descent, a float scalar.
+            stats: an object collecting the running epoch loss (see stopping.EarlyStopping), or None.
+            activation: the activation function of the 1st layer, a string (see compute_a1()).
+            optimizer: an optim.Optimizer object, or None for plain gradient descent (see train()).
+                       The optimizer only updates the columns of W1 (and their state) at the nonzero features.
+        Output:
+            W1, b1, W2, b2: the updated parameters of the two layers.
+    '''
+    # Forward pass
+    a1 = compute_a1(W1[:, idx] @ val + b1, activation)
+    a2 = sr.compute_a(W2 @ a1 + b2)
+    if stats is not None:
+        stats.record(sr.compute_L(engine.as_column(a2), y), alpha=alpha)
+
+    # Back Propagation, starting from the fused gradient a2 - onehot(y), computed in the buffer of a2
+    dL_dz2 = a2
+    dL_dz2[y] -= 1.
+    dL_dW2 = np.outer(dL_dz2, a1)
+    dL_dz1 = W2.T @ dL_dz2
+    dL_dz1 *= compute_da1_dz1(a1, activation)
+
+    # update the paramters using gradient descent
+    if optimizer is not None:
+        optimizer.update_sparse('W1', W1, (slice(None), idx), np.outer(dL_dz1, val), alpha)
+        b1 = optimizer.update('b1', b1, dL_dz1, alpha)
+        W2 = optimizer.update('W2', W2, dL_dW2, alpha)
+        b2 = optimizer.update('b2', b2, dL_dz2, alpha)
+        return W1, b1, W2, b2
+    W1[:, idx] -= alpha * np.outer(dL_dz1, val)
+    b1 = sr.update_b(b1, dL_dz1, alpha)
+    W2 = sr.update_W(W2, dL_dW2, alpha)
+    b2 = sr.update_b(b2, dL_dz2, alpha)
+    return W1, b1, W2, b2
+
+
+#--------------------------
+def update(optimizer, params, grads, alpha):
+    '''
+       Update the parameters of both layers with an optimizer.
+        Input:
+            optimizer: an optim.Optimizer object.
+            params: the current parameters (W1, b1, W2, b2).
+            grads: the gradients (dL_dW1, dL_db1, dL_dW2, dL_db2).
+            alpha: the step-size parameter, a float scalar.
+        Output:
+            W1, b1, W2, b2: the updated parameters of the two layers.
+    '''
+    return tuple(optimizer.update(key, param, grad, alpha) for key, param, grad in zip(('W1', 'b1', 'W2', 'b2'), params, grads))
+
+
 #--------------------------
 # train
-def train(X, Y,h=3,  alpha=0.01, n_epoch=100):
+def train_step(x, y, W1, b1, W2, b2, alpha, workspace, activation='sigmoid'):
+    '''
+       One step of per-sample gradient descent, done in place: the same arithmetic as forward(), compute_gradients_fused() and softmax.update_W(),
+       but the logits, activations and gradients are written into the buffers of the workspace, and the parameters are updated in place (see softmax.update_inplace()).
+       Once the buffers exist, a step allocates no new array.
+        Input:
+            x: the feature vector of a training instance, a float numpy array of shape p by 1, of the same dtype as W1.
+            y: the label of the training instance, an integer scalar value. The values can be 0,1,2, ..., or (c-1).
+            W1, b1, W2, b2: the parameters of the two layers, float numpy arrays, updated in place.
+            alpha: the step-size parameter of gradient descent, a float scalar.
+            workspace: the buffers of the intermediate results, a workspace.Workspace object.
+            activation: the activation function of the 1st layer, a string (see compute_a1()).
+        Output:
+            a2: the activations of the instance in the 2nd layer (before the update), a float numpy array of shape c by 1.
+                It is a buffer of the workspace, overwritten by the next step.
+    '''
+    h, p = W1.shape
+    c = W2.shape[0]
+    dtype = W1.dtype
+    # Forward pass
+    z1 = np.dot(W1, x, out=workspace.get('z1', (h,1), dtype))
+    z1 += b1
+    a1 = compute_a1(z1, activation, out=workspace.get('a1', (h,1), dtype))
+    z2 = np.dot(W2, a1, out=workspace.get('z2', (c,1), dtype))
+    z2 += b2
+    a2 = compute_a2(z2, out=workspace.get('a2', (c,1), dtype))
+
+    # Back Propagation, starting from the fused gradient a2 - onehot(y) (see compute_gradients_fused())
+    dL_dz2 = workspace.get('dL_dz2', (c,1), dtype)
+    dL_dz2[...] = a2
+    dL_dz2[y] -= 1.
+    dL_dW2 = np.dot(dL_dz2, a1.T, out=workspace.get('dL_dW2', (c,h), dtype))
+    dL_da1 = np.dot(dL_dz2.T, W2, out=workspace.get('dL_da1', (1,h), dtype)).T
+    da1_dz1 = compute_da1_dz1(a1, activation, out=workspace.get('da1_dz1', (h,1), dtype))
+    dL_dz1 = np.multiply(dL_da1, da1_dz1, out=workspace.get('dL_dz1', (h,1), dtype))
+    dL_dW1 = np.dot(dL_dz1, x.T, out=workspace.get('dL_dW1', (h,p), dtype))
+
+    # update the parameters, dL_db1 = dL_dz1 and dL_db2 = dL_dz2
+    sr.update_inplace(W1, dL_dW1, alpha)
+    sr.update_inplace(b1, dL_dz1, alpha)
+    sr.update_inplace(W2, dL_dW2, alpha)
+    sr.update_inplace(b2, dL_dz2, alpha)
+    return a2
+
+#--------------------------
+def train_pass(X, Y, W1, b1, W2, b2, alpha=0.01, batch_size=1, stats=None, backend='python', activation='sigmoid', optimizer=None, workspace=None):
+    '''
+       Go through the given training instances once and update the parameters of both layers using gradient descent.
+       This is one epoch of train(), and is also applied to each chunk of data by train_stream().
+       The pass runs on the plain arrays of the engine (see engine.py): the parameters are converted on entry and wrapped again as numpy matrices on return.
+        Input:
+            X: the feature matrix of training instances, a float numpy matrix of shape (n by p), or a scipy sparse matrix.
+               It is converted to a C-contiguous array of the dtype of W1 (no copy if train() already did it), so every instance is a row view.
+            Y: the labels of training instance, a numpy integer vector of length n. The values can be 0,1,2, ..., or (c-1).
+            W1, b1, W2, b2: the current parameters of the two layers.
+            alpha: the step-size parameter of gradient descent, a float scalar, or a schedules.Schedule object, called at each step to get the step-size alpha_t.
+            batch_size: the number of instances used in each gradient descent step, an integer scalar.
+            stats: an object collecting the running epoch loss from the forward passes (see stopping.EarlyStopping), or None.
+            backend: 'python' or 'numba' (see train()).
+            activation: the activation function of the 1st layer, a string (see compute_a1()).
+            optimizer: an optim.Optimizer object, or None for plain gradient descent (see train()).
+                       The optimizer sees the biases as vectors of length h and c.
+            workspace: the buffers of the per-sample steps, a workspace.Workspace object, or None to create one for this pass.
+        Output:
+            W1, b1, W2, b2: the updated parameters of the two layers.
+    '''
+    dtype = config.float_dtype(W1)
+    X = engine.as_rows(X, dtype)
+    if backend == 'numba' and batch_size == 1 and stats is None and activation == 'sigmoid' and optimizer is None and not callable(alpha) and not engine.issparse(X) and dtype == np.float64 and jit.available():
+        return train_pass_compiled(X, Y, W1, b1, W2, b2, alpha)
+
+    # the parameters are copied once per pass, so the given parameters are not modified
+    W1, W2 = np.array(W1, dtype=dtype), np.array(W2, dtype=dtype)
+    b1, b2 = np.array(b1, dtype=dtype).reshape(-1), np.array(b2, dtype=dtype).reshape(-1)
+    Y = np.asarray(Y, dtype=int).ravel()
+
+    if batch_size > 1:
+        for i in range(0, X.shape[0], batch_size):
+            alpha_t = alpha() if callable(alpha) else alpha
+            Xb, Yb = X[i:i+batch_size], Y[i:i+batch_size]
+
+            # Forward pass on the whole block
+            a1, a2 = forward_array(Xb, W1, b1, W2, b2, activation)
+            if stats is not None:
+                stats.record(sr.compute_L_batch(a2, Yb) * Xb.shape[0], Xb.shape[0], alpha_t)
+
+            # average gradients over the block
+            dL_dW2, dL_db2, dL_dW1, dL_db1 = compute_gradients_array(Xb, Yb, a1, a2, W2, activation)
+
+            if optimizer is None:
+                W1 = sr.update_W(W1, dL_dW1, alpha_t)
+                b1 = sr.update_b(b1, dL_db1, alpha_t)
+                W2 = sr.update_W(W2, dL_dW2, alpha_t)
+                b2 = sr.update_b(b2, dL_db2, alpha_t)
+            else:
+                W1, b1, W2, b2 = update(optimizer, (W1, b1, W2, b2), (dL_dW1, dL_db1, dL_dW2, dL_db2), alpha_t)
+
+    elif engine.issparse(X):
+        for i in range(X.shape[0]):
+            alpha_t = alpha() if callable(alpha) else alpha
+            lo, hi = X.indptr[i], X.indptr[i+1]
+            W1, b1, W2, b2 = train_sparse_instance(X.indices[lo:hi], X.data[lo:hi], Y[i], W1, b1, W2, b2, alpha_t, stats, activation, optimizer)
+
+    elif optimizer is None:
+        # per-sample gradient descent in place (see train_step()), on column views of the rows of X and of the biases
+        if workspace is None:
+            workspace = Workspace()
+        b1_, b2_ = b1[:, None], b2[:, None]
+        for x,y in zip(X,Y):
+            alpha_t = alpha() if callable(alpha) else alpha
+            a2 = train_step(x[:, None], y, W1, b1_, W2, b2_, alpha_t, workspace, activation)
+            if stats is not None:
+                stats.record(sr.compute_L(np.asmatrix(a2), y), alpha=alpha_t)
+
+    else:
+        # go through each training instance: a dense instance is a sparse one with all its features
+        for x,y in zip(X,Y):
+            alpha_t = alpha() if callable(alpha) else alpha
+            W1, b1, W2, b2 = train_sparse_instance(slice(None), x, y, W1, b1, W2, b2, alpha_t, stats, activation, optimizer)
+
+    return np.asmatrix(W1), engine.as_column(b1), np.asmatrix(W2), engine.as_column(b2)
+
+
+#--------------------------
+def train_pass_compiled(X, Y, W1, b1, W2, b2, alpha=0.01):
+    '''
+       One epoch of per-sample gradient descent on dense data with the compiled kernel jit.neuralnet_epoch() (requires numba).
+       The updates are the same, in the same order, as in train_pass().
+        Input:
+            X, Y, W1, b1, W2, b2, alpha: see train_pass().
+        Output:
+            W1, b1, W2, b2: the updated parameters of the two layers.
+    '''
+    params = [np.array(W1, dtype=float), np.array(b1, dtype=float).reshape(-1),
+              np.array(W2, dtype=float), np.array(b2, dtype=float).reshape(-1)]
+    jit.get_kernel(jit.neuralnet_epoch)(np.ascontiguousarray(X, dtype=float), np.asarray(Y, dtype=np.int64).ravel(), *params, alpha)
+    W1, b1, W2, b2 = params
+    return np.asmatrix(W1), np.asmatrix(b1).T, np.asmatrix(W2), np.asmatrix(b2).T
+
+#--------------------------
+def train(X, Y,h=3,  alpha=0.01, n_epoch=100, batch_size=1, early_stopping=None, backend='python', activation='sigmoid', optimizer=None, init=None, seed=None, dtype=None):
     '''
        Given a training dataset, train the FC model by iteratively updating the weights W and biases b using the gradients computed over each data instance.
         Input:
             X: the feature matrix of training instances, a float numpy matrix of shape (n by p). Here n is the number of data instance in the training set, p is the number of features/dimensions.
+               X can also be a scipy sparse matrix (CSR), in which case each update of W1 only touches the nonzero features.
             Y: the labels of training instance, a numpy integer vector of shape n by 1. The values can be 0 or 1.
             h: the number of neurons in the first layer
-            alpha: the step-size parameter of gradient ascent, a float scalar.
+            alpha: the step-size parameter of gradient ascent, a float scalar, or a schedules.Schedule object to change the step-size during the training (see schedules.py).
+                   The schedule is restarted before the first epoch. The compiled kernel is not used with a schedule.
             n_epoch: the number of passes to go through the training set, an integer scalar.
+            batch_size: the number of instances used in each gradient descent step, an integer scalar.
+                    With batch_size=1 the parameters are updated after every instance (stochastic gradient descent).
+                    With a larger batch_size, the forward and backward passes are computed for a block of consecutive rows at once
+                    with matrix products, and each step uses the average gradient over the block.
+            early_stopping: a stopping.EarlyStopping object, or None to always run n_epoch passes.
+                    The running loss of each epoch is collected from the forward passes, and the training stops early once it converges.
+                    After training, the object records why and when the training stopped.
+            backend: 'python' for the training loop above, or 'numba' for a compiled epoch kernel (see jit.py).
+                    The compiled kernel is only used for per-sample updates on dense data without early stopping, and only if numba is installed;
+                    otherwise the Python training loop is used. Both give the same parameters up to rounding (within 1e-10).
+            activation: the activation function of the 1st layer, a string: 'sigmoid', 'relu', 'leaky_relu' or 'tanh' (see compute_a1()).
+                    The compiled kernel only implements sigmoid; the other activations use the Python training loop.
+                    relu and tanh map 0 to 0, so if all the weights start as 0 the hidden layer never learns:
+                    by default their weights start from random values, and init='zeros' raises a ValueError (see init).
+            optimizer: an optim.Optimizer object (for example optim.Adam()), or None for plain gradient descent with the step-size alpha.
+                    The state of the optimizer is reset before the first epoch. The compiled kernel is not used with an optimizer.
+            init: the initialization scheme of the weights, a string: 'zeros', 'uniform', 'xavier' or 'he' (see init_weights()),
+                    or None (default) for the default one of the activation: 'zeros' for sigmoid, 'he' for relu and leaky_relu, 'xavier' for tanh (see get_init()).
+                    With 'zeros', all the h neurons of the first layer stay identical; a random scheme lets them learn different features.
+            seed: the random seed of the initialization, an integer scalar. The same seed gives the same model in every run.
+            dtype: the floating point type of the parameters and of the computations, 'float32' or 'float64', or None for the global dtype (see config.py).
+                    X is converted to it once. In float32 the model takes half the memory and the matrix products run about twice as fast.
+                    The compiled kernel is only used in float64.
         Output:
             W1: the weight matrix in the 1st layer trained on the training set
             b1: the bias in the 1st layer trained on the training set
@@ -502,74 +1092,379 @@ def train(X, Y,h=3,  alpha=0.01, n_epoch=100):
     # number of classes
     c = max(Y) + 1
 
-    # initialize W and b as 0
-    W1 = np.asmatrix(np.zeros((h,p)))
-    b1 = np.asmatrix(np.zeros((h,1)))
-    W2 = np.asmatrix(np.zeros((c,h)))
-    b2= np.asmatrix(np.zeros((c,1)))
+    # initialize the biases as 0, and the weights with the initialization scheme
+    dtype = config.get_dtype(dtype)
+    W1, b1, W2, b2 = initialize(p, h, c, init, seed, dtype, activation)
 
-    h = b1.shape[0]
+    X = engine.as_rows(X, dtype)
 
+    if optimizer is not None:
+        optimizer.reset()
+    if callable(alpha):
+        alpha.reset()
+    if early_stopping is not None:
+        early_stopping.reset((W1, b1, W2, b2), optimizer)
+    workspace = Workspace()
     for _ in range(n_epoch):
-        # go through each training instance
-        for x,y in zip(X,Y):
-            x = x.T
-            #########################################
-            # Forward pass
-            z1, a1, z2, a2 =  forward(x, W1, b1, W2, b2)
-
-            # compute local gradients
-            dL_da2 = compute_dL_da2(a2, y)
-            da2_dz2 = compute_da2_dz2(a2)
-            dz2_dW2 = compute_dz2_dW2(a1,c)
-            dz2_db2 = compute_dz2_db2(c)
-            dz2_da1 = compute_dz2_da1(W2)
-            da1_dz1 = compute_da1_dz1(a1)
-            dz1_dW1 = compute_dz1_dW1(x,h)
-            dz1_db1 = compute_dz1_db1(h)
-            dL_dW2, dL_db2, dL_dW1, dL_db1 = compute_gradients(dL_da2, da2_dz2, dz2_dW2, dz2_db2, dz2_da1, da1_dz1, dz1_dW1, dz1_db1)
-
-            # Back Propagation
-            dL_da2, da2_dz2, dz2_dW2, dz2_db2, dz2_da1, da1_dz1, dz1_dW1, dz1_db1 = backward(x,y,a1,a2,W2)
-
-            # update the paramters using gradient descent
-
-            W1 = sr.update_W(W1, dL_dW1, alpha)
-            b1 = sr.update_b(b1, dL_db1, alpha)
-
-            W2 = sr.update_W(W2, dL_dW2, alpha)
-            b2 = sr.update_b(b2, dL_db2, alpha)
-            #########################################
+        W1, b1, W2, b2 = train_pass(X, Y, W1, b1, W2, b2, alpha, batch_size, early_stopping, backend, activation, optimizer, workspace)
+        if callable(alpha):
+            alpha.end_epoch()
+        if early_stopping is not None and early_stopping.end((W1, b1, W2, b2), getattr(alpha, 'last', alpha), functools.partial(compute_loss, activation=activation)):
+            W1, b1, W2, b2 = early_stopping.params
+            break
     return W1, b1, W2, b2
 
+
 #--------------------------
-def predict(Xtest, W1,b1,W2,b2):
+def partial_fit(X, Y, W1=None, b1=None, W2=None, b2=None, h=3, alpha=0.01, n_epoch=1, batch_size=1, activation='sigmoid', optimizer=None, init=None, seed=None, dtype=None):
+    '''
+       Continue training the FC model on a new batch of data, starting from the given parameters instead of zeros.
+       If the batch contains labels larger than any class seen so far, the output layer is grown with zero rows (see softmax.grow_classes()).
+       The given parameters are not modified.
+        Input:
+            X: the feature matrix of the new training instances, a float numpy matrix of shape (n by p), or a scipy sparse (CSR) matrix.
+            Y: the labels of the new training instances, a numpy integer vector of length n. The values can be 0,1,2, ..., or (c-1).
+            W1, b1, W2, b2: the current parameters of the two layers. If all are None, the parameters are initialized (see init).
+                    W1 and W2 are given together; if only the biases b1 or b2 are None, they start as 0.
+            h: the number of neurons in the first layer, used only when the parameters are initialized.
+            alpha: the step-size parameter of gradient descent, a float scalar, or a schedules.Schedule object. The schedule continues from where the previous call left it.
+            n_epoch: the number of passes to go through the new batch, an integer scalar.
+            batch_size: the number of instances used in each gradient descent step, an integer scalar.
+            activation: the activation function of the 1st layer, a string (see compute_a1()).
+            optimizer: an optim.Optimizer object, or None for plain gradient descent.
+                    Its state is kept between calls, so pass the same object with each batch.
+            init, seed: the initialization scheme and random seed of the weights when W1 is None (see train()).
+                    As in train(), init='zeros' with an activation other than sigmoid raises a ValueError.
+            dtype: the floating point type of the computations, or None for the global dtype (see train()). The given parameters are converted to it.
+        Output:
+            W1, b1, W2, b2: the updated parameters of the two layers. W2 and b2 have max(c_old, max(Y)+1) rows.
+        Raise:
+            ValueError if only one of W1 and W2 is given.
+    '''
+    dtype = config.get_dtype(dtype)
+    p = X.shape[1]
+    if (W1 is None) != (W2 is None):
+        raise ValueError('W1 and W2 must be given together, or both be None to initialize the parameters')
+    if W1 is None:
+        if b1 is not None or b2 is not None:
+            raise ValueError('the biases b1 and b2 cannot be given without the weights W1 and W2')
+        W1, b1, W2, b2 = initialize(p, h, int(np.max(Y)) + 1, init, seed, dtype, activation)
+    if b1 is None:
+        b1 = np.zeros((np.asmatrix(W1).shape[0], 1), dtype)
+    if b2 is None:
+        b2 = np.zeros((np.asmatrix(W2).shape[0], 1), dtype)
+    W1, b1, W2, b2 = (np.asmatrix(param).astype(dtype) for param in (W1, b1, W2, b2))
+    W2, b2 = sr.grow_classes(W2, b2, int(np.max(Y)) + 1)
+
+    X = engine.as_rows(X, dtype)
+
+    workspace = Workspace()
+    for _ in range(n_epoch):
+        W1, b1, W2, b2 = train_pass(X, Y, W1, b1, W2, b2, alpha, batch_size, activation=activation, optimizer=optimizer, workspace=workspace)
+        if callable(alpha):
+            alpha.end_epoch()
+    return W1, b1, W2, b2
+
+#--------------------------
+def train_stream(source, c=None, h=3, alpha=0.01, n_epoch=100, batch_size=1, chunk_size=10000, early_stopping=None, activation='sigmoid', optimizer=None, init=None, seed=None, dtype=None):
+    '''
+       Train the FC model on a dataset that does not fit in memory.
+       The data is read one chunk at a time (see stream.iter_chunks), so only one chunk of rows is resident in memory.
+       Within each chunk, the updates are the same as in train(); a dataset given as one chunk gives the same result as train().
+        Input:
+            source: the training data. It can be a pair (X, Y) of arrays such as np.memmap, a pair of paths to .npy files
+                    (memory-mapped), a list of (X_chunk, Y_chunk) blocks, or a function returning a new iterable of blocks for each epoch.
+            c: the number of classes, an integer scalar. If None, it is found with one extra pass over the labels.
+            h: the number of neurons in the first layer
+            alpha: the step-size parameter of gradient descent, a float scalar, or a schedules.Schedule object (see train()).
+            n_epoch: the number of passes to go through the training set, an integer scalar.
+            batch_size: the number of instances used in each gradient descent step, an integer scalar.
+            chunk_size: the number of rows read into memory at a time from arrays or .npy files, an integer scalar.
+            early_stopping: a stopping.EarlyStopping object, or None to always run n_epoch passes (see train()).
+            activation: the activation function of the 1st layer, a string (see compute_a1()).
+            optimizer: an optim.Optimizer object, or None for plain gradient descent (see train()).
+            init, seed: the initialization scheme and random seed of the weights (see train()).
+            dtype: the floating point type of the computations, or None for the global dtype (see train()). Each chunk is converted to it.
+        Output:
+            W1, b1, W2, b2: the parameters of the two layers trained on the training set.
+    '''
+    dtype = config.get_dtype(dtype)
+    # check the initialization before reading any data
+    init = get_init(init, activation)
+    if c is None:
+        c = stream.count_classes(source, chunk_size)
+    W1 = None
+    workspace = Workspace()
+    for _ in range(n_epoch):
+        for X, Y in stream.iter_chunks(source, chunk_size):
+            if W1 is None:
+                # initialize the parameters once the number of features is known
+                W1, b1, W2, b2 = initialize(X.shape[1], h, c, init, seed, dtype, activation)
+                if optimizer is not None:
+                    optimizer.reset()
+                if callable(alpha):
+                    alpha.reset()
+                if early_stopping is not None:
+                    early_stopping.reset((W1, b1, W2, b2), optimizer)
+            W1, b1, W2, b2 = train_pass(X, Y, W1, b1, W2, b2, alpha, batch_size, early_stopping, activation=activation, optimizer=optimizer, workspace=workspace)
+        if callable(alpha):
+            alpha.end_epoch()
+        if early_stopping is not None and early_stopping.end((W1, b1, W2, b2), getattr(alpha, 'last', alpha), functools.partial(compute_loss, activation=activation)):
+            W1, b1, W2, b2 = early_stopping.params
+            break
+    return W1, b1, W2, b2
+
+#-----------------------------------------------------------------
+# Parallel training
+#-----------------------------------------------------------------
+
+#--------------------------
+def pack_params(params):
+    '''
+       Concatenate the parameters (or gradients) of the two layers into one flat vector, to store them in shared memory.
+        Input:
+            params: the parameters of the two layers (W1, b1, W2, b2).
+        Output:
+            theta: the flattened parameters, a float numpy array of length h*p + h + c*h + c, in the dtype of the parameters.
+    '''
+    return np.concatenate([np.asarray(param).ravel() for param in params])
+
+#--------------------------
+def unpack_params(theta, p, h, c):
+    '''
+       Split a flat vector from pack_params() back into the parameters of the two layers.
+        Input:
+            theta: the flattened parameters, a float numpy array of length h*p + h + c*h + c.
+            p, h, c: the number of features, neurons in the first layer and classes, integer scalars.
+        Output:
+            W1, b1, W2, b2: the parameters of the two layers, numpy matrices that are views of theta.
+    '''
+    params = []
+    i = 0
+    for shape in [(h,p), (h,1), (c,h), (c,1)]:
+        k = shape[0] * shape[1]
+        params.append(np.asmatrix(theta[i:i+k].reshape(shape)))
+        i += k
+    return tuple(params)
+
+#--------------------------
+def compute_shard_gradients(theta, X, Y, lo, hi, p, h, c, activation='sigmoid'):
+    '''
+       Compute the summed gradients and loss over the rows lo, ..., hi-1 of a mini-batch, with the mini-batch math of forward_batch() and compute_gradients_batch().
+        Input:
+            theta: the flattened parameters, a float numpy array (see pack_params()).
+            X, Y: the training data, a float numpy matrix of shape (n by p) (or a scipy sparse CSR matrix) and an integer numpy array of length n.
+            lo, hi: the rows of the shard, integer scalars.
+            p, h, c: the number of features, neurons in the first layer and classes, integer scalars.
+            activation: the activation function of the 1st layer, a string (see compute_a1()).
+        Output:
+            g: the gradients of the summed loss over the shard, in the order of pack_params(), a float numpy array.
+            L: the summed loss over the shard, a float scalar.
+    '''
+    W1, b1, W2, b2 = unpack_params(theta, p, h, c)
+    Xb, Yb = X[lo:hi], Y[lo:hi]
+    z1, a1, z2, a2 = forward_batch(Xb, W1, b1, W2, b2, activation)
+    dL_dW2, dL_db2, dL_dW1, dL_db1 = compute_gradients_batch(Xb, Yb, a1, a2, W2, activation)
+    m = hi - lo
+    return m * pack_params((dL_dW1, dL_db1, dL_dW2, dL_db2)), m * sr.compute_L_batch(a2, Yb)
+
+#--------------------------
+def data_parallel_worker(j, n_jobs, names, p, h, c, X, Y, go, done, activation='sigmoid', dtype=float):
+    '''
+       The worker process of train_parallel(). For each mini-batch, it waits for the parent to publish the parameters and the rows of the
+       mini-batch, computes the gradients over its own part of the rows, writes them to its row of the shared gradient buffer and signals the parent.
+       If it fails, it exits with an error, which the parent detects (see parallel.wait_workers()).
+        Input:
+            j: the index of the worker, an integer scalar between 0 and n_jobs-1.
+            n_jobs: the number of workers, an integer scalar.
+            names: the names of the shared memory blocks (parameters, gradients, control), a tuple of strings.
+            p, h, c: the number of features, neurons in the first layer and classes, integer scalars.
+            X, Y: the training data (see compute_shard_gradients()).
+            go: the semaphore released by the parent when the next mini-batch (or the signal to stop) is published, a multiprocessing.Semaphore object of this worker.
+            done: the semaphore released by the workers when their gradients are written, a multiprocessing.Semaphore object shared by the workers.
+            activation: the activation function of the 1st layer, a string (see compute_a1()).
+            dtype: the floating point type of the parameters and the gradients in shared memory.
+    '''
+    size = h*p + h + c*h + c
+    shm_theta, theta = parallel.attach_shared(names[0], (size,), dtype)
+    shm_grads, grads = parallel.attach_shared(names[1], (n_jobs, size + 1), dtype)
+    shm_ctrl, ctrl = parallel.attach_shared(names[2], (3,))
+    try:
+        while True:
+            # wait for the parameters and the rows of the next mini-batch (or the signal to stop)
+            go.acquire()
+            if ctrl[0]:
+                break
+            bounds = np.linspace(ctrl[1], ctrl[2], n_jobs + 1).astype(int)
+            lo, hi = bounds[j], bounds[j+1]
+            if hi > lo:
+                grads[j, :size], grads[j, size] = compute_shard_gradients(theta, X, Y, lo, hi, p, h, c, activation)
+            else:
+                grads[j] = 0.
+            done.release()
+    finally:
+        del theta, grads, ctrl
+        shm_theta.close()
+        shm_grads.close()
+        shm_ctrl.close()
+
+#--------------------------
+def train_parallel(X, Y, h=3, alpha=0.01, n_epoch=100, batch_size=100, n_jobs=None, early_stopping=None, activation='sigmoid', optimizer=None, init=None, seed=None, timeout=600., dtype=None):
+    '''
+       Train the FC model with synchronous data-parallel mini-batch gradient descent.
+       Each mini-batch is split into n_jobs contiguous parts. Every worker process computes the gradients over its part with the mini-batch math,
+       the parent sums the gradients of the workers in a fixed order (an all-reduce through shared memory) and makes one update.
+       So the steps are the same as train(..., batch_size=batch_size): the parameters match within rounding (the sums are split differently),
+       and the result is deterministic, whatever the timing of the workers. The workers are started once and kept for the whole training.
+       It pays off for large mini-batches, where the matrix products of a step outweigh the two synchronizations per step.
+        Input:
+            X: the feature matrix of training instances, a float numpy matrix of shape (n by p), or a scipy sparse (CSR) matrix.
+            Y: the labels of training instance, a numpy integer vector of length n. The values can be 0,1,2, ..., or (c-1).
+            h: the number of neurons in the first layer
+            alpha: the step-size parameter of gradient descent, a float scalar, or a schedules.Schedule object (see train()).
+            n_epoch: the number of passes to go through the training set, an integer scalar.
+            batch_size: the number of instances used in each gradient descent step, an integer scalar.
+            n_jobs: the number of worker processes, an integer scalar. None means one worker per CPU core.
+            early_stopping, activation, optimizer, init, seed: see train(). The parameter updates run in the parent process.
+                    The activation and init are checked before the workers are started, so invalid ones raise a ValueError as in train().
+            timeout: the longest time to wait for the gradients of the workers at each step, in seconds, a float scalar, or None for no limit.
+                    A worker that fails or is killed (for example by the out-of-memory killer) stops the training at once with a RuntimeError;
+                    the timeout also stops it if a worker stops responding.
+            dtype: the floating point type of the parameters and of the computations, or None for the global dtype (see train()).
+                    X is converted to it once, and the parameters and the gradients are exchanged through shared memory in that dtype.
+        Output:
+            W1, b1, W2, b2: the parameters of the two layers trained on the training set.
+    '''
+    init = get_init(init, activation)
+    dtype = config.get_dtype(dtype)
+    n, p = X.shape
+    Y = np.asarray(Y, dtype=int).ravel()
+    c = int(np.max(Y)) + 1
+    n_jobs = parallel.get_n_jobs(n_jobs)
+    size = h*p + h + c*h + c
+    X = config.cast(X.tocsr() if engine.issparse(X) else np.asmatrix(X), dtype)
+
+    W1, b1, W2, b2 = initialize(p, h, c, init, seed, dtype, activation)
+    if optimizer is not None:
+        optimizer.reset()
+    if callable(alpha):
+        alpha.reset()
+    if early_stopping is not None:
+        early_stopping.reset((W1, b1, W2, b2), optimizer)
+
+    shm_theta, theta = parallel.create_shared((size,), dtype)
+    shm_grads, grads = parallel.create_shared((n_jobs, size + 1), dtype)
+    shm_ctrl, ctrl = parallel.create_shared((3,))
+    ctx = parallel.get_context()
+    go, done = [ctx.Semaphore(0) for _ in range(n_jobs)], ctx.Semaphore(0)
+    names = (shm_theta.name, shm_grads.name, shm_ctrl.name)
+    try:
+        workers = parallel.start_workers(data_parallel_worker, [(j, n_jobs, names, p, h, c, X, Y, go[j], done, activation, dtype) for j in range(n_jobs)])
+        try:
+            for _ in range(n_epoch):
+                for i in range(0, n, batch_size):
+                    alpha_t = alpha() if callable(alpha) else alpha
+                    B = min(i + batch_size, n) - i
+
+                    # publish the parameters and the rows of the mini-batch, then wait for the gradients of all the workers
+                    theta[:] = pack_params((W1, b1, W2, b2))
+                    ctrl[1], ctrl[2] = i, i + B
+                    for go_j in go:
+                        go_j.release()
+                    parallel.wait_workers(done, workers, timeout)
+
+                    # all-reduce: sum the gradients of the workers in a fixed order, then average over the mini-batch
+                    g = grads[0].copy()
+                    for k in range(1, n_jobs):
+                        g += grads[k]
+                    if early_stopping is not None:
+                        early_stopping.record(g[size], B, alpha_t)
+                    gradients = unpack_params(g[:size] / B, p, h, c)
+
+                    if optimizer is None:
+                        W1, b1, W2, b2 = (sr.update_W(param, grad, alpha_t) for param, grad in zip((W1, b1, W2, b2), gradients))
+                    else:
+                        W1, b1, W2, b2 = update(optimizer, (W1, b1, W2, b2), gradients, alpha_t)
+                if callable(alpha):
+                    alpha.end_epoch()
+                if early_stopping is not None and early_stopping.end((W1, b1, W2, b2), getattr(alpha, 'last', alpha), functools.partial(compute_loss, activation=activation)):
+                    W1, b1, W2, b2 = early_stopping.params
+                    break
+            ctrl[0] = 1.
+            for go_j in go:
+                go_j.release()
+        except BaseException:
+            # the other workers wait for a mini-batch that never comes
+            parallel.stop_workers(workers)
+            raise
+        parallel.join_workers(workers)
+    finally:
+        del theta, grads, ctrl
+        for shm in (shm_theta, shm_grads, shm_ctrl):
+            shm.close()
+            shm.unlink()
+    return W1, b1, W2, b2
+
+#--------------------------
+def compare_parallel(X, Y, h=3, alpha=0.01, n_epoch=100, batch_size=100, n_jobs=None):
+    '''
+       Train the model with both train() and train_parallel() with the same mini-batches, and report the speedup and the final training loss of each.
+        Input:
+            X, Y, h, alpha, n_epoch, batch_size: see train().
+            n_jobs: the number of worker processes of train_parallel(), an integer scalar.
+        Output:
+            report: a dictionary with the keys 'serial_time', 'parallel_time', 'speedup', 'serial_loss' and 'parallel_loss' (see parallel.benchmark()).
+    '''
+    return parallel.benchmark(lambda: train(X, Y, h, alpha, n_epoch, batch_size),
+                              lambda: train_parallel(X, Y, h, alpha, n_epoch, batch_size, n_jobs),
+                              lambda W1, b1, W2, b2: compute_loss(X, Y, W1, b1, W2, b2))
+
+
+#--------------------------
+def predict(Xtest, W1,b1,W2,b2, activation='sigmoid', chunk_size=1024, n_jobs=1):
     '''
        Predict the labels of the instances in a test dataset using fully connected network.
+       The test instances are scored in blocks of chunk_size rows (on n_jobs threads, see parallel.map_chunks()), and each block writes
+       straight into the preallocated outputs. So the hidden activations take (chunk_size by h) memory instead of (n_test by h).
+       The scores are computed in the dtype of W1 (see config.py) on the plain arrays of the engine (see engine.py): each block of Xtest is converted to a C-contiguous array of that dtype.
         Input:
             Xtest: the feature matrix of testing instances, a float numpy matrix of shape (n_test by p). Here n_test is the number of data instance in the test set, p is the number of features/dimensions.
+                   Xtest can also be a scipy sparse matrix (CSR).
+            activation: the activation function of the 1st layer the model was trained with, a string (see compute_a1()).
+            chunk_size: the number of test instances scored together, an integer scalar.
+            n_jobs: the number of threads, an integer scalar. None means one thread per CPU core.
         Output:
             Y: the predicted labels of test data, an integer numpy list of length ntest. Each element can be 0, 1, ..., or (c-1)
             P: the predicted probabilities of test data to be in different classes, a float numpy matrix of shape (ntest,c). Each (i,j) element is between 0 and 1, indicating the probability of the i-th instance having the j-th class label.
     '''
     n = Xtest.shape[0]
-    c = W2.shape[0]
-    Y = np.zeros(n) # initialize as all zeros
-    P = np.asmatrix(np.zeros((n,c)))
-    for i, x in enumerate(Xtest):
-        x = x.T # convert to column vector
-        #########################################
-        z1 = compute_z1(x,W1,b1)
-        a1 = compute_a1(z1)
+    dtype = config.float_dtype(W1)
+    W1, b1, W2, b2 = np.asarray(W1), engine.as_vector(b1), np.asarray(W2), engine.as_vector(b2)
+    P = np.empty((n, W2.shape[0]), dtype=dtype)
+    Y = np.empty(n)
+    def score(lo, hi):
+        a1, a2 = forward_array(engine.as_rows(Xtest[lo:hi], dtype), W1, b1, W2, b2, activation)
+        P[lo:hi] = a2
+        Y[lo:hi] = np.argmax(a2, axis=1)
+    parallel.map_chunks(score, n, chunk_size, n_jobs)
+    return Y, np.asmatrix(P)
 
-        z2 = compute_z2(a1,W2,b2)
-        a2 = compute_a2(z2)
-        Y[i] = np.argmax(a2)
-        P[i, :] = a2.T
 
-        #########################################
-    return Y, P
 
+#--------------------------
+def compute_loss(X, Y, W1, b1, W2, b2, activation='sigmoid'):
+    '''
+       Compute the average multi-class cross entropy of the FC model on a dataset, for example a held-out split.
+        Input:
+            X: the feature matrix, a float numpy matrix of shape (n by p), or a scipy sparse (CSR) matrix.
+            Y: the labels, an integer array-like of length n. The values can be 0,1,2, ..., or (c-1).
+            W1, b1, W2, b2: the parameters of the two layers.
+            activation: the activation function of the 1st layer, a string (see compute_a1()).
+        Output:
+            L: the average loss, a float scalar.
+    '''
+    Yp, P = predict(X, W1, b1, W2, b2, activation)
+    return sr.compute_L_batch(P, Y)
 
 
 #-----------------------------------------------------------------
@@ -577,12 +1472,13 @@ def predict(Xtest, W1,b1,W2,b2):
 #-----------------------------------------------------------------
 
 #--------------------------
-def check_da1_dz1(z1,delta= 1e-7):
+def check_da1_dz1(z1,delta= 1e-7, activation='sigmoid'):
     '''
         Compute local gradient of the sigmoid activations a using gradient check.
         Input:
             z1: the input logits values of activation function, a float vector of shape p by 1.
             delta: a small number for gradient check, a float scalar.
+            activation: the activation function, a string (see compute_a1()).
         Output:
             da1_dz1: the approximated local gradient of the activations a1 w.r.t. the logits z1, a float numpy vector of shape p by 1.
                    The i-th element of da1_dz1 represents the partial gradient ( d_a1[i]  / d_z1[i] )
@@ -592,15 +1488,16 @@ def check_da1_dz1(z1,delta= 1e-7):
     for i in range(p):
         d = np.asmatrix(np.zeros((p,1)))
         d[i] = delta
-        da1_dz1[i] = (compute_a1(z1+d)[i] - compute_a1(z1)[i]) / delta
+        da1_dz1[i] = (compute_a1(z1+d, activation)[i] - compute_a1(z1, activation)[i]) / delta
     return da1_dz1
 
 #--------------------------
-def check_dL_dW2(x,y, W1,b1,W2,b2, delta= 1e-7):
+def check_dL_dW2(x,y, W1,b1,W2,b2, delta= 1e-7, activation='sigmoid'):
     '''
         Compute gradient of the weights W1 a using gradient check.
         Input:
             delta: a small number for gradient check, a float scalar.
+            activation: the activation function of the 1st layer, a string (see compute_a1()).
         Output:
             dL_dW1: the approximated gradient of the loss L w.r.t. the weights W1
     '''
@@ -610,18 +1507,19 @@ def check_dL_dW2(x,y, W1,b1,W2,b2, delta= 1e-7):
         for j in range(h):
             d = np.asmatrix(np.zeros((c,h)) )
             d[i,j] = delta
-            z1, a1, z2, a2 = forward(x, W1, b1, W2+d, b2)
+            z1, a1, z2, a2 = forward(x, W1, b1, W2+d, b2, activation)
             L = sr.compute_L(a2,y)
-            z1, a1, z2, a2 = forward(x, W1, b1, W2, b2)
+            z1, a1, z2, a2 = forward(x, W1, b1, W2, b2, activation)
             dL_dW2[i,j] = (L - sr.compute_L(a2,y)) / delta
     return dL_dW2
 
 #--------------------------
-def check_dL_dW1(x,y, W1,b1,W2,b2, delta= 1e-7):
+def check_dL_dW1(x,y, W1,b1,W2,b2, delta= 1e-7, activation='sigmoid'):
     '''
         Compute gradient of the weights W1 a using gradient check.
         Input:
             delta: a small number for gradient check, a float scalar.
+            activation: the activation function of the 1st layer, a string (see compute_a1()).
         Output:
             dL_dW1: the approximated gradient of the loss L w.r.t. the weights W1
     '''
@@ -631,8 +1529,8 @@ def check_dL_dW1(x,y, W1,b1,W2,b2, delta= 1e-7):
         for j in range(p):
             d = np.asmatrix(np.zeros((h,p)) )
             d[i,j] = delta
-            z1, a1, z2, a2 = forward(x, W1+d, b1, W2, b2)
+            z1, a1, z2, a2 = forward(x, W1+d, b1, W2, b2, activation)
             L = sr.compute_L(a2,y)
-            z1, a1, z2, a2 = forward(x, W1, b1, W2, b2)
+            z1, a1, z2, a2 = forward(x, W1, b1, W2, b2, activation)
             dL_dW1[i,j] = (L - sr.compute_L(a2,y)) / delta
     return dL_dW1
@@ -0,0 +1,250 @@
+import numpy as np
+import config
+#-------------------------------------------------------------------------
+'''
+    Optimizers: update rules for gradient descent.
+    By default the models update their parameters with plain gradient descent: param = param - alpha * dL_dparam (see softmax.update_W()).
+    An optimizer object can be passed to train() of the models instead. It keeps state buffers for each parameter
+    (for example a running average of the gradients), so the step of each weight can depend on the gradients of the previous steps.
+    Momentum methods keep moving in a consistent direction across steps, and adaptive methods (AdaGrad, RMSProp, Adam) scale
+    the step of each weight by the size of its past gradients, so rarely updated or flat directions get larger steps.
+
+    Notations:
+            key: the name of a parameter, for example 'W' or 'b1'. The state buffers of each parameter are stored under its key.
+            param: the current value of a parameter, a float numpy matrix or a float scalar.
+                   The state buffers have the dtype of the gradients, so float32 parameters stay float32 (see config.py).
+            grad: the gradient of the loss w.r.t. the parameter, of the same shape as param.
+            alpha: the step-size parameter (learning rate), a float scalar.
+            index: for sparse updates, a numpy index (for example (slice(None), idx) for the columns idx of a matrix).
+                   Only the entries param[index] and their state buffers are read and updated (a "lazy" update).
+'''
+
+#--------------------------
+class Optimizer:
+    '''
+        The base class of the optimizers. A subclass defines the state buffers of a parameter (init_state) and the update rule (compute_step).
+        Attributes:
+            state: the state of each parameter, a dictionary {key: {name: numpy array or integer}}.
+    '''
+    #--------------------------
+    def __init__(self):
+        self.reset()
+
+    #--------------------------
+    def reset(self):
+        '''
+            Clear the state of all the parameters. train() calls it before the first epoch.
+        '''
+        self.state = {}
+
+    #--------------------------
+    def init_state(self, shape, dtype=float):
+        '''
+            Create the state buffers of a parameter.
+            Input:
+                shape: the shape of the parameter, a tuple.
+                dtype: the floating point type of the buffers.
+            Output:
+                state: the initial state, a dictionary {name: numpy array or integer}.
+        '''
+        return {}
+
+    #--------------------------
+    def compute_step(self, state, g, alpha):
+        '''
+            Compute the change of a parameter, and update its state buffers.
+            Input:
+                state: the state of the parameter, a dictionary. The buffers are replaced by their new values.
+                g: the gradient, a float numpy array.
+                alpha: the step-size parameter, a float scalar.
+            Output:
+                step: the value to subtract from the parameter, a float numpy array of the same shape as g.
+        '''
+        raise NotImplementedError
+
+    #--------------------------
+    def get_state(self, key, shape, dtype=float):
+        '''
+            Get the state of a parameter, and create it on the first update.
+            When the output layer has grown with new classes (see softmax.grow_classes()), the buffers get zero rows for the new classes.
+            Input:
+                key: the name of the parameter, a string.
+                shape: the shape of the parameter, a tuple.
+                dtype: the floating point type of the buffers.
+            Output:
+                state: the state of the parameter, a dictionary.
+        '''
+        if key not in self.state:
+            self.state[key] = self.init_state(shape, dtype)
+        state = self.state[key]
+        for name, value in state.items():
+            if isinstance(value, np.ndarray) and value.shape != shape:
+                pad = np.zeros((shape[0] - value.shape[0],) + value.shape[1:], dtype=value.dtype)
+                state[name] = np.concatenate([value, pad])
+        return state
+
+    #--------------------------
+    def update(self, key, param, grad, alpha):
+        '''
+            Update a parameter with its gradient.
+            Input:
+                key: the name of the parameter, a string.
+                param: the current value of the parameter, a float numpy matrix or a float scalar.
+                grad: the gradient of the loss w.r.t. the parameter, of the same shape as param.
+                alpha: the step-size parameter, a float scalar.
+            Output:
+                param: the updated parameter, of the same type and shape as the input.
+        '''
+        g = np.asarray(grad, dtype=config.float_dtype(grad))
+        step = self.compute_step(self.get_state(key, g.shape, g.dtype), g, alpha)
+        return param - step
+
+    #--------------------------
+    def update_sparse(self, key, param, index, grad, alpha):
+        '''
+            Update some entries of a parameter in place, for example the columns of the nonzero features of a sparse instance.
+            The other entries and their state buffers are left unchanged.
+            Input:
+                key: the name of the parameter, a string.
+                param: the parameter, a float numpy array, updated in place.
+                index: the entries to update, a numpy index.
+                grad: the gradient of the loss w.r.t. param[index], a float numpy array of the same shape as param[index].
+                alpha: the step-size parameter, a float scalar.
+        '''
+        state = self.get_state(key, param.shape, param.dtype)
+        sub = {name: value[index] if isinstance(value, np.ndarray) else value for name, value in state.items()}
+        param[index] -= self.compute_step(sub, np.asarray(grad, dtype=param.dtype), alpha)
+        for name, value in sub.items():
+            if isinstance(state[name], np.ndarray):
+                state[name][index] = value
+            else:
+                state[name] = value
+
+
+#--------------------------
+class SGD(Optimizer):
+    '''
+        Plain gradient descent: param = param - alpha * grad. It gives the same results as train() without an optimizer.
+    '''
+    #--------------------------
+    def compute_step(self, state, g, alpha):
+        return alpha * g
+
+
+#--------------------------
+class Momentum(Optimizer):
+    '''
+        Gradient descent with momentum: v = beta * v - alpha * grad, then param = param + v.
+        With nesterov=True, the gradient is applied at the look-ahead point: param = param + beta * v - alpha * grad (Nesterov accelerated gradient).
+    '''
+    #--------------------------
+    def __init__(self, beta=0.9, nesterov=False):
+        '''
+            Input:
+                beta: the momentum coefficient, a float scalar between 0 and 1.
+                nesterov: whether to use Nesterov momentum, a boolean.
+        '''
+        self.beta = beta
+        self.nesterov = nesterov
+        super().__init__()
+
+    #--------------------------
+    def init_state(self, shape, dtype=float):
+        return {'v': np.zeros(shape, dtype=dtype)}
+
+    #--------------------------
+    def compute_step(self, state, g, alpha):
+        v = self.beta * state['v'] - alpha * g
+        state['v'] = v
+        if self.nesterov:
+            return alpha * g - self.beta * v
+        return -v
+
+
+#--------------------------
+class AdaGrad(Optimizer):
+    '''
+        AdaGrad: the step of each weight is divided by the square root of the sum of its squared gradients.
+        G = G + grad^2, then param = param - alpha * grad / (sqrt(G) + eps).
+    '''
+    #--------------------------
+    def __init__(self, eps=1e-8):
+        '''
+            Input:
+                eps: a small number to avoid dividing by 0, a float scalar.
+        '''
+        self.eps = eps
+        super().__init__()
+
+    #--------------------------
+    def init_state(self, shape, dtype=float):
+        return {'G': np.zeros(shape, dtype=dtype)}
+
+    #--------------------------
+    def compute_step(self, state, g, alpha):
+        G = state['G'] + g * g
+        state['G'] = G
+        return alpha * g / (np.sqrt(G) + self.eps)
+
+
+#--------------------------
+class RMSProp(Optimizer):
+    '''
+        RMSProp: like AdaGrad, but with an exponential moving average of the squared gradients, so the steps do not shrink forever.
+        s = rho * s + (1 - rho) * grad^2, then param = param - alpha * grad / (sqrt(s) + eps).
+    '''
+    #--------------------------
+    def __init__(self, rho=0.9, eps=1e-8):
+        '''
+            Input:
+                rho: the decay rate of the moving average, a float scalar between 0 and 1.
+                eps: a small number to avoid dividing by 0, a float scalar.
+        '''
+        self.rho = rho
+        self.eps = eps
+        super().__init__()
+
+    #--------------------------
+    def init_state(self, shape, dtype=float):
+        return {'s': np.zeros(shape, dtype=dtype)}
+
+    #--------------------------
+    def compute_step(self, state, g, alpha):
+        s = self.rho * state['s'] + (1. - self.rho) * g * g
+        state['s'] = s
+        return alpha * g / (np.sqrt(s) + self.eps)
+
+
+#--------------------------
+class Adam(Optimizer):
+    '''
+        Adam: momentum on the gradients and RMSProp scaling, with a bias correction of both moving averages for the first steps.
+        m = beta1 * m + (1 - beta1) * grad,  v = beta2 * v + (1 - beta2) * grad^2,
+        then param = param - alpha * m_hat / (sqrt(v_hat) + eps), where m_hat = m / (1 - beta1^t) and v_hat = v / (1 - beta2^t) at step t.
+    '''
+    #--------------------------
+    def __init__(self, beta1=0.9, beta2=0.999, eps=1e-8):
+        '''
+            Input:
+                beta1: the decay rate of the moving average of the gradients, a float scalar between 0 and 1.
+                beta2: the decay rate of the moving average of the squared gradients, a float scalar between 0 and 1.
+                eps: a small number to avoid dividing by 0, a float scalar.
+        '''
+        self.beta1 = beta1
+        self.beta2 = beta2
+        self.eps = eps
+        super().__init__()
+
+    #--------------------------
+    def init_state(self, shape, dtype=float):
+        return {'m': np.zeros(shape, dtype=dtype), 'v': np.zeros(shape, dtype=dtype), 't': 0}
+
+    #--------------------------
+    def compute_step(self, state, g, alpha):
+        t = state['t'] + 1
+        m = self.beta1 * state['m'] + (1. - self.beta1) * g
+        v = self.beta2 * state['v'] + (1. - self.beta2) * g * g
+        state['m'], state['v'], state['t'] = m, v, t
+        m_hat = m / (1. - self.beta1 ** t)
+        v_hat = v / (1. - self.beta2 ** t)
+        return alpha * m_hat / (np.sqrt(v_hat) + self.eps)
@@ -0,0 +1,229 @@
+import os
+import time
+import numpy as np
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from concurrent.futures import ThreadPoolExecutor
+#-------------------------------------------------------------------------
+'''
+    Multi-process training utilities.
+    Parameters are kept in a block of shared memory (multiprocessing.shared_memory), so that worker processes
+    can read and update the same numpy array without copying it.
+    Prediction runs on threads instead (see map_chunks()): the matrix products release the GIL, so the threads share the model and the outputs without any copy.
+
+    Notations:
+            n_jobs: the number of worker processes, an integer scalar. None means one worker per CPU core.
+            name: the name of a shared memory block, a string. Workers use it to attach to the block created by the parent.
+            shape: the shape of the numpy array stored in a shared memory block, a tuple of integers.
+'''
+
+#--------------------------
+def create_shared(shape, dtype=float):
+    '''
+        Create a float numpy array in a new block of shared memory, initialized as all zeros.
+        Input:
+            shape: the shape of the array, a tuple of integers.
+            dtype: the floating point type of the array (see config.py).
+        Output:
+            shm: the shared memory block, a multiprocessing.shared_memory.SharedMemory object.
+                 The caller must call shm.close() and shm.unlink() once the workers are done.
+            arr: the array backed by the shared memory, a float numpy array of the given shape.
+    '''
+    size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    arr = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    arr[...] = 0.
+    return shm, arr
+
+#--------------------------
+def attach_shared(name, shape, dtype=float):
+    '''
+        Attach to a block of shared memory created by create_shared() in another process.
+        Input:
+            name: the name of the shared memory block, a string.
+            shape: the shape of the array, a tuple of integers.
+            dtype: the floating point type the array was created with.
+        Output:
+            shm: the shared memory block. The worker must call shm.close() when it is done (but not unlink()).
+            arr: the array backed by the shared memory, a float numpy array of the given shape.
+    '''
+    shm = shared_memory.SharedMemory(name=name)
+    arr = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    return shm, arr
+
+#--------------------------
+def get_n_jobs(n_jobs=None):
+    '''
+        Get the number of worker processes to use.
+        Input:
+            n_jobs: the requested number of workers, an integer scalar or None (one worker per CPU core).
+        Output:
+            n_jobs: the number of workers, a positive integer.
+    '''
+    if n_jobs is None:
+        n_jobs = os.cpu_count() or 1
+    return max(int(n_jobs), 1)
+
+#--------------------------
+def split_rows(n, n_jobs):
+    '''
+        Split the row indices 0, 1, ..., n-1 into contiguous shards of almost equal sizes.
+        Input:
+            n: the number of rows, an integer scalar.
+            n_jobs: the number of shards, an integer scalar.
+        Output:
+            shards: a list of (lo, hi) pairs. The i-th shard holds the rows lo, ..., hi-1. Empty shards are dropped.
+    '''
+    bounds = np.linspace(0, n, n_jobs + 1).astype(int)
+    return [(int(lo), int(hi)) for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo]
+
+#--------------------------
+def get_context():
+    '''
+        Get the multiprocessing context used to start workers.
+        'fork' is used where it is available, so the training data is inherited by the workers instead of being pickled.
+        Output:
+            ctx: a multiprocessing context.
+    '''
+    if 'fork' in mp.get_all_start_methods():
+        return mp.get_context('fork')
+    return mp.get_context()
+
+#--------------------------
+def start_workers(target, args_list):
+    '''
+        Start one worker process per argument tuple, without waiting for them.
+        The workers are daemon processes, so they are killed if the parent exits without joining them.
+        If a worker cannot be started (for example if fork fails), the workers already started are stopped before the error is raised.
+        Input:
+            target: the worker function, a module-level function.
+            args_list: the arguments of each worker, a list of tuples.
+        Output:
+            workers: the started processes, a list of multiprocessing.Process objects. Pass them to join_workers().
+    '''
+    ctx = get_context()
+    workers = []
+    try:
+        for args in args_list:
+            worker = ctx.Process(target=target, args=args, daemon=True)
+            worker.start()
+            workers.append(worker)
+    except BaseException:
+        stop_workers(workers)
+        raise
+    return workers
+
+#--------------------------
+def join_workers(workers):
+    '''
+        Wait for the worker processes to finish.
+        Input:
+            workers: the processes returned by start_workers(), a list.
+        Raise:
+            RuntimeError if a worker exits with an error.
+    '''
+    for worker in workers:
+        worker.join()
+    failed = [worker.exitcode for worker in workers if worker.exitcode != 0]
+    if failed:
+        raise RuntimeError('%d worker process(es) failed with exit codes %s' % (len(failed), failed))
+
+#--------------------------
+def wait_workers(done, workers, timeout=None):
+    '''
+        Wait until each of the running workers has released a semaphore once, for example after writing its results to shared memory.
+        Unlike a multiprocessing.Barrier, which hangs forever if a process dies while waiting on it, the semaphore is polled
+        and the workers are checked in between: a worker that exits (with an error, or killed by a signal) stops the wait.
+        Input:
+            done: the semaphore released by the workers, a multiprocessing.Semaphore object.
+            workers: the processes returned by start_workers(), a list.
+            timeout: the longest time to wait, in seconds, a float scalar, or None to wait as long as the workers run.
+        Raise:
+            RuntimeError if a worker exits before releasing the semaphore, or if the timeout passes.
+    '''
+    deadline = None if timeout is None else time.monotonic() + timeout
+    for _ in workers:
+        while not done.acquire(timeout=0.1):
+            failed = [worker.exitcode for worker in workers if worker.exitcode is not None]
+            if failed:
+                raise RuntimeError('%d worker process(es) failed with exit codes %s' % (len(failed), failed))
+            if deadline is not None and time.monotonic() > deadline:
+                raise RuntimeError('the worker processes did not respond within %g seconds' % (timeout,))
+
+#--------------------------
+def stop_workers(workers):
+    '''
+        Kill the worker processes that are still running, and wait for all of them, for example after another worker failed.
+        The workers are killed (SIGKILL) rather than terminated, so that a stopped or unresponsive worker cannot block the caller.
+        Input:
+            workers: the processes returned by start_workers(), a list.
+    '''
+    for worker in workers:
+        if worker.is_alive():
+            worker.kill()
+    for worker in workers:
+        worker.join()
+
+#--------------------------
+def run_workers(target, args_list):
+    '''
+        Run one worker process per argument tuple and wait for all of them to finish.
+        Input:
+            target: the worker function, a module-level function.
+            args_list: the arguments of each worker, a list of tuples.
+        Raise:
+            RuntimeError if a worker exits with an error.
+    '''
+    join_workers(start_workers(target, args_list))
+
+#--------------------------
+def benchmark(train_serial, train_parallel, compute_loss):
+    '''
+        Compare a serial and a parallel trainer on the same data: wall-clock time and final training loss.
+        Input:
+            train_serial: a function with no input that runs the serial trainer and returns the trained parameters (a tuple).
+            train_parallel: a function with no input that runs the parallel trainer and returns the trained parameters (a tuple).
+            compute_loss: a function that takes the trained parameters (unpacked) and returns the average training loss, a float scalar.
+        Output:
+            report: a dictionary with the keys
+                'serial_time', 'parallel_time': the wall-clock times in seconds,
+                'speedup': serial_time / parallel_time,
+                'serial_loss', 'parallel_loss': the average training losses of the two trained models.
+    '''
+    start = time.perf_counter()
+    serial_params = train_serial()
+    serial_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parallel_params = train_parallel()
+    parallel_time = time.perf_counter() - start
+
+    return {'serial_time': serial_time,
+            'parallel_time': parallel_time,
+            'speedup': serial_time / parallel_time,
+            'serial_loss': compute_loss(*serial_params),
+            'parallel_loss': compute_loss(*parallel_params)}
+
+#--------------------------
+def map_chunks(score, n, chunk_size=1024, n_jobs=1):
+    '''
+        Process the rows of a dataset in blocks of chunk_size rows, on a pool of threads.
+        score(lo, hi) handles the rows lo, ..., hi-1 and writes its results into outputs preallocated by the caller, so the blocks need no merging,
+        and the intermediate results of a block (for example the activations of a layer) are only chunk_size rows long, whatever the size of the dataset.
+        The threads run in parallel because numpy releases the GIL in the matrix products (BLAS) and the element-wise operations.
+        With several threads, limit the threads of BLAS itself (for example OMP_NUM_THREADS=1) to avoid running more threads than cores.
+        Input:
+            score: the function that processes a block, a function of (lo, hi) with no output.
+            n: the number of rows, an integer scalar.
+            chunk_size: the number of rows in each block, an integer scalar.
+            n_jobs: the number of threads, an integer scalar. None means one thread per CPU core.
+    '''
+    chunks = [(lo, min(lo + chunk_size, n)) for lo in range(0, n, chunk_size)]
+    n_jobs = min(get_n_jobs(n_jobs), len(chunks))
+    if n_jobs <= 1:
+        for lo, hi in chunks:
+            score(lo, hi)
+        return
+    with ThreadPoolExecutor(n_jobs) as pool:
+        # list() waits for all the blocks, and raises the first error of a block
+        list(pool.map(lambda chunk: score(*chunk), chunks))
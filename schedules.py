@@ -0,0 +1,199 @@
+import math
+#-------------------------------------------------------------------------
+'''
+    Learning-rate schedules.
+    By default the step-size alpha of gradient descent is a constant. A schedule object can be passed as alpha to train() of the models
+    instead: the step-size then changes over the training, for example starting large for fast progress and decaying to converge.
+    The trainers call the schedule once per gradient descent step to get the step-size, and tell it when an epoch ends.
+    A schedule is driven either by the epoch counter (the step-size is constant within an epoch) or by the step counter.
+
+    Notations:
+            alpha: the initial (or maximal) step-size, a float scalar.
+            unit: the counter that drives the schedule, a string: 'epoch' or 'step'.
+            t: the value of the counter, an integer scalar: the number of epochs (or gradient descent steps) done so far.
+'''
+
+#--------------------------
+class Schedule:
+    '''
+        The base class of the schedules. A subclass defines the step-size at each value t of the counter (value).
+        Attributes:
+            epoch: the number of epochs done so far, an integer scalar.
+            n_step: the number of gradient descent steps done so far, an integer scalar.
+            last: the last step-size returned, a float scalar.
+    '''
+    #--------------------------
+    def __init__(self, alpha, unit='epoch'):
+        self.alpha = alpha
+        self.unit = unit
+        self.reset()
+
+    #--------------------------
+    def reset(self):
+        '''
+            Restart the schedule from t = 0. train() calls it before the first epoch.
+        '''
+        self.epoch = 0
+        self.n_step = 0
+        self.last = self.value(0)
+
+    #--------------------------
+    def value(self, t):
+        '''
+            Compute the step-size at a value of the counter.
+            Input:
+                t: the number of epochs (or steps) done so far, an integer scalar.
+            Output:
+                alpha_t: the step-size, a float scalar.
+        '''
+        raise NotImplementedError
+
+    #--------------------------
+    def __call__(self):
+        '''
+            Get the step-size of the next gradient descent step, and count the step.
+            Output:
+                alpha_t: the step-size, a float scalar.
+        '''
+        self.last = self.value(self.n_step if self.unit == 'step' else self.epoch)
+        self.n_step += 1
+        return self.last
+
+    #--------------------------
+    def end_epoch(self):
+        '''
+            Count the end of an epoch. The trainers call it after each pass over the training set.
+        '''
+        self.epoch += 1
+
+
+#--------------------------
+class StepDecay(Schedule):
+    '''
+        Multiply the step-size by gamma every step_size epochs (or steps): alpha_t = alpha * gamma^floor(t / step_size).
+    '''
+    #--------------------------
+    def __init__(self, alpha, step_size=10, gamma=0.1, unit='epoch'):
+        '''
+            Input:
+                alpha: the initial step-size, a float scalar.
+                step_size: the number of epochs (or steps) between two decays, an integer scalar.
+                gamma: the decay factor, a float scalar between 0 and 1.
+                unit: 'epoch' or 'step'.
+        '''
+        self.step_size = step_size
+        self.gamma = gamma
+        super().__init__(alpha, unit)
+
+    #--------------------------
+    def value(self, t):
+        return self.alpha * self.gamma ** (t // self.step_size)
+
+
+#--------------------------
+class ExponentialDecay(Schedule):
+    '''
+        Multiply the step-size by gamma after every epoch (or step): alpha_t = alpha * gamma^t.
+    '''
+    #--------------------------
+    def __init__(self, alpha, gamma=0.9, unit='epoch'):
+        '''
+            Input:
+                alpha: the initial step-size, a float scalar.
+                gamma: the decay factor, a float scalar between 0 and 1.
+                unit: 'epoch' or 'step'.
+        '''
+        self.gamma = gamma
+        super().__init__(alpha, unit)
+
+    #--------------------------
+    def value(self, t):
+        return self.alpha * self.gamma ** t
+
+
+#--------------------------
+class InverseTimeDecay(Schedule):
+    '''
+        Decay the step-size as 1/t: alpha_t = alpha / (1 + decay * t).
+        The sum of the step-sizes diverges while the sum of their squares converges, the classic condition for SGD to converge.
+    '''
+    #--------------------------
+    def __init__(self, alpha, decay=0.1, unit='epoch'):
+        '''
+            Input:
+                alpha: the initial step-size, a float scalar.
+                decay: the decay rate, a float scalar.
+                unit: 'epoch' or 'step'.
+        '''
+        self.decay = decay
+        super().__init__(alpha, unit)
+
+    #--------------------------
+    def value(self, t):
+        return self.alpha / (1. + self.decay * t)
+
+
+#--------------------------
+class CosineRestarts(Schedule):
+    '''
+        Cosine annealing with warm restarts (SGDR): within each cycle, the step-size decays from alpha to alpha_min along a half cosine,
+        then jumps back to alpha at the start of the next cycle. The first cycle lasts period epochs (or steps), and each cycle is mult times longer than the previous one.
+        alpha_t = alpha_min + (alpha - alpha_min) * (1 + cos(pi * t_cur / T)) / 2, where t_cur is the position in the current cycle of length T.
+    '''
+    #--------------------------
+    def __init__(self, alpha, period=10, alpha_min=0., mult=1, unit='epoch'):
+        '''
+            Input:
+                alpha: the step-size at the start of each cycle, a float scalar.
+                period: the length of the first cycle, an integer scalar.
+                alpha_min: the step-size at the end of each cycle, a float scalar.
+                mult: the growth factor of the cycle length, an integer scalar.
+                unit: 'epoch' or 'step'.
+        '''
+        self.period = period
+        self.alpha_min = alpha_min
+        self.mult = mult
+        super().__init__(alpha, unit)
+
+    #--------------------------
+    def value(self, t):
+        T = self.period
+        while t >= T:
+            t -= T
+            T *= self.mult
+        return self.alpha_min + (self.alpha - self.alpha_min) * (1. + math.cos(math.pi * t / T)) / 2.
+
+
+#--------------------------
+class OneCycle(Schedule):
+    '''
+        The one-cycle policy: the step-size first rises linearly from alpha / div to alpha during a warm-up,
+        then decays along a half cosine to alpha / (div * final_div) at the end of the training, and stays there.
+    '''
+    #--------------------------
+    def __init__(self, alpha, total, pct_start=0.3, div=25., final_div=1e4, unit='step'):
+        '''
+            Input:
+                alpha: the maximal step-size, a float scalar.
+                total: the number of steps (or epochs) of the whole training, an integer scalar.
+                       For unit='step', it is n_epoch times the number of steps per epoch, ceil(n / batch_size).
+                pct_start: the fraction of the training spent in the warm-up, a float scalar between 0 and 1.
+                div: the ratio of alpha to the initial step-size, a float scalar.
+                final_div: the ratio of the initial step-size to the final step-size, a float scalar.
+                unit: 'epoch' or 'step'.
+        '''
+        self.total = total
+        self.pct_start = pct_start
+        self.div = div
+        self.final_div = final_div
+        super().__init__(alpha, unit)
+
+    #--------------------------
+    def value(self, t):
+        alpha_0 = self.alpha / self.div
+        alpha_end = alpha_0 / self.final_div
+        n_up = max(int(self.pct_start * self.total), 1)
+        if t < n_up:
+            return alpha_0 + (self.alpha - alpha_0) * t / n_up
+        x = min((t - n_up) / max(self.total - 1 - n_up, 1), 1.)
+        return alpha_end + (self.alpha - alpha_end) * (1. + math.cos(math.pi * x)) / 2.
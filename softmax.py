@@ -1,5 +1,12 @@
 import numpy as np
 import math
+import stream
+import parallel
+import jit
+import config
+import engine
+from workspace import Workspace
+from engine import issparse
 
 #-------------------------------------------------------------------------
 '''
@@ -68,26 +75,33 @@ def compute_z(x,W,b):
 
 
 #-----------------------------------------------------------------
-def compute_a(z):
+def compute_a(z, out=None):
     '''
         Compute the softmax activations.
         Input:
             z: the logit values of softmax regression, a float numpy vector of shape c by 1. Here c is the number of classes
+            out: a float numpy array of shape c by 1 to write the activations into (see train_step()), or None to allocate a new one.
         Output:
             a: the softmax activations, a float numpy vector of shape c by 1.
     '''
     #########################################
+    if z.dtype == np.float32:
+        # exp() overflows float32 above 88 (float64 above 709), so the largest logit is subtracted first, as in compute_a_batch()
+        z = np.subtract(z, np.max(z), out=out)
     try:
-        e_z = np.exp(z)
+        e_z = np.exp(z, out=out)
         e_sum = np.sum(e_z)
-        a = e_z / e_sum
+        a = np.divide(e_z, e_sum, out=out)
     except FloatingPointError:
         if (z == z[0]).all():
-            a = np.ones((z.shape))
+            a = np.ones(z.shape, dtype=z.dtype)
             a = a / z.shape[0]
         else:
-            a = np.zeros((z.shape))
+            a = np.zeros(z.shape, dtype=z.dtype)
             a[np.argmax(z)] = 1.
+        if out is not None:
+            out[...] = a
+            a = out
 
     #########################################
     return a
@@ -171,18 +185,64 @@ def compute_dL_da(a, y):
 
 
 #-----------------------------------------------------------------
-def compute_da_dz(a):
+class SoftmaxJacobian(object):
+    '''
+        The local gradient of the softmax activations a w.r.t. the logits z, da_dz = diag(a) - a a^T, kept implicit.
+        Only the activations a are stored, so the memory is O(c) instead of O(c^2), and products with a vector cost O(c).
+        It can be passed as da_dz to compute_dL_dz() in place of the dense (c by c) matrix.
+        Attributes:
+            a: the activation values of softmax function, a numpy float vector of shape c by 1.
+            shape: the shape of the Jacobian, (c, c).
+    '''
+    def __init__(self, a):
+        self.a = np.asmatrix(a)
+        c = self.a.shape[0]
+        self.shape = (c, c)
+
+    def matvec(self, v):
+        '''
+            Multiply the Jacobian with a vector: da_dz * v = a * v - a (a^T v) = a * (v - a^T v), where * is element-wise.
+            Input:
+                v: a float numpy vector of shape c by 1.
+            Output:
+                the product, a float numpy vector of shape c by 1.
+        '''
+        v = np.asmatrix(v).reshape((self.shape[0], 1))
+        return np.multiply(self.a, v - (self.a.T * v).item())
+
+    def rmatvec(self, v):
+        '''
+            Multiply the transposed Jacobian with a vector: da_dz^T * v. The softmax Jacobian is symmetric, so this equals matvec(v).
+            Input:
+                v: a float numpy vector of shape c by 1.
+            Output:
+                the product, a float numpy vector of shape c by 1.
+        '''
+        return self.matvec(v)
+
+    def todense(self):
+        '''
+            Build the dense Jacobian, a float numpy matrix of shape (c by c). This allocates c^2 values and is only meant for small c.
+        '''
+        return np.asmatrix(np.diagflat(self.a)) - self.a * self.a.T
+
+
+#-----------------------------------------------------------------
+def compute_da_dz(a, lazy=False):
     '''
         Compute local gradient of the softmax activations a w.r.t. the logits z.
         Input:
             a: the activation values of softmax function, a numpy float vector of shape c by 1. Here c is the number of classes.
+            lazy: if True, return a SoftmaxJacobian operator instead of the dense matrix, a boolean.
         Output:
             da_dz: the local gradient of the activations a w.r.t. the logits z, a float numpy matrix of shape (c by c).
                    The (i,j)-th element of da_dz represents the partial gradient ( d_a[i]  / d_z[j] )
 
     '''
     #########################################
-    
+    if lazy:
+        return SoftmaxJacobian(a)
+
     mat1 = -1 * a* a.T
     mat2 = a * (1- a).T
 
@@ -202,6 +262,7 @@ def compute_da_dz(a):
 def compute_dz_dW(x,c):
     '''
         Compute local gradient of the logits function z w.r.t. the weights W.
+        Every row of dz_dW is x^T, so it is returned as a read-only broadcasting view of x: no (c by p) array is built.
         Input:
             x: the feature vector of a data instance, a float numpy vector of shape p by 1. Here p is the number of features/dimensions.
             c: the number of classes, an integer.
@@ -212,8 +273,7 @@ def compute_dz_dW(x,c):
     #########################################
     
 
-    result_list = x.T.tolist() * c
-    dz_dW = np.mat(result_list)
+    dz_dW = np.asmatrix(np.broadcast_to(np.asarray(x).T, (c, x.shape[0])))
     #########################################
     return dz_dW
 
@@ -221,19 +281,21 @@ def compute_dz_dW(x,c):
 
 
 #-----------------------------------------------------------------
-def compute_dz_db(c):
+def compute_dz_db(c, workspace=None):
     '''
         Compute local gradient of the logits function z w.r.t. the biases b.
         Input:
             c: the number of classes, an integer.
+            workspace: a workspace.Workspace object to take the vector of ones from (built once, read-only), or None to build a new one.
         Output:
             dz_db: the partial gradient of the logits z w.r.t. the biases b, a float vector of shape c by 1.
                    Each element dz_db[i] represents the partial gradient of the i-th logit z[i] w.r.t. the i-th bias b[i]:  d_z[i] / d_b[i]
     '''
     #########################################
     
-    dz_db = np.mat(np.array([1] * c))
-    dz_db = dz_db.T
+    if workspace is not None:
+        return np.asmatrix(workspace.constant((c,1)))
+    dz_db = np.asmatrix(np.ones((c,1)))
 
     #########################################
     return dz_db
@@ -244,13 +306,16 @@ def compute_dz_db(c):
 #-----------------------------------------------------------------
 
 #-----------------------------------------------------------------
-def backward(x,y,a):
+def backward(x,y,a,lazy=False,workspace=None):
     '''
        Back Propagation: given an instance in the training data, compute the local gradients of the logits z, activations a, weights W and biases b on the instance.
         Input:
             x: the feature vector of a training instance, a float numpy vector of shape p by 1. Here p is the number of features/dimensions.
             y: the label of a training instance, an integer scalar value. The values can be 0,1,2, ..., or (c-1).
             a: the activations of a training instance, a float numpy vector of shape c by 1. Here c is the number of classes.
+            lazy: if True, da_dz is returned as a SoftmaxJacobian operator, a boolean.
+            workspace: a workspace.Workspace object keeping the constant local gradients, or None (see compute_dz_db()).
+                   Pass the same workspace for every instance, so that the constants are built only once.
         Output:
             dL_da: the local gradients of the loss function w.r.t. the activations, a float numpy vector of shape c by 1.
                    The i-th element dL_da[i] represents the partial gradient of the loss function L w.r.t. the i-th activation a[i]:  d_L / d_a[i].
@@ -265,9 +330,9 @@ def backward(x,y,a):
     
     c = a.shape[0]
     dL_da = compute_dL_da(a, y)
-    da_dz = compute_da_dz(a)
+    da_dz = compute_da_dz(a, lazy)
     dz_dW = compute_dz_dW(x,c)
-    dz_db = compute_dz_db(c)
+    dz_db = compute_dz_db(c, workspace)
 
 
     #########################################
@@ -282,18 +347,39 @@ def compute_dL_dz(dL_da,da_dz):
                    The i-th element dL_da[i] represents the partial gradient of the loss function L w.r.t. the i-th activation a[i]:  d_L / d_a[i].
             da_dz: the local gradient of the activation w.r.t. the logits z, a float numpy matrix of shape (c by c).
                    The (i,j)-th element of da_dz represents the partial gradient ( d_a[i]  / d_z[j] )
+                   It can also be an operator with a rmatvec() method, such as SoftmaxJacobian.
         Output:
             dL_dz: the gradient of the loss function L w.r.t. the logits z, a numpy float vector of shape c by 1.
                    The i-th element dL_dz[i] represents the partial gradient of the loss function L w.r.t. the i-th logit z[i]:  d_L / d_z[i].
     '''
     #########################################
-    
+    if hasattr(da_dz, 'rmatvec'):
+        return np.asmatrix(da_dz.rmatvec(dL_da)).reshape((-1, 1))
+
     dL_dz = dL_da.T * da_dz
     dL_dz = dL_dz.T
     #########################################
     return dL_dz
 
 
+#-----------------------------------------------------------------
+def compute_dL_dz_fused(a, y):
+    '''
+       Compute the gradient of the multi-class cross entropy L w.r.t. the logits z directly from the softmax activations.
+       Chaining dL_da with the softmax Jacobian da_dz collapses to dL_dz = a - onehot(y), so neither the (c by c) Jacobian
+       nor the one-hot dL_da has to be built. The cost is O(c) instead of O(c^2).
+        Input:
+            a: the activations of a training instance, a float numpy vector of shape c by 1. Here c is the number of classes.
+            y: the label of a training instance, an integer scalar value. The values can be 0,1,2, ..., or (c-1).
+        Output:
+            dL_dz: the gradient of the loss function L w.r.t. the logits z, a numpy float vector of shape c by 1.
+                   The i-th element dL_dz[i] represents the partial gradient of the loss function L w.r.t. the i-th logit z[i]:  d_L / d_z[i].
+    '''
+    dL_dz = np.asmatrix(a, dtype=config.float_dtype(a)).copy()
+    dL_dz[y] -= 1.
+    return dL_dz
+
+
 #-----------------------------------------------------------------
 def compute_dL_dW(dL_dz,dz_dW):
     '''
@@ -359,7 +445,7 @@ def update_W(W, dL_dW, alpha=0.001):
 
     #########################################
     
-    W = W - alpha * dL_dW
+    W = engine.gradient_step(W, dL_dW, alpha)
 
     #########################################
     return W
@@ -382,87 +468,604 @@ def update_b(b, dL_db, alpha=0.001):
 
     #########################################
    
-    b = b- alpha * dL_db
+    b = engine.gradient_step(b, dL_db, alpha)
 
 
     #########################################
     return b
 
 
+#--------------------------
+def update_inplace(param, grad, alpha=0.001):
+    '''
+       Update a parameter in place using gradient descent, with the same arithmetic as update_W(): param - alpha * grad.
+       The gradient is scaled by alpha in its own buffer, so no new array is allocated, but the gradient is overwritten.
+        Input:
+            param: the parameter, a float numpy array (W or b), updated in place.
+            grad: the gradient of the loss function w.r.t. the parameter, a float numpy array of the same shape. It is overwritten by alpha * grad.
+            alpha: the step-size parameter of gradient descent, a float scalar.
+    '''
+    grad *= alpha
+    param -= grad
+
+
+#-----------------------------------------------------------------
+# Mini-batch
+#-----------------------------------------------------------------
+
+#-----------------------------------------------------------------
+def compute_z_batch(X, W, b):
+    '''
+        Compute the linear logits of a mini-batch of data instances with one matrix product. z = X W^T + b^T
+        Input:
+            X: the feature matrix of a mini-batch, a float numpy matrix of shape (B by p). Here B is the number of instances in the mini-batch.
+            W: the weight matrix of softmax regression, a float numpy matrix of shape (c by p). Here c is the number of classes.
+            b: the bias values of softmax regression, a float numpy vector of shape c by 1.
+        Output:
+            z: the linear logits of the mini-batch, a float numpy matrix of shape (B by c). The i-th row holds the logits of the i-th instance.
+    '''
+    z = engine.linear(engine.as_rows(X), np.asarray(W), engine.as_vector(b))
+    return np.asmatrix(z)
+
+
+#-----------------------------------------------------------------
+def compute_a_batch(z):
+    '''
+        Compute the softmax activations of each row of a mini-batch of logits.
+        The largest logit of each row is subtracted before the exponential, so the result is stable for logits of any magnitude.
+        Input:
+            z: the linear logits of the mini-batch, a float numpy matrix of shape (B by c).
+        Output:
+            a: the softmax activations of the mini-batch, a float numpy matrix of shape (B by c). Each row sums to 1.
+    '''
+    a = engine.softmax(np.asarray(z))
+    return np.asmatrix(a)
+
+
+#-----------------------------------------------------------------
+def compute_dL_dz_batch(a, y):
+    '''
+        Compute the gradients of the multi-class cross entropy w.r.t. the logits of a mini-batch, using the fused form a - onehot(y) on every row.
+        Input:
+            a: the softmax activations of the mini-batch, a float numpy matrix of shape (B by c).
+            y: the labels of the mini-batch, an integer numpy array of length B. The values can be 0,1,2, ..., or (c-1).
+        Output:
+            dL_dz: the gradients of the loss w.r.t. the logits, a float numpy matrix of shape (B by c). The i-th row is the gradient of the i-th instance.
+    '''
+    dL_dz = np.asmatrix(a, dtype=config.float_dtype(a)).copy()
+    dL_dz[np.arange(dL_dz.shape[0]), np.asarray(y, dtype=int).ravel()] -= 1.
+    return dL_dz
+
+
+#-----------------------------------------------------------------
+def compute_L_batch(a, y):
+    '''
+        Compute the average multi-class cross entropy over a mini-batch.
+        The activations of the true classes are clipped to at least 1e-15, so a confident wrong prediction gives a large but finite loss.
+        Input:
+            a: the softmax activations of the mini-batch, a float numpy matrix of shape (B by c).
+            y: the labels of the mini-batch, an integer array-like of length B. The values can be 0,1,2, ..., or (c-1).
+        Output:
+            L: the average loss over the mini-batch, a float scalar.
+    '''
+    a = np.asarray(a, dtype=float)
+    y = np.asarray(y, dtype=int).ravel()
+    a_y = np.clip(a[np.arange(a.shape[0]), y], 1e-15, 1.)
+    L = -float(np.mean(np.log(a_y)))
+    return L
+
+
+#-----------------------------------------------------------------
+def compute_gradients_batch(X, dL_dz):
+    '''
+        Compute the gradients of the average loss over a mini-batch w.r.t. the weights W and biases b.
+        Input:
+            X: the feature matrix of a mini-batch, a float numpy matrix of shape (B by p).
+            dL_dz: the gradients of the loss w.r.t. the logits, a float numpy matrix of shape (B by c).
+        Output:
+            dL_dW: the gradient of the average loss w.r.t. the weight matrix, a numpy float matrix of shape (c by p).
+            dL_db: the gradient of the average loss w.r.t. the biases, a float numpy vector of shape c by 1.
+    '''
+    dL_dW, dL_db = engine.linear_gradients(engine.as_rows(X), np.asarray(dL_dz))
+    return np.asmatrix(dL_dW), engine.as_column(dL_db)
+
+
+#-----------------------------------------------------------------
+def forward_array(X, W, b):
+    '''
+        Compute the softmax activations of a mini-batch on the plain arrays of the engine (see engine.py). It is compute_a_batch(compute_z_batch(X, W, b)) without the np.matrix wrappers.
+        Input:
+            X: the feature matrix of a mini-batch, a float numpy array of shape (B by p), or a scipy sparse (CSR) matrix.
+            W: the weight matrix, a float numpy array of shape (c by p).
+            b: the biases, a float numpy array of length c.
+        Output:
+            a: the softmax activations of the mini-batch, a float numpy array of shape (B by c).
+    '''
+    return engine.softmax(engine.linear(X, W, b))
+
+
+#-----------------------------------------------------------------
+def compute_gradients_array(X, y, a):
+    '''
+        Compute the gradients of the average loss over a mini-batch on the plain arrays of the engine, from the fused gradient a - onehot(y) of each row.
+        The activations are overwritten by the gradients w.r.t. the logits, so that no array of the size of a is allocated.
+        Input:
+            X: the feature matrix of a mini-batch, a float numpy array of shape (B by p), or a scipy sparse (CSR) matrix.
+            y: the labels of the mini-batch, an integer numpy array of length B. The values can be 0,1,2, ..., or (c-1).
+            a: the softmax activations of the mini-batch, a float numpy array of shape (B by c). It is overwritten by dL_dz.
+        Output:
+            dL_dW: the gradient of the average loss w.r.t. the weight matrix, a float numpy array of shape (c by p).
+            dL_db: the gradient of the average loss w.r.t. the biases, a float numpy array of length c.
+    '''
+    a[np.arange(a.shape[0]), y] -= 1.
+    return engine.linear_gradients(X, a)
+
+
+#-----------------------------------------------------------------
+# Sparse input
+#-----------------------------------------------------------------
+
+#-----------------------------------------------------------------
+def train_sparse_instance(idx, val, y, W, b, alpha=0.01, stats=None, optimizer=None):
+    '''
+       Update the weights W and biases b on one training instance stored as its nonzero features only.
+       The logits only read, and the update only writes, the columns of W at the nonzero features, so the cost is O(c nnz) instead of O(c p).
+       It works on the plain arrays of the engine (see engine.py), and the weights are updated in place.
+        Input:
+            idx: the column indices of the nonzero features, an integer numpy array of length nnz.
+                 For a dense instance, idx can be slice(None) and val the whole feature vector.
+            val: the values of the nonzero features, a float numpy array of length nnz.
+            y: the label of the training instance, an integer scalar value. The values can be 0,1,2, ..., or (c-1).
+            W: the weight matrix, a float numpy array of shape (c by p).
+            b: the bias values, a float numpy array of length c.
+            alpha: the step-size parameter of gradient descent, a float scalar.
+            stats: an object collecting the running epoch loss (see stopping.EarlyStopping), or None.
+            optimizer: an optim.Optimizer object, or None for plain gradient descent (see train()).
+                       The optimizer only updates the columns of W (and their state) at the nonzero features.
+        Output:
+            W: the updated weight matrix, a float numpy array of shape (c by p).
+            b: the updated biases, a float numpy array of length c.
+    '''
+    a = compute_a(W[:, idx] @ val + b)
+    if stats is not None:
+        stats.record(compute_L(engine.as_column(a), y), alpha=alpha)
+    # the fused gradient a - onehot(y), computed in the buffer of a
+    dL_dz = a
+    dL_dz[y] -= 1.
+    if optimizer is not None:
+        optimizer.update_sparse('W', W, (slice(None), idx), np.outer(dL_dz, val), alpha)
+        b = optimizer.update('b', b, dL_dz, alpha)
+        return W, b
+    W[:, idx] -= alpha * np.outer(dL_dz, val)
+    b = update_b(b, dL_dz, alpha)
+    return W, b
+
+
 #--------------------------
 # train
-def train(X, Y, alpha=0.01, n_epoch=100):
+def train_step(x, y, W, b, alpha, workspace):
+    '''
+       One step of per-sample gradient descent, done in place: the same arithmetic as forward(), compute_dL_dz_fused(), compute_dL_dW() and update_W(),
+       but the logits, activations and gradients are written into the buffers of the workspace, and W and b are updated in place (see update_inplace()).
+       Once the buffers exist, a step allocates no new array.
+        Input:
+            x: the feature vector of a training instance, a float numpy array of shape p by 1, of the same dtype as W.
+            y: the label of the training instance, an integer scalar value. The values can be 0,1,2, ..., or (c-1).
+            W: the weight matrix, a float numpy array of shape (c by p), updated in place.
+            b: the biases, a float numpy array of shape c by 1, updated in place.
+            alpha: the step-size parameter of gradient descent, a float scalar.
+            workspace: the buffers of the intermediate results, a workspace.Workspace object.
+        Output:
+            a: the activations of the instance (before the update), a float numpy array of shape c by 1. It is a buffer of the workspace, overwritten by the next step.
+    '''
+    c, p = W.shape
+    dtype = W.dtype
+    # Forward pass
+    z = np.dot(W, x, out=workspace.get('z', (c,1), dtype))
+    z += b
+    a = compute_a(z, out=workspace.get('a', (c,1), dtype))
+
+    # Back Propagation: the softmax and cross entropy gradients are fused into a - onehot(y)
+    dL_dz = workspace.get('dL_dz', (c,1), dtype)
+    dL_dz[...] = a
+    dL_dz[y] -= 1.
+    # the outer product dL_dz x^T as a matrix product: the same values as compute_dL_dW(), but a broadcast multiply would allocate iterator buffers
+    dL_dW = np.dot(dL_dz, x.T, out=workspace.get('dL_dW', (c,p), dtype))
+
+    # update the parameters, dL_db = dL_dz
+    update_inplace(W, dL_dW, alpha)
+    update_inplace(b, dL_dz, alpha)
+    return a
+
+#--------------------------
+def train_pass(X, Y, W, b, alpha=0.01, batch_size=1, stats=None, backend='python', optimizer=None, workspace=None):
+    '''
+       Go through the given training instances once and update the weights W and biases b using gradient descent.
+       This is one epoch of train(), and is also applied to each chunk of data by train_stream().
+       The pass runs on the plain arrays of the engine (see engine.py): the parameters are converted on entry and wrapped again as numpy matrices on return.
+        Input:
+            X: the feature matrix of training instances, a float numpy matrix of shape (n by p), or a scipy sparse matrix.
+               It is converted to a C-contiguous array of the dtype of W (no copy if train() already did it), so every instance is a row view.
+            Y: the labels of training instance, a numpy integer numpy array of length n. The values can be 0,1,2, ..., or (c-1).
+            W: the current weight matrix, a numpy float matrix of shape (c by p).
+            b: the current biases, a float numpy vector of shape c by 1.
+            alpha: the step-size parameter of gradient descent, a float scalar, or a schedules.Schedule object, called at each step to get the step-size alpha_t.
+            batch_size: the number of instances used in each gradient descent step, an integer scalar.
+            stats: an object collecting the running epoch loss from the forward passes (see stopping.EarlyStopping), or None.
+            backend: 'python' or 'numba' (see train()).
+            optimizer: an optim.Optimizer object, or None for plain gradient descent (see train()).
+                       The optimizer sees the biases as vectors of length c.
+            workspace: the buffers of the per-sample steps, a workspace.Workspace object, or None to create one for this pass.
+        Output:
+            W: the updated weight matrix, a numpy float matrix of shape (c by p).
+            b: the updated biases, a float numpy vector of shape c by 1.
+    '''
+    dtype = config.float_dtype(W)
+    X = engine.as_rows(X, dtype)
+    if backend == 'numba' and batch_size == 1 and stats is None and optimizer is None and not callable(alpha) and not issparse(X) and dtype == np.float64 and jit.available():
+        return train_pass_compiled(X, Y, W, b, alpha)
+
+    # the parameters are copied once per pass, so the given W and b are not modified
+    W, b = np.array(W, dtype=dtype), np.array(b, dtype=dtype).reshape(-1)
+    Y = np.asarray(Y, dtype=int).ravel()
+
+    if batch_size > 1:
+        for i in range(0, X.shape[0], batch_size):
+            alpha_t = alpha() if callable(alpha) else alpha
+            Xb, Yb = X[i:i+batch_size], Y[i:i+batch_size]
+
+            # Forward pass on the whole block
+            a = forward_array(Xb, W, b)
+            if stats is not None:
+                stats.record(compute_L_batch(a, Yb) * Xb.shape[0], Xb.shape[0], alpha_t)
+
+            # average gradients over the block
+            dL_dW, dL_db = compute_gradients_array(Xb, Yb, a)
+
+            if optimizer is None:
+                W = update_W(W, dL_dW, alpha_t)
+                b = update_b(b, dL_db, alpha_t)
+            else:
+                W = optimizer.update('W', W, dL_dW, alpha_t)
+                b = optimizer.update('b', b, dL_db, alpha_t)
+
+    elif issparse(X):
+        for i in range(X.shape[0]):
+            alpha_t = alpha() if callable(alpha) else alpha
+            lo, hi = X.indptr[i], X.indptr[i+1]
+            W, b = train_sparse_instance(X.indices[lo:hi], X.data[lo:hi], Y[i], W, b, alpha_t, stats, optimizer)
+
+    elif optimizer is None:
+        # per-sample gradient descent in place (see train_step()), on column views of the rows of X and of b
+        if workspace is None:
+            workspace = Workspace()
+        b_ = b[:, None]
+        for x,y in zip(X,Y):
+            alpha_t = alpha() if callable(alpha) else alpha
+            a = train_step(x[:, None], y, W, b_, alpha_t, workspace)
+            if stats is not None:
+                stats.record(compute_L(np.asmatrix(a), y), alpha=alpha_t)
+
+    else:
+        # go through each training instance: a dense instance is a sparse one with all its features
+        for x,y in zip(X,Y):
+            alpha_t = alpha() if callable(alpha) else alpha
+            W, b = train_sparse_instance(slice(None), x, y, W, b, alpha_t, stats, optimizer)
+
+    return np.asmatrix(W), engine.as_column(b)
+
+
+#--------------------------
+def train_pass_compiled(X, Y, W, b, alpha=0.01):
+    '''
+       One epoch of per-sample gradient descent on dense data with the compiled kernel jit.softmax_epoch() (requires numba).
+       The updates are the same, in the same order, as in train_pass().
+        Input:
+            X, Y, W, b, alpha: see train_pass().
+        Output:
+            W: the updated weight matrix, a numpy float matrix of shape (c by p).
+            b: the updated biases, a float numpy vector of shape c by 1.
+    '''
+    W_, b_ = np.array(W, dtype=float), np.array(b, dtype=float).reshape(-1)
+    jit.get_kernel(jit.softmax_epoch)(np.ascontiguousarray(X, dtype=float), np.asarray(Y, dtype=np.int64).ravel(), W_, b_, alpha)
+    return np.asmatrix(W_), np.asmatrix(b_).T
+
+#--------------------------
+def train(X, Y, alpha=0.01, n_epoch=100, batch_size=1, early_stopping=None, backend='python', optimizer=None, dtype=None):
     '''
        Given a training dataset, train the softmax regression model by iteratively updating the weights W and biases b using the gradients computed over each data instance.
         Input:
             X: the feature matrix of training instances, a float numpy matrix of shape (n by p). Here n is the number of data instance in the training set, p is the number of features/dimensions.
+               X can also be a scipy sparse matrix (CSR), in which case each update only touches the nonzero features.
             Y: the labels of training instance, a numpy integer numpy array of length n. The values can be 0 or 1.
-            alpha: the step-size parameter of gradient ascent, a float scalar.
+            alpha: the step-size parameter of gradient ascent, a float scalar, or a schedules.Schedule object to change the step-size during the training (see schedules.py).
+                   The schedule is restarted before the first epoch. The compiled kernel is not used with a schedule.
             n_epoch: the number of passes to go through the training set, an integer scalar.
+            batch_size: the number of instances used in each gradient descent step, an integer scalar.
+                    With batch_size=1 the parameters are updated after every instance, otherwise with the average gradient over a block of consecutive rows.
+            early_stopping: a stopping.EarlyStopping object, or None to always run n_epoch passes.
+                    The running loss of each epoch is collected from the forward passes, and the training stops early once it converges.
+                    After training, the object records why and when the training stopped.
+            backend: 'python' for the training loop above, or 'numba' for a compiled epoch kernel (see jit.py).
+                    The compiled kernel is only used for per-sample updates on dense data without early stopping, and only if numba is installed;
+                    otherwise the Python training loop is used. Both give the same parameters up to rounding (within 1e-10).
+            optimizer: an optim.Optimizer object (for example optim.Adam()), or None for plain gradient descent with the step-size alpha.
+                    The state of the optimizer is reset before the first epoch. The compiled kernel is not used with an optimizer.
+            dtype: the floating point type of the parameters and of the computations, 'float32' or 'float64', or None for the global dtype (see config.py).
+                    X is converted to it once. The compiled kernel is only used in float64.
         Output:
             W: the weight matrix trained on the training set, a numpy float matrix of shape (c by p).
             b: the bias, a float numpy vector of shape c by 1.
     '''
+    dtype = config.get_dtype(dtype)
     # number of features
     p = X.shape[1]
     # number of classes
     c = max(Y) + 1
 
     # initialize W and b as 0
-    W = np.asmatrix(np.zeros((c,p)))
-    b= np.asmatrix(np.zeros((c,1)))
+    W = np.asmatrix(np.zeros((c,p), dtype=dtype))
+    b= np.asmatrix(np.zeros((c,1), dtype=dtype))
+
+    X = engine.as_rows(X, dtype)
+
+    if optimizer is not None:
+        optimizer.reset()
+    if callable(alpha):
+        alpha.reset()
+    if early_stopping is not None:
+        early_stopping.reset((W, b), optimizer)
+    workspace = Workspace()
+    for _ in range(n_epoch):
+        W, b = train_pass(X, Y, W, b, alpha, batch_size, early_stopping, backend, optimizer, workspace)
+        if callable(alpha):
+            alpha.end_epoch()
+        if early_stopping is not None and early_stopping.end((W, b), getattr(alpha, 'last', alpha), compute_loss):
+            W, b = early_stopping.params
+            break
+    return W, b
 
+
+#--------------------------
+def grow_classes(W, b, c):
+    '''
+       Add output rows for classes that the model has not seen yet.
+       The new rows of the weights and biases start as 0, so the scores of the existing classes are unchanged.
+        Input:
+            W: the weight matrix, a float numpy matrix of shape (c_old by p).
+            b: the biases, a float numpy vector of shape c_old by 1.
+            c: the new number of classes, an integer scalar.
+        Output:
+            W: the weight matrix, a float numpy matrix of shape (max(c, c_old) by p).
+            b: the biases, a float numpy vector of shape max(c, c_old) by 1.
+    '''
+    c_old, p = W.shape
+    if c > c_old:
+        W = np.asmatrix(np.vstack([W, np.zeros((c - c_old, p), dtype=W.dtype)]))
+        b = np.asmatrix(np.vstack([b, np.zeros((c - c_old, 1), dtype=b.dtype)]))
+    return W, b
+
+#--------------------------
+def partial_fit(X, Y, W=None, b=None, alpha=0.01, n_epoch=1, batch_size=1, optimizer=None, dtype=None):
+    '''
+       Continue training the softmax regression model on a new batch of data, starting from the given parameters instead of zeros.
+       If the batch contains labels larger than any class seen so far, the output layer is grown with zero rows (see grow_classes()).
+       The given parameters are not modified.
+        Input:
+            X: the feature matrix of the new training instances, a float numpy matrix of shape (n by p), or a scipy sparse (CSR) matrix.
+            Y: the labels of the new training instances, a numpy integer numpy array of length n. The values can be 0,1,2, ..., or (c-1).
+            W: the current weight matrix, a numpy float matrix of shape (c_old by p). If None, the weights start as 0.
+            b: the current biases, a float numpy vector of shape c_old by 1. If None, the biases start as 0.
+            alpha: the step-size parameter of gradient descent, a float scalar, or a schedules.Schedule object. The schedule continues from where the previous call left it.
+            n_epoch: the number of passes to go through the new batch, an integer scalar.
+            batch_size: the number of instances used in each gradient descent step, an integer scalar.
+            optimizer: an optim.Optimizer object, or None for plain gradient descent.
+                    Its state is kept between calls, so pass the same object with each batch.
+            dtype: the floating point type of the computations, or None for the global dtype (see train()). The given parameters are converted to it.
+        Output:
+            W: the updated weight matrix, a numpy float matrix of shape (c by p), where c = max(c_old, max(Y)+1).
+            b: the updated biases, a float numpy vector of shape c by 1.
+    '''
+    dtype = config.get_dtype(dtype)
+    p = X.shape[1]
+    if W is None:
+        W = np.zeros((0 if b is None else np.asmatrix(b).shape[0], p), dtype)
+    if b is None:
+        b = np.zeros((np.asmatrix(W).shape[0], 1), dtype)
+    W, b = grow_classes(np.asmatrix(W).astype(dtype), np.asmatrix(b).astype(dtype), int(np.max(Y)) + 1)
+
+    X = engine.as_rows(X, dtype)
+
+    workspace = Workspace()
     for _ in range(n_epoch):
-        # go through each training instance
-        for x,y in zip(X,Y):
-            x = x.T # convert to column vector
-            #########################################
-            
-            # Forward pass: compute the logits, softmax and cross_entropy
-            z, a, L = forward(x,y,W,b)
+        W, b = train_pass(X, Y, W, b, alpha, batch_size, optimizer=optimizer, workspace=workspace)
+        if callable(alpha):
+            alpha.end_epoch()
+    return W, b
 
-            # Back Propagation: compute local gradients of cross_entropy, softmax and logits
+#--------------------------
+def train_stream(source, c=None, alpha=0.01, n_epoch=100, batch_size=1, chunk_size=10000, early_stopping=None, optimizer=None, dtype=None):
+    '''
+       Train the softmax regression model on a dataset that does not fit in memory.
+       The data is read one chunk at a time (see stream.iter_chunks), so only one chunk of rows is resident in memory.
+       Within each chunk, the updates are the same as in train(); a dataset given as one chunk gives the same result as train().
+        Input:
+            source: the training data. It can be a pair (X, Y) of arrays such as np.memmap, a pair of paths to .npy files
+                    (memory-mapped), a list of (X_chunk, Y_chunk) blocks, or a function returning a new iterable of blocks for each epoch.
+            c: the number of classes, an integer scalar. If None, it is found with one extra pass over the labels.
+            alpha: the step-size parameter of gradient descent, a float scalar, or a schedules.Schedule object (see train()).
+            n_epoch: the number of passes to go through the training set, an integer scalar.
+            batch_size: the number of instances used in each gradient descent step, an integer scalar.
+            chunk_size: the number of rows read into memory at a time from arrays or .npy files, an integer scalar.
+            early_stopping: a stopping.EarlyStopping object, or None to always run n_epoch passes (see train()).
+            optimizer: an optim.Optimizer object, or None for plain gradient descent (see train()).
+            dtype: the floating point type of the computations, or None for the global dtype (see train()). Each chunk is converted to it.
+        Output:
+            W: the weight matrix trained on the training set, a numpy float matrix of shape (c by p).
+            b: the bias, a float numpy vector of shape c by 1.
+    '''
+    dtype = config.get_dtype(dtype)
+    if c is None:
+        c = stream.count_classes(source, chunk_size)
+    W, b = None, np.asmatrix(np.zeros((c,1), dtype=dtype))
+    workspace = Workspace()
+    for _ in range(n_epoch):
+        for X, Y in stream.iter_chunks(source, chunk_size):
+            if W is None:
+                # initialize W as 0 once the number of features is known
+                W = np.asmatrix(np.zeros((c,X.shape[1]), dtype=dtype))
+                if optimizer is not None:
+                    optimizer.reset()
+                if callable(alpha):
+                    alpha.reset()
+                if early_stopping is not None:
+                    early_stopping.reset((W, b), optimizer)
+            W, b = train_pass(X, Y, W, b, alpha, batch_size, early_stopping, optimizer=optimizer, workspace=workspace)
+        if callable(alpha):
+            alpha.end_epoch()
+        if early_stopping is not None and early_stopping.end((W, b), getattr(alpha, 'last', alpha), compute_loss):
+            W, b = early_stopping.params
+            break
+    return W, b
 
-            dL_da, da_dz, dz_dW, dz_db =backward(x,y,a)
-            # compute the global gradients using chain rule
-            dL_dz = compute_dL_dz(dL_da,da_dz)
-            dL_dW = compute_dL_dW(dL_dz,dz_dW)
+#-----------------------------------------------------------------
+# Parallel training
+#-----------------------------------------------------------------
 
-            dL_db = compute_dL_db(dL_dz,dz_db)
+#--------------------------
+def hogwild_pass(theta, X, Y, lo, hi, alpha=0.01):
+    '''
+       Go through the rows lo, ..., hi-1 once with stochastic gradient descent, updating the shared parameters in place without any locking.
+        Input:
+            theta: the shared parameters, a float numpy array of shape (c by p+1). The first p columns are the weights W, the last one is the biases b.
+            X: the feature matrix of training instances, a float numpy array of shape (n by p), or a scipy sparse (CSR) matrix.
+            Y: the labels of training instance, an integer numpy array of length n. The values can be 0,1,2, ..., or (c-1).
+            lo, hi: the rows of this worker's shard, integer scalars.
+            alpha: the step-size parameter of gradient descent, a float scalar.
+    '''
+    p = theta.shape[1] - 1
+    # views of the shared block: the updates of W go straight to the shared memory
+    W = theta[:, :p]
+    b = theta[:, p]
+    sparse = issparse(X)
+    for i in range(lo, hi):
+        if sparse:
+            idx, val = X.indices[X.indptr[i]:X.indptr[i+1]], X.data[X.indptr[i]:X.indptr[i+1]]
+        else:
+            idx, val = slice(None), X[i]
+        W, b_new = train_sparse_instance(idx, val, Y[i], W, b, alpha)
+        b[:] = b_new
 
-            # update the paramters using gradient descent
-            W = update_W(W, dL_dW, alpha)
-            b = update_b(b, dL_db, alpha)
+#--------------------------
+def hogwild_worker(name, c, X, Y, lo, hi, alpha=0.01, n_epoch=100):
+    '''
+       The worker process of train_hogwild(): attach to the shared parameters and run n_epoch passes over its own shard of the data.
+        Input:
+            name: the name of the shared memory block holding the parameters, a string.
+            c: the number of classes, an integer scalar.
+            X, Y: the training data (see hogwild_pass()).
+            lo, hi: the rows of this worker's shard, integer scalars.
+            alpha: the step-size parameter of gradient descent, a float scalar.
+            n_epoch: the number of passes to go through the shard, an integer scalar.
+    '''
+    X = X.tocsr() if issparse(X) else np.asarray(X, dtype=float)
+    Y = np.asarray(Y, dtype=int).ravel()
+    shm, theta = parallel.attach_shared(name, (c, X.shape[1] + 1))
+    for _ in range(n_epoch):
+        hogwild_pass(theta, X, Y, lo, hi, alpha)
+    del theta
+    shm.close()
 
-            #########################################
+#--------------------------
+def train_hogwild(X, Y, alpha=0.01, n_epoch=100, n_jobs=None):
+    '''
+       Train the softmax regression model with lock-free parallel stochastic gradient descent (Hogwild).
+       The weights and biases live in shared memory. Each worker process goes through its own contiguous shard of the rows
+       and updates the shared parameters after every instance without any synchronization.
+       On sparse data, updates from different workers rarely touch the same weights, so the result is close to train().
+        Input:
+            X: the feature matrix of training instances, a float numpy matrix of shape (n by p), or a scipy sparse (CSR) matrix.
+            Y: the labels of training instance, a numpy integer numpy array of length n. The values can be 0,1,2, ..., or (c-1).
+            alpha: the step-size parameter of gradient descent, a float scalar.
+            n_epoch: the number of passes each worker makes over its shard, an integer scalar.
+            n_jobs: the number of worker processes, an integer scalar. None means one worker per CPU core.
+        Output:
+            W: the weight matrix trained on the training set, a numpy float matrix of shape (c by p).
+            b: the bias, a float numpy vector of shape c by 1.
+    '''
+    n, p = X.shape
+    c = int(np.max(Y)) + 1
+    shards = parallel.split_rows(n, parallel.get_n_jobs(n_jobs))
+    shm, theta = parallel.create_shared((c, p + 1))
+    try:
+        parallel.run_workers(hogwild_worker, [(shm.name, c, X, Y, lo, hi, alpha, n_epoch) for lo, hi in shards])
+        W, b = np.asmatrix(theta[:, :p].copy()), np.asmatrix(theta[:, p:].copy())
+    finally:
+        del theta
+        shm.close()
+        shm.unlink()
     return W, b
 
 #--------------------------
-def predict(Xtest, W, b):
+def compare_hogwild(X, Y, alpha=0.01, n_epoch=100, n_jobs=None):
+    '''
+       Train the model with both train() and train_hogwild() and report the speedup and the final training loss of each.
+        Input:
+            X, Y, alpha, n_epoch: see train().
+            n_jobs: the number of worker processes of train_hogwild(), an integer scalar.
+        Output:
+            report: a dictionary with the keys 'serial_time', 'parallel_time', 'speedup', 'serial_loss' and 'parallel_loss' (see parallel.benchmark()).
+    '''
+    return parallel.benchmark(lambda: train(X, Y, alpha, n_epoch),
+                              lambda: train_hogwild(X, Y, alpha, n_epoch, n_jobs),
+                              lambda W, b: compute_loss(X, Y, W, b))
+
+
+#--------------------------
+def predict(Xtest, W, b, chunk_size=1024, n_jobs=1):
     '''
        Predict the labels of the instances in a test dataset using softmax regression.
+       The test instances are scored in blocks of chunk_size rows (on n_jobs threads, see parallel.map_chunks()), and each block writes
+       straight into the preallocated outputs, so the intermediate results take (chunk_size by c) memory.
+       The scores are computed in the dtype of W (see config.py) on the plain arrays of the engine (see engine.py): each block of Xtest is converted to a C-contiguous array of that dtype.
         Input:
             Xtest: the feature matrix of testing instances, a float numpy matrix of shape (n_test by p). Here n_test is the number of data instance in the test set, p is the number of features/dimensions.
+                   Xtest can also be a scipy sparse matrix (CSR).
             W: the weight vector of the logistic model, a float numpy matrix of shape (c by p).
             b: the bias values of the softmax regression model, a float vector of shape c by 1.
+            chunk_size: the number of test instances scored together, an integer scalar.
+            n_jobs: the number of threads, an integer scalar. None means one thread per CPU core.
         Output:
             Y: the predicted labels of test data, an integer numpy array of length ntest Each element can be 0, 1, ..., or (c-1)
             P: the predicted probabilities of test data to be in different classes, a float numpy matrix of shape (ntest,c). Each (i,j) element is between 0 and 1, indicating the probability of the i-th instance having the j-th class label.
         
     '''
     n = Xtest.shape[0]
-    c = W.shape[0]
-    Y = np.zeros(n) # initialize as all zeros
-    P = np.asmatrix(np.zeros((n,c)))
-    for i, x in enumerate(Xtest):
-        x = x.T # convert to column vector
-        #########################################
-        z = compute_z(x,W,b)
-        a = compute_a(z)
-        Y[i] = np.argmax(a)
-        P[i,:] = a.T
-        #########################################
-    return Y, P
+    dtype = config.float_dtype(W)
+    W, b = np.asarray(W), engine.as_vector(b)
+    P = np.empty((n, W.shape[0]), dtype=dtype)
+    Y = np.empty(n)
+    def score(lo, hi):
+        a = forward_array(engine.as_rows(Xtest[lo:hi], dtype), W, b)
+        P[lo:hi] = a
+        Y[lo:hi] = np.argmax(a, axis=1)
+    parallel.map_chunks(score, n, chunk_size, n_jobs)
+    return Y, np.asmatrix(P)
+
+
+#--------------------------
+def compute_loss(X, Y, W, b):
+    '''
+       Compute the average multi-class cross entropy of the softmax regression model on a dataset, for example a held-out split.
+        Input:
+            X: the feature matrix, a float numpy matrix of shape (n by p), or a scipy sparse (CSR) matrix.
+            Y: the labels, an integer array-like of length n. The values can be 0,1,2, ..., or (c-1).
+            W, b: the parameters of the softmax regression model.
+        Output:
+            L: the average loss, a float scalar.
+    '''
+    Yp, P = predict(X, W, b)
+    return compute_L_batch(P, Y)
 
 
 #-----------------------------------------------------------------
@@ -490,6 +1093,21 @@ def check_da_dz(z, delta=1e-7):
             da_dz[i,j] = (compute_a(z+d)[i,0] - compute_a(z)[i,0]) / delta
     return da_dz
 
+#-----------------------------------------------------------------
+def check_da_dz_matvec(z, v, delta=1e-7):
+    '''
+        Compute the product of the softmax Jacobian with a vector using gradient checking, without building the Jacobian.
+        The product is approximated by the directional derivative along v:  da_dz * v = [a(z + delta v) - a(z)] / delta
+        Input:
+            z: the logit values of softmax regression, a float numpy vector of shape c by 1. Here c is the number of classes
+            v: the direction, a float numpy vector of shape c by 1.
+            delta: a small number for gradient check, a float scalar.
+        Output:
+            Jv: the approximated product of the local gradient da_dz with v, a float numpy vector of shape c by 1.
+    '''
+    Jv = (compute_a(z + delta * v) - compute_a(z)) / delta
+    return Jv
+
 #-----------------------------------------------------------------
 def check_dL_da(a, y, delta=1e-7):
     '''
@@ -0,0 +1,144 @@
+import math
+import numpy as np
+import optim
+#-------------------------------------------------------------------------
+'''
+    Early stopping.
+    An EarlyStopping object is passed to train() of the models. During each epoch, the trainer adds the loss of every
+    instance (already computed in its forward pass) to the running epoch loss. At the end of each epoch, the object decides
+    whether the training has converged, and records why and when it stopped.
+
+    Notations:
+            tol: the tolerance on the relative improvement of the monitored loss, a float scalar.
+                 An epoch counts as an improvement if the loss goes below (1 - tol) times the lowest loss so far.
+            gtol: the tolerance on the gradient norm, a float scalar or None (not used).
+                  The gradient norm of an epoch is the norm of the average gradient of its steps, found from the change of the parameters:
+                  ||theta_new - theta_old|| / (alpha_1 + ... + alpha_n), where alpha_t is the step-size of the t-th step of the epoch.
+                  With a schedule, the trainers pass the step-size of each step to record(), so the sum holds the step-sizes actually used.
+                  This only holds for plain gradient descent steps: an adaptive optimizer (AdaGrad, RMSProp, Adam) moves each weight by about alpha
+                  whatever its gradient, and momentum adds the previous steps, so gtol cannot be used with an optimizer other than optim.SGD.
+            patience: the number of epochs in a row without improvement before stopping, an integer scalar.
+            validation: a held-out split (X_val, Y_val), or None. If given, the loss on this split is monitored instead of the
+                        running training loss, and the parameters of the best epoch are returned.
+'''
+
+#--------------------------
+class EarlyStopping:
+    '''
+        Decide when to stop training, and record the training history.
+        After training, the following attributes describe the run:
+            history: a dictionary with the per-epoch lists 'loss' (the running training loss), 'grad_norm' and 'val_loss' (None without validation).
+            n_epoch: the number of epochs that were run, an integer scalar.
+            best_epoch: the epoch with the lowest monitored loss (counted from 1), an integer scalar.
+            stopped: whether the training stopped before n_epoch epochs, a boolean.
+            reason: why the training ended, a string: 'tol', 'gtol', 'patience' or 'n_epoch'.
+    '''
+    #--------------------------
+    def __init__(self, tol=1e-4, gtol=None, patience=1, validation=None):
+        self.tol = tol
+        self.gtol = gtol
+        self.patience = patience
+        self.validation = validation
+        self.reset()
+
+    #--------------------------
+    def reset(self, params=(), optimizer=None):
+        '''
+            Clear the state of a previous run and start the first epoch. train() calls it before the first epoch.
+            Input:
+                params: the initial parameters, a tuple of numpy matrices and float scalars.
+                optimizer: the optimizer of the training (see optim.py), or None for plain gradient descent.
+            Raise:
+                ValueError if gtol is used with an optimizer other than plain gradient descent (optim.SGD).
+        '''
+        if self.gtol is not None and optimizer is not None and type(optimizer) is not optim.SGD:
+            raise ValueError('gtol measures the gradient norm from plain gradient descent steps, and cannot be used with the %s optimizer'
+                             % (type(optimizer).__name__,))
+        self.history = {'loss': [], 'grad_norm': [], 'val_loss': []}
+        self.n_epoch = 0
+        self.best = math.inf
+        self.best_epoch = 0
+        self.best_params = None
+        self.wait = 0
+        self.stopped = False
+        self.reason = 'n_epoch'
+        self.begin(params)
+
+    #--------------------------
+    def begin(self, params):
+        '''
+            Start an epoch: remember the parameters and clear the running loss.
+            Input:
+                params: the parameters before the epoch, a tuple of numpy matrices and float scalars.
+                        They are copied, since some training paths update the weights in place.
+        '''
+        self.params_old = tuple(np.array(param, dtype=float) for param in params)
+        self.loss_sum = 0.
+        self.n_seen = 0
+        self.n_steps = 0
+        self.alpha_sum = 0.
+
+    #--------------------------
+    def record(self, L, n=1, alpha=None):
+        '''
+            Add the loss of the instances of one gradient descent step to the running epoch loss.
+            Input:
+                L: the summed loss of the instances, a float scalar.
+                n: the number of instances, an integer scalar.
+                alpha: the step-size of the step, a float scalar, or None to use the step-size given to end() for every step.
+        '''
+        self.loss_sum += L
+        self.n_seen += n
+        self.n_steps += 1
+        if alpha is not None:
+            self.alpha_sum += alpha
+
+    #--------------------------
+    def end(self, params, alpha, compute_loss=None):
+        '''
+            Finish an epoch and decide whether to stop.
+            Input:
+                params: the parameters after the epoch, a tuple of numpy matrices and float scalars.
+                alpha: the step-size parameter of gradient descent, a float scalar. It is only used for the gradient norm if the steps were recorded without their step-size.
+                compute_loss: the average loss of the model on a dataset, a function called as compute_loss(X_val, Y_val, *params).
+                              It is only used with a validation split.
+            Output:
+                stop: whether to stop training, a boolean. When True, the trainer returns self.params.
+        '''
+        val_loss = None
+        if self.validation is not None and compute_loss is not None:
+            val_loss = compute_loss(self.validation[0], self.validation[1], *params)
+        self.n_epoch += 1
+        loss = self.loss_sum / max(self.n_seen, 1)
+        step = math.sqrt(sum(float(np.sum(np.square(np.asarray(new, dtype=float) - old)))
+                             for new, old in zip(params, self.params_old)))
+        alpha_sum = self.alpha_sum if self.alpha_sum > 0. else alpha * max(self.n_steps, 1)
+        grad_norm = step / alpha_sum
+        self.history['loss'].append(loss)
+        self.history['grad_norm'].append(grad_norm)
+        self.history['val_loss'].append(val_loss)
+
+        # an epoch only resets the patience if it improves by more than tol, but the best epoch is the lowest loss
+        monitored = loss if val_loss is None else val_loss
+        if monitored < self.best * (1. - self.tol):
+            self.wait = 0
+        else:
+            self.wait += 1
+        if monitored < self.best:
+            self.best = monitored
+            self.best_epoch = self.n_epoch
+            if val_loss is not None:
+                self.best_params = tuple(param.copy() if hasattr(param, 'copy') else param for param in params)
+
+        self.params = params
+        if self.gtol is not None and grad_norm <= self.gtol:
+            self.reason = 'gtol'
+        elif self.wait >= self.patience:
+            self.reason = 'tol' if val_loss is None else 'patience'
+            if self.best_params is not None:
+                self.params = self.best_params
+        else:
+            self.begin(params)
+            return False
+        self.stopped = True
+        return True
@@ -0,0 +1,126 @@
+import os
+import numpy as np
+import config
+try:
+    import scipy.sparse as sp
+except ImportError: # scipy is only needed for sparse inputs
+    sp = None
+#-------------------------------------------------------------------------
+'''
+    Streaming data sources.
+    Read a training set that is larger than memory as a sequence of chunks (blocks of rows), so that the models
+    can be trained with train_stream() while only one chunk is resident in memory.
+
+    Notations:
+            source: the training data, one of
+                - a pair (X, Y) of arrays, for example np.memmap arrays. Rows are read chunk_size at a time.
+                - a pair of paths to .npy files, which are memory-mapped and read chunk_size rows at a time.
+                - a list (or other re-iterable container) of (X_chunk, Y_chunk) blocks.
+                - a function with no input that returns a new iterable of (X_chunk, Y_chunk) blocks, called once per epoch.
+            chunk_size: the number of rows read into memory at a time, an integer scalar.
+            X_chunk: the feature matrix of a chunk, a float numpy matrix of shape (m by p), or a scipy sparse matrix.
+            Y_chunk: the labels of a chunk, an integer numpy array of length m.
+'''
+
+#--------------------------
+def load_npy(X_path, Y_path):
+    '''
+        Open a training set stored as two .npy files without reading it into memory.
+        Input:
+            X_path: the path to the .npy file of the feature matrix, a string.
+            Y_path: the path to the .npy file of the labels, a string.
+        Output:
+            X: the memory-mapped feature matrix, a read-only np.memmap of shape (n by p).
+            Y: the memory-mapped labels, a read-only np.memmap of length n.
+    '''
+    X = np.load(X_path, mmap_mode='r')
+    Y = np.load(Y_path, mmap_mode='r')
+    return X, Y
+
+#--------------------------
+def is_path_pair(source):
+    '''
+        Check whether a data source is a pair of file paths.
+        Input:
+            source: a data source.
+        Output:
+            True if source is a pair of paths (strings or os.PathLike), a boolean.
+    '''
+    return (isinstance(source, tuple) and len(source) == 2
+            and all(isinstance(s, (str, os.PathLike)) for s in source))
+
+#--------------------------
+def is_array_pair(source):
+    '''
+        Check whether a data source is a pair (X, Y) of arrays.
+        Input:
+            source: a data source.
+        Output:
+            True if source is a pair of numpy arrays or scipy sparse matrices, a boolean.
+    '''
+    return (isinstance(source, tuple) and len(source) == 2
+            and isinstance(source[1], np.ndarray)
+            and (isinstance(source[0], np.ndarray) or (sp is not None and sp.issparse(source[0]))))
+
+#--------------------------
+def as_chunk(X, Y):
+    '''
+        Load one chunk into memory in the format the models expect.
+        Input:
+            X: the feature matrix of the chunk, an array-like of shape (m by p) (for example a slice of a np.memmap), or a scipy sparse matrix.
+            Y: the labels of the chunk, an array-like of length m.
+        Output:
+            X: the feature matrix of the chunk, a float numpy matrix of shape (m by p), or a scipy sparse (CSR) matrix.
+               A float32 or float64 chunk keeps its dtype, so a float32 memmap is read at half the memory; other types become float64 (see config.float_dtype()).
+            Y: the labels of the chunk, an integer numpy array of length m.
+    '''
+    if sp is not None and sp.issparse(X):
+        X = X.tocsr()
+    else:
+        X = np.asmatrix(np.array(X, dtype=config.float_dtype(X)))
+    Y = np.array(Y, dtype=int).ravel()
+    return X, Y
+
+#--------------------------
+def iter_chunks(source, chunk_size=10000):
+    '''
+        Go through a data source once, one chunk at a time.
+        Input:
+            source: the training data, see the notations above.
+            chunk_size: the number of rows read into memory at a time from arrays or .npy files, an integer scalar.
+        Output:
+            a generator of (X_chunk, Y_chunk) pairs. Only the current chunk is held in memory.
+    '''
+    if is_path_pair(source):
+        source = load_npy(*source)
+    if is_array_pair(source):
+        X, Y = source
+        n = X.shape[0]
+        for i in range(0, n, chunk_size):
+            yield as_chunk(X[i:i+chunk_size], Y[i:i+chunk_size])
+        return
+    if callable(source):
+        source = source()
+    elif iter(source) is source:
+        raise ValueError('a one-shot iterator can only be read once; pass a list of chunks or a function returning a new iterator for each epoch')
+    for X, Y in source:
+        yield as_chunk(X, Y)
+
+#--------------------------
+def count_classes(source, chunk_size=10000):
+    '''
+        Find the number of classes in a data source with one pass over the labels.
+        Input:
+            source: the training data, see the notations above.
+            chunk_size: the number of rows read into memory at a time from arrays or .npy files, an integer scalar.
+        Output:
+            c: the number of classes (the largest label + 1), an integer scalar.
+    '''
+    if is_path_pair(source):
+        source = load_npy(*source)
+    if is_array_pair(source):
+        return int(np.max(source[1])) + 1
+    c = 0
+    for X, Y in iter_chunks(source, chunk_size):
+        c = max(c, int(np.max(Y)) + 1)
+    return c
@@ -2,6 +2,8 @@ from logistic import *
 import numpy as np
 import sys
 from sklearn.datasets import make_classification
+import optim
+import schedules
 
 '''
     Unit test 1
@@ -443,3 +445,449 @@ def test_logistic_regression():
     accuracy = sum(Y == Ytest)/(n_samples/2.)
     print('Test accuracy:', accuracy)
     assert accuracy > 0.9
+
+
+#-------------------------------------------------------------------------
+def test_compute_a_batch():
+    ''' compute_a_batch'''
+    z = np.mat('0.; 1.; -1.; -2.; 1000.; -1000.')
+    a = compute_a_batch(z)
+    assert type(a) == np.matrixlib.defmatrix.matrix
+    assert a.shape == (6,1)
+    a_true = np.mat('0.5; 0.73105857863; 0.26894142137; 0.1192029; 1.; 0.')
+    assert np.allclose(a, a_true, atol = 1e-6)
+
+
+#-------------------------------------------------------------------------
+def test_compute_gradients_batch():
+    ''' compute_gradients_batch'''
+    for _ in range(20):
+        n = np.random.randint(1,10)
+        p = np.random.randint(2,10)
+        X = np.asmatrix(np.random.random((n,p)))
+        Y = np.random.randint(0,2,n)
+        w = np.asmatrix(np.random.random((p,1)))
+        b = np.random.random()
+
+        a = compute_a_batch(compute_z_batch(X, w, b))
+        dL_dz = compute_dL_dz_batch(a, np.asmatrix(Y).T)
+        dL_dw, dL_db = compute_gradients_batch(X, dL_dz)
+
+        # average of the per-instance gradients
+        dL_dw_true = np.asmatrix(np.zeros((p,1)))
+        dL_db_true = 0.
+        for x, y in zip(X, Y):
+            z, a, L = forward(x.T, y, w, b)
+            dL_da, da_dz, dz_dw, dz_db = backward(x.T, y, a)
+            dL_dw_true += compute_dL_dw(dL_da, da_dz, dz_dw) / n
+            dL_db_true += compute_dL_db(dL_da, da_dz, dz_db) / n
+        assert np.allclose(dL_dw, dL_dw_true, atol = 1e-6)
+        assert np.allclose(dL_db, dL_db_true, atol = 1e-6)
+
+
+#-------------------------------------------------------------------------
+def test_train_batch():
+    ''' train with mini-batches'''
+    Xtrain  = np.mat( [[0., 1.],
+                       [1., 0.],
+                       [0., 0.],
+                       [1., 1.]])
+    Ytrain = [0, 1, 0, 1]
+
+    # batch_size=1 is the per-instance stochastic gradient descent
+    w1, b1 = train(Xtrain, Ytrain, alpha=1., n_epoch = 100)
+    w2, b2 = train(Xtrain, Ytrain, alpha=1., n_epoch = 100, batch_size=1)
+    assert np.allclose(w1, w2)
+    assert np.allclose(b1, b2)
+
+    # full-batch and partial last batch
+    for batch_size in [4, 3]:
+        w, b = train(Xtrain, Ytrain, alpha=1., n_epoch = 500, batch_size=batch_size)
+        assert type(w) == np.matrixlib.defmatrix.matrix
+        assert w.shape == (2,1)
+        assert w[0]+w[1] + b > 0 # x4 is positive
+        assert w[0] + b > 0 # x2 is positive
+        assert w[1] + b < 0 # x1 is negative
+        assert  b < 0 # x3 is negative
+
+
+#-------------------------------------------------------------------------
+def test_predict_batch():
+    ''' predict matches the per-instance forward pass'''
+    for _ in range(20):
+        n = np.random.randint(1,20)
+        p = np.random.randint(2,10)
+        Xtest = np.asmatrix(10*np.random.random((n,p))-5)
+        w = np.asmatrix(2*np.random.random((p,1))-1)
+        b = np.random.random()
+        Y, P = predict(Xtest, w, b)
+        assert Y.shape == (n,)
+        assert P.shape == (n,1)
+        for i, x in enumerate(Xtest):
+            a = compute_a(compute_z(x.T, w, b))
+            assert np.allclose(P[i,0], a, atol = 1e-8)
+            assert Y[i] == (a >= 0.5)
+
+
+#-------------------------------------------------------------------------
+def test_train_sparse():
+    ''' train and predict on a sparse (CSR) feature matrix'''
+    import scipy.sparse as sp
+    X = sp.random(30, 50, density=0.1, format='csr', random_state=1)
+    Y = np.random.RandomState(1).randint(0,2,30)
+    Xd = np.asmatrix(X.toarray())
+
+    w, b = train(X, Y, alpha=0.1, n_epoch=5)
+    w_true, b_true = train(Xd, Y, alpha=0.1, n_epoch=5)
+    assert type(w) == np.matrixlib.defmatrix.matrix
+    assert w.shape == (50,1)
+    assert np.allclose(w, w_true, atol=1e-8)
+    assert np.allclose(b, b_true, atol=1e-8)
+
+    w, b = train(X, Y, alpha=0.1, n_epoch=5, batch_size=8)
+    w_true, b_true = train(Xd, Y, alpha=0.1, n_epoch=5, batch_size=8)
+    assert np.allclose(w, w_true, atol=1e-8)
+    assert np.allclose(b, b_true, atol=1e-8)
+
+    Yp, P = predict(X, w, b)
+    Yp_true, P_true = predict(Xd, w, b)
+    assert np.allclose(P, P_true)
+    assert np.allclose(Yp, Yp_true)
+
+
+#-------------------------------------------------------------------------
+def test_train_stream(tmp_path):
+    ''' train on a memory-mapped dataset one chunk at a time'''
+    X, y = make_classification(n_samples=50, n_features=4, n_redundant=0, n_informative=3,
+                               n_classes=2, random_state=1)
+    np.save(tmp_path / 'X.npy', X)
+    np.save(tmp_path / 'Y.npy', y)
+    source = (str(tmp_path / 'X.npy'), str(tmp_path / 'Y.npy'))
+
+    w_true, b_true = train(np.asmatrix(X), y, alpha=0.01, n_epoch=3)
+    w, b = train_stream(source, alpha=0.01, n_epoch=3, chunk_size=7)
+    assert type(w) == np.matrixlib.defmatrix.matrix
+    assert w.shape == (4,1)
+    assert np.allclose(w, w_true, atol=1e-8)
+    assert np.allclose(b, b_true, atol=1e-8)
+
+    w_true, b_true = train(np.asmatrix(X), y, alpha=0.1, n_epoch=3, batch_size=5)
+    w, b = train_stream(source, alpha=0.1, n_epoch=3, batch_size=5, chunk_size=10)
+    assert np.allclose(w, w_true, atol=1e-8)
+    assert np.allclose(b, b_true, atol=1e-8)
+
+
+#-------------------------------------------------------------------------
+def test_train_hogwild():
+    ''' lock-free parallel training (Hogwild)'''
+    import scipy.sparse as sp
+    X, y = make_classification(n_samples=200, n_features=4, n_redundant=0, n_informative=3,
+                               n_classes=2, random_state=1)
+    X = np.asmatrix(X)
+
+    # a single worker goes through the data in the same order as train()
+    w, b = train_hogwild(X, y, alpha=0.01, n_epoch=3, n_jobs=1)
+    w_true, b_true = train(X, y, alpha=0.01, n_epoch=3)
+    assert type(w) == np.matrixlib.defmatrix.matrix
+    assert w.shape == (4,1)
+    assert np.allclose(w, w_true, atol=1e-8)
+    assert np.allclose(b, b_true, atol=1e-8)
+
+    # several workers updating the shared parameters without locks
+    w, b = train_hogwild(X, y, alpha=0.01, n_epoch=20, n_jobs=2)
+    Y, P = predict(X, w, b)
+    assert np.mean(Y == y) > 0.8
+
+    w, b = train_hogwild(sp.csr_matrix(X), y, alpha=0.01, n_epoch=20, n_jobs=2)
+    Y, P = predict(X, w, b)
+    assert np.mean(Y == y) > 0.8
+
+    report = compare_hogwild(X, y, alpha=0.01, n_epoch=2, n_jobs=2)
+    assert set(report) == {'serial_time', 'parallel_time', 'speedup', 'serial_loss', 'parallel_loss'}
+    assert report['speedup'] > 0
+    assert abs(report['serial_loss'] - report['parallel_loss']) < 0.1
+
+
+#-------------------------------------------------------------------------
+def test_train_newton():
+    ''' Newton's method (IRLS)'''
+    import scipy.sparse as sp
+    X, y = make_classification(n_samples=200, n_features=4, n_redundant=0, n_informative=3,
+                               n_classes=2, flip_y=0.1, random_state=1)
+    X = np.asmatrix(X)
+
+    # the Hessian matches finite differences of the gradient
+    w, b = np.asmatrix(np.random.randn(4,1)), 0.3
+    a = compute_a_batch(compute_z_batch(X, w, b))
+    H = compute_hessian_batch(X, a)
+    assert type(H) == np.matrixlib.defmatrix.matrix
+    assert H.shape == (5,5)
+    g = lambda w, b: compute_gradients_batch(X, compute_dL_dz_batch(compute_a_batch(compute_z_batch(X, w, b)), np.asmatrix(y).T))[0]
+    e = np.asmatrix(np.zeros((4,1))); e[2] = 1e-6
+    assert np.allclose((g(w + e, b) - g(w, b)) / 1e-6, H[:4,2], atol=1e-4)
+
+    # at the solution, the gradient of the average loss is zero
+    w, b = train_newton(X, y, l2=0.)
+    assert type(w) == np.matrixlib.defmatrix.matrix
+    assert w.shape == (4,1)
+    a = compute_a_batch(compute_z_batch(X, w, b))
+    dL_dw, dL_db = compute_gradients_batch(X, compute_dL_dz_batch(a, np.asmatrix(y).T))
+    assert np.allclose(dL_dw, 0, atol=1e-8)
+    assert np.allclose(dL_db, 0, atol=1e-8)
+
+    # Newton's method reaches a training loss at least as low as SGD
+    w_sgd, b_sgd = train(X, y, alpha=0.01, n_epoch=100)
+    assert compute_L_batch(a, y) <= compute_L_batch(compute_a_batch(compute_z_batch(X, w_sgd, b_sgd)), y) + 1e-8
+
+    w_sp, b_sp = train_newton(sp.csr_matrix(X), y, l2=0.)
+    assert np.allclose(w_sp, w)
+    assert np.allclose(b_sp, b)
+
+    # linearly separable data: the small L2 penalty keeps the solution finite
+    X, y = make_classification(n_samples=100, n_features=2, n_redundant=0, n_informative=2,
+                               class_sep=5., random_state=0)
+    X = np.asmatrix(X)
+    w, b = train_newton(X, y)
+    assert np.all(np.isfinite(w))
+    Y, P = predict(X, w, b)
+    assert np.allclose(Y, y)
+
+    # a full Newton step overshoots on these separable points after 8 iterations (the loss goes from 0.002 up to 1.2);
+    # with step halving, the penalized loss goes down at every iteration
+    X = np.mat('0.5 -0.5; -0.5 0.; -2.3 -0.1; 2.2 0.1; 0. 0.2; -2.3 -0.5')
+    y = np.array([1, 1, 1, 0, 0, 1])
+    L = [np.log(2.)]
+    for max_iter in range(1, 16):
+        w, b = train_newton(X, y, max_iter=max_iter)
+        L.append(compute_loss(X, y, w, b) + 1e-6 / 2 * float(np.sum(np.square(w))))
+    assert all(L_next <= L_prev for L_prev, L_next in zip(L, L[1:]))
+    assert L[-1] < 0.002
+    Y, P = predict(X, w, b)
+    assert np.allclose(Y, y)
+
+
+#-------------------------------------------------------------------------
+def test_partial_fit():
+    ''' continue training on new batches'''
+    X, y = make_classification(n_samples=60, n_features=4, n_redundant=0, n_informative=3,
+                               n_classes=2, random_state=1)
+    X = np.asmatrix(X)
+
+    # two batches in a row give one epoch of train() on all of them
+    w_true, b_true = train(X, y, alpha=0.01, n_epoch=1)
+    w, b = partial_fit(X[:25], y[:25], alpha=0.01)
+    w_old = w.copy()
+    w, b = partial_fit(X[25:], y[25:], w, b, alpha=0.01)
+    assert type(w) == np.matrixlib.defmatrix.matrix
+    assert w.shape == (4,1)
+    assert np.allclose(w, w_true, atol=1e-8)
+    assert np.allclose(b, b_true, atol=1e-8)
+
+    # the given parameters are not modified
+    w2, b2 = partial_fit(X, y, w_old, 0., alpha=0.01)
+    assert not np.allclose(w2, w_old)
+    w3, b3 = partial_fit(X, y, w_old, 0., alpha=0.01)
+    assert np.allclose(w2, w3)
+
+
+#-------------------------------------------------------------------------
+def test_train_early_stopping():
+    ''' stop training once it converges'''
+    from stopping import EarlyStopping
+    X, y = make_classification(n_samples=200, n_features=4, n_redundant=0, n_informative=3,
+                               n_classes=2, random_state=1)
+    X = np.asmatrix(X)
+
+    es = EarlyStopping(tol=1e-3)
+    w, b = train(X, y, alpha=0.01, n_epoch=100, early_stopping=es)
+    assert es.stopped
+    assert es.n_epoch < 100
+    assert len(es.history['loss']) == es.n_epoch
+    w_true, b_true = train(X, y, alpha=0.01, n_epoch=es.n_epoch)
+    assert np.allclose(w, w_true)
+    assert es.history['loss'][-1] < es.history['loss'][0]
+
+    # a held-out split
+    es = EarlyStopping(tol=1e-3, patience=2, validation=(X[150:], y[150:]))
+    w, b = train(X[:150], y[:150], alpha=0.1, n_epoch=100, batch_size=10, early_stopping=es)
+    assert es.reason in ('patience', 'n_epoch')
+    assert np.isclose(compute_loss(X[150:], y[150:], w, b), min(es.history['val_loss']))
+
+    # with a schedule, the gradient norm divides the change of the parameters by the step-sizes actually used
+    for batch_size in [1, 10]:
+        es = EarlyStopping(tol=0.)
+        alpha = schedules.InverseTimeDecay(0.1, decay=0.5, unit='step')
+        w, b = train(X, y, alpha=alpha, n_epoch=1, batch_size=batch_size, early_stopping=es)
+        alpha_sum = sum(alpha.value(t) for t in range(alpha.n_step))
+        step = np.sqrt(np.sum(np.square(w)) + b**2)
+        assert np.isclose(es.history['grad_norm'][0], step / alpha_sum)
+
+    # gtol with an optimizer: only plain gradient descent steps measure the gradient norm
+    es = EarlyStopping(tol=0., gtol=0.05)
+    w, b = train(X, y, alpha=0.1, n_epoch=100, early_stopping=es, optimizer=optim.SGD())
+    es_true = EarlyStopping(tol=0., gtol=0.05)
+    w_true, b_true = train(X, y, alpha=0.1, n_epoch=100, early_stopping=es_true)
+    assert es.n_epoch == es_true.n_epoch
+    assert np.allclose(w, w_true)
+    for optimizer in [optim.Momentum(), optim.Adam()]:
+        try:
+            train(X, y, alpha=0.1, n_epoch=100, early_stopping=EarlyStopping(gtol=0.05), optimizer=optimizer)
+            assert False
+        except ValueError:
+            pass
+    es = EarlyStopping(tol=1e-3)
+    train(X, y, alpha=0.01, n_epoch=100, early_stopping=es, optimizer=optim.Adam())
+    assert es.stopped
+
+
+#-------------------------------------------------------------------------
+def test_train_compiled():
+    ''' compiled per-sample kernel'''
+    import jit
+    X, y = make_classification(n_samples=100, n_features=4, n_redundant=0, n_informative=3,
+                               n_classes=2, random_state=1)
+    w_true, b_true = train(np.asmatrix(X), y, alpha=0.01, n_epoch=5)
+
+    # the kernel does the same updates in the same order as the Python loop
+    w, b = np.zeros(4), 0.
+    for _ in range(5):
+        b = jit.logistic_epoch(X, y, w, b, 0.01)
+    assert np.allclose(w, np.asarray(w_true).ravel(), atol=1e-10)
+    assert np.allclose(b, b_true, atol=1e-10)
+
+    # compiled if numba is installed, otherwise the Python loop
+    w, b = train(np.asmatrix(X), y, alpha=0.01, n_epoch=5, backend='numba')
+    assert type(w) == np.matrixlib.defmatrix.matrix
+    assert w.shape == (4,1)
+    assert np.allclose(w, w_true, atol=1e-10)
+    assert np.allclose(b, b_true, atol=1e-10)
+
+
+#-------------------------------------------------------------------------
+def test_train_optimizer():
+    ''' train with an optimizer'''
+    X, y = make_classification(n_samples=300, n_features=8, n_redundant=0, random_state=0)
+    X = np.asmatrix(X)
+    for batch_size in [1, 10]:
+        w, b = train(X, y, alpha=0.01, n_epoch=3, batch_size=batch_size, optimizer=optim.SGD())
+        w_true, b_true = train(X, y, alpha=0.01, n_epoch=3, batch_size=batch_size)
+        assert type(w) == np.matrixlib.defmatrix.matrix
+        assert np.allclose(w, w_true) and np.allclose(b, b_true)
+
+    w, b = train(X, y, alpha=0.001, n_epoch=3)
+    L_sgd = compute_loss(X, y, w, b)
+    w, b = train(X, y, alpha=0.001, n_epoch=3, optimizer=optim.Adam())
+    assert compute_loss(X, y, w, b) < L_sgd
+    assert np.ndim(b) == 0
+
+    # partial_fit keeps the state of the optimizer between the batches
+    opt = optim.Adam()
+    w, b = partial_fit(X[:150], y[:150], alpha=0.001, optimizer=opt)
+    w, b = partial_fit(X[150:], y[150:], w, b, alpha=0.001, optimizer=opt)
+    assert opt.state['w']['t'] == 300
+
+
+#-------------------------------------------------------------------------
+def test_train_schedule():
+    ''' train with a learning-rate schedule'''
+    X, y = make_classification(n_samples=100, n_features=5, n_redundant=0, random_state=0)
+    X = np.asmatrix(X)
+    w, b = train(X, y, alpha=schedules.StepDecay(0.1, step_size=1, gamma=0.5), n_epoch=2)
+    w_true, b_true = train_pass(X, y, np.asmatrix(np.zeros((5,1))), 0., 0.1)
+    w_true, b_true = train_pass(X, y, w_true, b_true, 0.05)
+    assert np.allclose(w, w_true) and np.allclose(b, b_true)
+
+    # partial_fit continues the schedule
+    schedule = schedules.StepDecay(0.1, step_size=1, gamma=0.5)
+    w, b = partial_fit(X, y, alpha=schedule)
+    w, b = partial_fit(X, y, w, b, alpha=schedule)
+    assert np.allclose(w, w_true) and np.allclose(b, b_true)
+
+
+#-------------------------------------------------------------------------
+def test_predict_chunks():
+    ''' chunked and threaded predict'''
+    import scipy.sparse as sp
+    Xtest = np.asmatrix(np.random.randn(103, 6))
+    w = np.asmatrix(np.random.randn(6,1))
+    Y_true, P_true = predict(Xtest, w, 0.3, chunk_size=103)
+    for chunk_size, n_jobs in [(1, 1), (10, 1), (10, 4), (200, 4), (7, None)]:
+        Y, P = predict(Xtest, w, 0.3, chunk_size=chunk_size, n_jobs=n_jobs)
+        assert type(P) == np.matrixlib.defmatrix.matrix
+        assert P.shape == (103,1)
+        assert np.allclose(P, P_true)
+        assert np.allclose(Y, Y_true)
+    Y, P = predict(sp.csr_matrix(Xtest), w, 0.3, chunk_size=10, n_jobs=3)
+    assert np.allclose(P, P_true)
+
+
+#-------------------------------------------------------------------------
+def test_train_step():
+    ''' in-place training step without allocations'''
+    import tracemalloc
+    from workspace import Workspace
+    X, y = make_classification(n_samples=50, n_features=6, random_state=1)
+
+    # the same updates as update_w() and update_b()
+    w, b = np.zeros((6,1)), 0.
+    workspace = Workspace()
+    for x_, y_ in zip(X, y):
+        b, a = train_step(x_.reshape((-1,1)), y_, w, b, 0.1, workspace)
+    w_true, b_true = train(np.asmatrix(X), y, alpha=0.1, n_epoch=1)
+    assert np.allclose(w, w_true, atol=1e-12)
+    assert np.isclose(b, b_true, atol=1e-12)
+
+    # once the buffers exist, a step allocates no array of the size of w
+    w = np.random.randn(5000,1)
+    x = np.random.randn(5000,1)
+    b, a = train_step(x, 1, w, 0., 0.001, workspace)
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    for _ in range(100):
+        b, a = train_step(x, 1, w, b, 0.001, workspace)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert peak - start < w.nbytes / 10
+    assert current - start < 1000
+
+
+#-------------------------------------------------------------------------
+def test_float32():
+    ''' float32 compute mode'''
+    import scipy.sparse as sp
+    X, y = make_classification(n_samples=200, n_features=6, n_redundant=0, n_informative=4, random_state=1)
+    X, Y = np.asmatrix(X), np.asmatrix(y).T
+    for kwargs in [{}, {'batch_size': 10}, {'optimizer': optim.Adam()}]:
+        w, b = train(X, Y, alpha=0.01, n_epoch=3, dtype='float32', **kwargs)
+        w_true, b_true = train(X, Y, alpha=0.01, n_epoch=3, **kwargs)
+        assert type(w) == np.matrixlib.defmatrix.matrix
+        assert w.dtype == np.float32 and w_true.dtype == np.float64
+        assert np.allclose(w, w_true, atol=1e-4)
+        assert np.allclose(b, b_true, atol=1e-4)
+    w, b = train(sp.csr_matrix(X), Y, alpha=0.01, n_epoch=2, dtype=np.float32)
+    assert w.dtype == np.float32
+    w, b = partial_fit(X, Y, w_true, b_true, dtype='float32')
+    assert w.dtype == np.float32 and w_true.dtype == np.float64
+
+    # predict() computes in the dtype of the weights
+    Y_pred, P = predict(X, w, b)
+    assert type(P) == np.matrixlib.defmatrix.matrix
+    assert P.dtype == np.float32
+    assert np.allclose(P, predict(X, w.astype(float), b)[1], atol=1e-5)
+
+
+#-------------------------------------------------------------------------
+def test_train_pass_array():
+    ''' train_pass on the ndarray engine'''
+    import scipy.sparse as sp
+    X, y = make_classification(n_samples=40, n_features=5, n_redundant=0, n_informative=4, random_state=1)
+    w0 = np.asmatrix(np.random.randn(5,1))
+    # a new optimizer for each call, so that every call starts from the same state
+    for options in [dict, lambda: {'batch_size': 8}, lambda: {'optimizer': optim.Adam()}]:
+        w_true, b_true = train_pass(np.asmatrix(X), y, w0, 0.5, 0.1, **options())
+        assert type(w_true) == np.matrixlib.defmatrix.matrix and w_true.shape == (5,1)
+        # plain arrays in any memory layout give the same results, and the given weights are not modified
+        for X_ in [X, np.asfortranarray(X), sp.csr_matrix(X)]:
+            w, b = train_pass(X_, np.asmatrix(y).T, np.asarray(w0), 0.5, 0.1, **options())
+            assert np.allclose(w, w_true) and np.allclose(b, b_true)
+    assert np.allclose(forward_array(X, np.asarray(w0).ravel(), 0.5), compute_a_batch(compute_z_batch(X, w0, 0.5)).T)
@@ -2,6 +2,8 @@ from softmax import *
 import numpy as np
 import sys
 from sklearn.datasets import make_classification
+import optim
+import schedules
 
 '''
     Unit test 2:
@@ -473,3 +475,554 @@ def test_softmax_regression():
     accuracy = sum(Y == Ytest)/(n_samples/2.)
     print('Test accuracy:', accuracy)
     assert accuracy > 0.9
+
+
+#-------------------------------------------------------------------------
+def test_compute_a_batch():
+    ''' compute_a_batch'''
+    z = np.mat([[1., 1.],
+                [1., 0.],
+                [1000., 0.],
+                [-1000., -1000.]])
+    a = compute_a_batch(z)
+    assert type(a) == np.matrixlib.defmatrix.matrix
+    assert a.shape == (4,2)
+    a_true = [[0.5, 0.5],
+              [0.73105858, 0.26894142],
+              [1., 0.],
+              [0.5, 0.5]]
+    assert np.allclose(a, a_true, atol = 1e-6)
+    assert np.allclose(np.sum(a, axis=1), 1.)
+
+
+#-------------------------------------------------------------------------
+def test_predict_batch():
+    ''' predict matches the per-instance forward pass'''
+    for _ in range(20):
+        n = np.random.randint(1,20)
+        p = np.random.randint(2,10)
+        c = np.random.randint(2,10)
+        Xtest = np.asmatrix(10*np.random.random((n,p))-5)
+        W = np.asmatrix(2*np.random.random((c,p))-1)
+        b = np.asmatrix(np.random.random((c,1)))
+        Y, P = predict(Xtest, W, b)
+        assert Y.shape == (n,)
+        assert P.shape == (n,c)
+        for i, x in enumerate(Xtest):
+            a = compute_a(compute_z(x.T, W, b))
+            assert np.allclose(P[i].T, a, atol = 1e-8)
+            assert Y[i] == np.argmax(a)
+
+
+#-------------------------------------------------------------------------
+def test_compute_dL_dz_fused():
+    ''' compute_dL_dz_fused'''
+    a = np.mat('.5; .5')
+    dL_dz = compute_dL_dz_fused(a, 1)
+    assert type(dL_dz) == np.matrixlib.defmatrix.matrix
+    assert dL_dz.shape == (2,1)
+    assert np.allclose(dL_dz, np.mat('0.5; -0.5'), atol = 1e-3)
+    # the input activations are not modified
+    assert np.allclose(a, np.mat('.5; .5'))
+
+    for _ in range(20):
+        c = np.random.randint(2,10)
+        z = np.asmatrix(10*np.random.random((c,1))-5)
+        y = np.random.randint(c)
+        a = compute_a(z)
+        dL_dz_true = compute_dL_dz(compute_dL_da(a, y), compute_da_dz(a))
+        assert np.allclose(compute_dL_dz_fused(a, y), dL_dz_true, atol = 1e-8)
+
+
+#-------------------------------------------------------------------------
+def test_compute_dL_dz_batch():
+    ''' compute_dL_dz_batch and compute_gradients_batch'''
+    for _ in range(20):
+        n = np.random.randint(1,10)
+        p = np.random.randint(2,10)
+        c = np.random.randint(2,10)
+        X = np.asmatrix(10*np.random.random((n,p))-5)
+        Y = np.random.randint(c, size=n)
+        W = np.asmatrix(2*np.random.random((c,p))-1)
+        b = np.asmatrix(np.random.random((c,1)))
+
+        a = compute_a_batch(compute_z_batch(X, W, b))
+        dL_dz = compute_dL_dz_batch(a, Y)
+        assert dL_dz.shape == (n,c)
+        dL_dW, dL_db = compute_gradients_batch(X, dL_dz)
+        assert dL_dW.shape == (c,p)
+        assert dL_db.shape == (c,1)
+
+        # average of the per-instance gradients
+        dL_dW_true = np.asmatrix(np.zeros((c,p)))
+        dL_db_true = np.asmatrix(np.zeros((c,1)))
+        for x, y in zip(X, Y):
+            z, a, L = forward(x.T, y, W, b)
+            dL_da, da_dz, dz_dW, dz_db = backward(x.T, y, a)
+            dL_dz_i = compute_dL_dz(dL_da, da_dz)
+            dL_dW_true += compute_dL_dW(dL_dz_i, dz_dW) / n
+            dL_db_true += compute_dL_db(dL_dz_i, dz_db) / n
+        assert np.allclose(dL_dW, dL_dW_true, atol = 1e-6)
+        assert np.allclose(dL_db, dL_db_true, atol = 1e-6)
+
+
+#-------------------------------------------------------------------------
+def test_train_batch():
+    ''' train with mini-batches'''
+    Xtrain  = np.mat( [[0., 1.],
+                       [1., 0.],
+                       [0., 0.],
+                       [1., 1.]])
+    Ytrain = [0, 1, 0, 1]
+
+    for batch_size in [2, 4]:
+        W, b = train(Xtrain, Ytrain, alpha=1., batch_size=batch_size)
+        assert type(W) == np.matrixlib.defmatrix.matrix
+        assert W.shape == (2,2)
+        assert b.shape == (2,1)
+        assert b[0] > b[1] # x3 is negative
+        assert W[1,0] + W[1,1] + b[1] > W[0,0] + W[0,1] + b[0] # x4 is positive
+        assert W[1,1] + b[1] < W[0,1] + b[0] # x1 is negative
+        assert W[1,0] + b[1] > W[0,0] + b[0] # x2 is positive
+
+
+#-------------------------------------------------------------------------
+def test_softmax_jacobian():
+    ''' implicit softmax Jacobian'''
+    a = np.mat('.5; .5')
+    da_dz = compute_da_dz(a, lazy=True)
+    assert isinstance(da_dz, SoftmaxJacobian)
+    assert da_dz.shape == (2,2)
+    assert np.allclose(da_dz.todense(), [[0.25, -0.25],[-0.25,0.25]], atol = 1e-3)
+
+    for _ in range(20):
+        c = np.random.randint(2,10)
+        z = np.asmatrix(10*np.random.random((c,1))-5)
+        v = np.asmatrix(np.random.random((c,1)))
+        y = np.random.randint(c)
+        a = compute_a(z)
+        J = compute_da_dz(a)
+        J_lazy = compute_da_dz(a, lazy=True)
+        assert np.allclose(J_lazy.todense(), J, atol = 1e-8)
+        assert np.allclose(J_lazy.matvec(v), J * v, atol = 1e-8)
+        assert np.allclose(J_lazy.rmatvec(v), J.T * v, atol = 1e-8)
+        # numerical directional derivative
+        assert np.allclose(J_lazy.matvec(v), check_da_dz_matvec(z, v), atol = 1e-4)
+
+        dL_da, da_dz, dz_dW, dz_db = backward(z, y, a, lazy=True)
+        dL_dz = compute_dL_dz(dL_da, da_dz)
+        assert type(dL_dz) == np.matrixlib.defmatrix.matrix
+        assert dL_dz.shape == (c,1)
+        assert np.allclose(dL_dz, compute_dL_dz(dL_da, J), atol = 1e-8)
+
+    # float32 activations are kept without a copy, and the product does not warn
+    import warnings
+    a = np.asmatrix(np.full((4,1), 0.25, dtype=np.float32))
+    J_lazy = SoftmaxJacobian(a)
+    assert J_lazy.a is a
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', DeprecationWarning)
+        Jv = J_lazy.matvec(np.asmatrix(np.ones((4,1), dtype=np.float32)))
+    assert Jv.dtype == np.float32
+    assert np.allclose(Jv, 0.)
+
+
+#-------------------------------------------------------------------------
+def test_softmax_jacobian_memory():
+    ''' the implicit Jacobian never allocates c^2 values'''
+    import tracemalloc
+    c = 2000
+    a = compute_a(np.asmatrix(np.random.random((c,1))))
+    dL_da = compute_dL_da(a, 3)
+    tracemalloc.start()
+    dL_dz = compute_dL_dz(dL_da, compute_da_dz(a, lazy=True))
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert peak < c * c * 8 / 100
+    assert np.allclose(dL_dz, compute_dL_dz_fused(a, 3), atol = 1e-8)
+
+
+#-------------------------------------------------------------------------
+def test_train_sparse():
+    ''' train and predict on a sparse (CSR) feature matrix'''
+    import scipy.sparse as sp
+    X = sp.random(30, 50, density=0.1, format='csr', random_state=1)
+    Y = np.random.RandomState(1).randint(0,3,30)
+    Xd = np.asmatrix(X.toarray())
+
+    W, b = train(X, Y, alpha=0.1, n_epoch=5)
+    W_true, b_true = train(Xd, Y, alpha=0.1, n_epoch=5)
+    assert type(W) == np.matrixlib.defmatrix.matrix
+    assert W.shape == (3,50)
+    assert np.allclose(W, W_true, atol=1e-8)
+    assert np.allclose(b, b_true, atol=1e-8)
+
+    W, b = train(X, Y, alpha=0.1, n_epoch=5, batch_size=8)
+    W_true, b_true = train(Xd, Y, alpha=0.1, n_epoch=5, batch_size=8)
+    assert np.allclose(W, W_true, atol=1e-8)
+    assert np.allclose(b, b_true, atol=1e-8)
+
+    Yp, P = predict(X, W, b)
+    Yp_true, P_true = predict(Xd, W, b)
+    assert np.allclose(P, P_true)
+    assert np.allclose(Yp, Yp_true)
+
+
+#-------------------------------------------------------------------------
+def test_train_stream(tmp_path):
+    ''' train on a memory-mapped dataset one chunk at a time'''
+    X, y = make_classification(n_samples=50, n_features=5, n_redundant=0, n_informative=4,
+                               n_classes=3, random_state=1)
+    np.save(tmp_path / 'X.npy', X)
+    np.save(tmp_path / 'Y.npy', y)
+    source = (str(tmp_path / 'X.npy'), str(tmp_path / 'Y.npy'))
+
+    W_true, b_true = train(np.asmatrix(X), y, alpha=0.01, n_epoch=3)
+    W, b = train_stream(source, alpha=0.01, n_epoch=3, chunk_size=7)
+    assert type(W) == np.matrixlib.defmatrix.matrix
+    assert W.shape == (3,5)
+    assert np.allclose(W, W_true, atol=1e-8)
+    assert np.allclose(b, b_true, atol=1e-8)
+
+    W_true, b_true = train(np.asmatrix(X), y, alpha=0.1, n_epoch=3, batch_size=5)
+    W, b = train_stream(source, c=3, alpha=0.1, n_epoch=3, batch_size=5, chunk_size=10)
+    assert np.allclose(W, W_true, atol=1e-8)
+    assert np.allclose(b, b_true, atol=1e-8)
+
+
+#-------------------------------------------------------------------------
+def test_train_hogwild():
+    ''' lock-free parallel training (Hogwild)'''
+    X, y = make_classification(n_samples=200, n_features=5, n_redundant=0, n_informative=4,
+                               n_classes=3, random_state=1)
+    X = np.asmatrix(X)
+
+    # a single worker goes through the data in the same order as train()
+    W, b = train_hogwild(X, y, alpha=0.01, n_epoch=3, n_jobs=1)
+    W_true, b_true = train(X, y, alpha=0.01, n_epoch=3)
+    assert type(W) == np.matrixlib.defmatrix.matrix
+    assert W.shape == (3,5)
+    assert b.shape == (3,1)
+    assert np.allclose(W, W_true, atol=1e-8)
+    assert np.allclose(b, b_true, atol=1e-8)
+
+    # several workers updating the shared parameters without locks
+    W, b = train_hogwild(X, y, alpha=0.01, n_epoch=20, n_jobs=2)
+    Y, P = predict(X, W, b)
+    assert np.mean(Y == y) > 0.6
+
+    report = compare_hogwild(X, y, alpha=0.01, n_epoch=2, n_jobs=2)
+    assert set(report) == {'serial_time', 'parallel_time', 'speedup', 'serial_loss', 'parallel_loss'}
+    assert abs(report['serial_loss'] - report['parallel_loss']) < 0.1
+
+
+#-------------------------------------------------------------------------
+def test_train_hashed():
+    ''' train on hashed categorical features'''
+    from hashing import transform, hash_stream
+    colors = ['red', 'green', 'blue']
+    records = [{'color': colors[i % 3], 'id': str(i)} for i in range(60)]
+    y = np.arange(60) % 3
+    X = transform(records, n_features=2**12)
+    assert X.shape == (60, 2**12)
+
+    W, b = train(X, y, alpha=0.1, n_epoch=5)
+    assert W.shape == (3, 2**12)
+    Y, P = predict(X, W, b)
+    assert np.allclose(Y, y)
+
+    source = hash_stream([(records[:30], y[:30]), (records[30:], y[30:])], n_features=2**12)
+    W_s, b_s = train_stream(source, alpha=0.1, n_epoch=5)
+    assert np.allclose(W_s, W)
+    assert np.allclose(b_s, b)
+
+
+#-------------------------------------------------------------------------
+def test_partial_fit():
+    ''' continue training on new batches'''
+    X, y = make_classification(n_samples=60, n_features=5, n_redundant=0, n_informative=4,
+                               n_classes=3, random_state=1)
+    X = np.asmatrix(X)
+
+    # two batches in a row give one epoch of train() on all of them
+    W_true, b_true = train(X, y, alpha=0.01, n_epoch=1)
+    W, b = partial_fit(X[:30], y[:30], alpha=0.01)
+    W, b = partial_fit(X[30:], y[30:], W, b, alpha=0.01)
+    assert type(W) == np.matrixlib.defmatrix.matrix
+    assert W.shape == (3,5)
+    assert np.allclose(W, W_true, atol=1e-8)
+    assert np.allclose(b, b_true, atol=1e-8)
+
+    # a class not seen yet grows the output layer
+    W, b = partial_fit(X[y < 2], y[y < 2], alpha=0.01)
+    assert W.shape == (2,5)
+    assert b.shape == (2,1)
+    W_old = W.copy()
+    W_new, b_new = partial_fit(X, y, W, b, alpha=0.01)
+    assert W_new.shape == (3,5)
+    assert b_new.shape == (3,1)
+    assert np.allclose(W, W_old) # the given parameters are not modified
+
+    # the biases start as 0 when only the weights are given
+    W_true, b_true = partial_fit(X, y, W_old, np.zeros((2,1)), alpha=0.01)
+    W, b = partial_fit(X, y, W_old, alpha=0.01)
+    assert b.shape == (3,1)
+    assert np.allclose(W, W_true) and np.allclose(b, b_true)
+
+    W, b = grow_classes(np.asmatrix(np.ones((2,5))), np.asmatrix(np.ones((2,1))), 4)
+    assert W.shape == (4,5)
+    assert np.allclose(W[2:], 0)
+    assert np.allclose(b[2:], 0)
+    W, b = grow_classes(W, b, 2)
+    assert W.shape == (4,5)
+
+
+#-------------------------------------------------------------------------
+def test_train_early_stopping():
+    ''' stop training once it converges'''
+    from stopping import EarlyStopping
+    X, y = make_classification(n_samples=200, n_features=5, n_redundant=0, n_informative=4,
+                               n_classes=3, random_state=1)
+    X = np.asmatrix(X)
+
+    es = EarlyStopping(tol=1e-3)
+    W, b = train(X, y, alpha=0.01, n_epoch=100, early_stopping=es)
+    assert es.stopped
+    assert es.reason == 'tol'
+    assert es.n_epoch < 100
+    W_true, b_true = train(X, y, alpha=0.01, n_epoch=es.n_epoch)
+    assert np.allclose(W, W_true)
+
+    es = EarlyStopping(tol=1e-3, patience=2, validation=(X[150:], y[150:]))
+    W, b = train(X[:150], y[:150], alpha=0.01, n_epoch=100, early_stopping=es)
+    assert np.isclose(compute_loss(X[150:], y[150:], W, b), min(es.history['val_loss']))
+
+
+#-------------------------------------------------------------------------
+def test_train_compiled():
+    ''' compiled per-sample kernel'''
+    import jit
+    X, y = make_classification(n_samples=100, n_features=5, n_redundant=0, n_informative=4,
+                               n_classes=3, random_state=1)
+    W_true, b_true = train(np.asmatrix(X), y, alpha=0.01, n_epoch=5)
+
+    # the kernel does the same updates in the same order as the Python loop
+    W, b = np.zeros((3,5)), np.zeros(3)
+    for _ in range(5):
+        jit.softmax_epoch(X, y, W, b, 0.01)
+    assert np.allclose(W, W_true, atol=1e-10)
+    assert np.allclose(b, np.asarray(b_true).ravel(), atol=1e-10)
+
+    # compiled if numba is installed, otherwise the Python loop
+    W, b = train(np.asmatrix(X), y, alpha=0.01, n_epoch=5, backend='numba')
+    assert type(W) == np.matrixlib.defmatrix.matrix
+    assert b.shape == (3,1)
+    assert np.allclose(W, W_true, atol=1e-10)
+    assert np.allclose(b, b_true, atol=1e-10)
+
+
+#-------------------------------------------------------------------------
+def test_train_optimizer():
+    ''' train with an optimizer'''
+    X, y = make_classification(n_samples=300, n_features=8, n_redundant=0, n_informative=5,
+                               n_classes=3, random_state=0)
+    X = np.asmatrix(X)
+
+    # optim.SGD is plain gradient descent
+    for batch_size in [1, 10]:
+        W, b = train(X, y, alpha=0.01, n_epoch=3, batch_size=batch_size, optimizer=optim.SGD())
+        W_true, b_true = train(X, y, alpha=0.01, n_epoch=3, batch_size=batch_size)
+        assert type(W) == np.matrixlib.defmatrix.matrix
+        assert np.allclose(W, W_true) and np.allclose(b, b_true)
+
+    # the adaptive methods reach a lower loss in the same number of epochs
+    W, b = train(X, y, alpha=0.001, n_epoch=5)
+    L_sgd = compute_loss(X, y, W, b)
+    for opt in [optim.Momentum(), optim.Momentum(nesterov=True), optim.RMSProp(), optim.Adam()]:
+        W, b = train(X, y, alpha=0.001, n_epoch=5, optimizer=opt)
+        assert compute_loss(X, y, W, b) < L_sgd
+
+    # on sparse data, only the weights of the nonzero features are updated
+    import scipy.sparse as sp
+    Xs = np.asarray(X).copy()
+    Xs[:, 3] = 0.
+    Xs[::2, 5] = 0.
+    opt = optim.Adam()
+    W, b = train(sp.csr_matrix(Xs), y, alpha=0.01, n_epoch=2, optimizer=opt)
+    assert np.allclose(W[:, 3], 0.)
+    assert np.allclose(opt.state['W']['v'][:, 3], 0.)
+    # with dense data, the momentum keeps moving W[:, 5] on the instances where the feature is 0
+    W_true, b_true = train(np.asmatrix(Xs), y, alpha=0.01, n_epoch=2, optimizer=optim.Adam())
+    assert not np.allclose(W[:, 5], W_true[:, 5])
+
+
+#-------------------------------------------------------------------------
+def test_train_schedule():
+    ''' train with a learning-rate schedule'''
+    X, y = make_classification(n_samples=100, n_features=5, n_redundant=0, n_informative=4,
+                               n_classes=3, random_state=0)
+    X = np.asmatrix(X)
+    for batch_size in [1, 10]:
+        # a constant schedule is the same as a constant step-size
+        W, b = train(X, y, alpha=schedules.ExponentialDecay(0.01, gamma=1.), n_epoch=3, batch_size=batch_size)
+        W_true, b_true = train(X, y, alpha=0.01, n_epoch=3, batch_size=batch_size)
+        assert np.allclose(W, W_true) and np.allclose(b, b_true)
+
+        # an epoch schedule is the same as one call of train_pass() per epoch with its step-size
+        W, b = train(X, y, alpha=schedules.StepDecay(0.1, step_size=1, gamma=0.5), n_epoch=3, batch_size=batch_size)
+        W_true, b_true = np.asmatrix(np.zeros((3,5))), np.asmatrix(np.zeros((3,1)))
+        for alpha in [0.1, 0.05, 0.025]:
+            W_true, b_true = train_pass(X, y, W_true, b_true, alpha, batch_size)
+        assert np.allclose(W, W_true) and np.allclose(b, b_true)
+
+    # a step schedule is called once per gradient descent step, and restarted by train()
+    schedule = schedules.InverseTimeDecay(0.1, decay=0.01, unit='step')
+    train(X, y, alpha=schedule, n_epoch=2, batch_size=8)
+    assert schedule.n_step == 2 * 13
+    assert schedule.epoch == 2
+    train(X, y, alpha=schedule, n_epoch=1, batch_size=8)
+    assert schedule.n_step == 13
+
+
+#-------------------------------------------------------------------------
+def test_predict_chunks():
+    ''' chunked and threaded predict'''
+    import scipy.sparse as sp
+    Xtest = np.asmatrix(np.random.randn(103, 6))
+    W = np.asmatrix(np.random.randn(4,6))
+    b = np.asmatrix(np.random.randn(4,1))
+    Y_true, P_true = predict(Xtest, W, b, chunk_size=103)
+    for chunk_size, n_jobs in [(1, 1), (10, 1), (10, 4), (200, 4), (7, None)]:
+        Y, P = predict(Xtest, W, b, chunk_size=chunk_size, n_jobs=n_jobs)
+        assert type(P) == np.matrixlib.defmatrix.matrix
+        assert P.shape == (103,4)
+        assert np.allclose(P, P_true)
+        assert np.allclose(Y, Y_true)
+    Y, P = predict(sp.csr_matrix(Xtest), W, b, chunk_size=10, n_jobs=3)
+    assert np.allclose(P, P_true)
+
+
+#-------------------------------------------------------------------------
+def test_train_step():
+    ''' in-place training step without allocations'''
+    import tracemalloc
+    from workspace import Workspace
+    X, y = make_classification(n_samples=50, n_features=6, n_informative=4, n_classes=3, random_state=1)
+
+    # the same updates as update_W() and update_b()
+    W, b = np.zeros((3,6)), np.zeros((3,1))
+    workspace = Workspace()
+    for x_, y_ in zip(X, y):
+        a = train_step(x_.reshape((-1,1)), y_, W, b, 0.1, workspace)
+    W_true, b_true = train(np.asmatrix(X), y, alpha=0.1, n_epoch=1)
+    assert np.allclose(W, W_true, atol=1e-12)
+    assert np.allclose(b, b_true, atol=1e-12)
+
+    # the given parameters are not modified by train_pass()
+    W_, b_ = train_pass(np.asmatrix(X), y, W_true, b_true, 0.1)
+    assert np.allclose(W_true, W) and not np.allclose(W_, W)
+
+    # once the buffers exist, a step allocates no array of the size of W
+    W, b = np.random.randn(20,1000), np.zeros((20,1))
+    x = np.random.randn(1000,1)
+    train_step(x, 3, W, b, 0.001, workspace)
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    for _ in range(100):
+        train_step(x, 3, W, b, 0.001, workspace)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert peak - start < W.nbytes / 10
+    assert current - start < 1000
+
+
+#-------------------------------------------------------------------------
+def test_backward_workspace():
+    ''' constant local gradients and broadcasting views'''
+    from workspace import Workspace
+    x = np.asmatrix(np.random.random((500,1)))
+    # every row of dz_dW is x^T: a view of x, not a copy
+    dz_dW = compute_dz_dW(x, 20)
+    assert type(dz_dW) == np.matrixlib.defmatrix.matrix
+    assert dz_dW.shape == (20,500)
+    assert np.shares_memory(dz_dW, x)
+    assert not dz_dW.flags.writeable
+    assert np.allclose(dz_dW, np.tile(x.T, (20,1)))
+
+    # the vector of ones is built once per workspace
+    workspace = Workspace()
+    dz_db = compute_dz_db(20, workspace)
+    assert type(dz_db) == np.matrixlib.defmatrix.matrix
+    assert np.allclose(dz_db, np.ones((20,1)))
+    assert np.shares_memory(compute_dz_db(20, workspace), dz_db)
+
+    # the same gradients with or without a workspace
+    W = np.asmatrix(np.random.randn(20,500))
+    b = np.asmatrix(np.random.randn(20,1))
+    z, a, L = forward(x, 3, W, b)
+    gradients = backward(x, 3, a, workspace=workspace)
+    for g, g_true in zip(gradients, backward(x, 3, a)):
+        assert np.allclose(g, g_true)
+    dL_dz = compute_dL_dz(gradients[0], gradients[1])
+    assert np.allclose(compute_dL_dW(dL_dz, gradients[2]), np.dot(dL_dz, x.T))
+
+
+#-------------------------------------------------------------------------
+def test_float32():
+    ''' float32 compute mode'''
+    import scipy.sparse as sp
+    X, y = make_classification(n_samples=200, n_features=6, n_redundant=0, n_informative=4,
+                               n_classes=3, random_state=1)
+    X = np.asmatrix(X)
+    for kwargs in [{}, {'batch_size': 10}, {'optimizer': optim.Adam()}]:
+        W, b = train(X, y, alpha=0.01, n_epoch=3, dtype='float32', **kwargs)
+        W_true, b_true = train(X, y, alpha=0.01, n_epoch=3, **kwargs)
+        for param, param_true in [(W, W_true), (b, b_true)]:
+            assert type(param) == np.matrixlib.defmatrix.matrix
+            assert param.dtype == np.float32 and param_true.dtype == np.float64
+            assert np.allclose(param, param_true, atol=1e-4)
+    W, b = train(sp.csr_matrix(X), y, alpha=0.01, n_epoch=2, dtype=np.float32)
+    assert W.dtype == np.float32 and b.dtype == np.float32
+    # the given float64 parameters are converted, and the new classes keep the dtype
+    W, b = partial_fit(X, y + 1, W_true, b_true, dtype='float32')
+    assert W.shape == (4,6) and W.dtype == np.float32 and b.dtype == np.float32
+    W, b = train_stream((np.asarray(X), y), alpha=0.01, n_epoch=2, chunk_size=50, dtype='float32')
+    assert W.dtype == np.float32 and b.dtype == np.float32
+
+    Y, P = predict(X, W, b)
+    assert type(P) == np.matrixlib.defmatrix.matrix
+    assert P.dtype == np.float32
+    assert np.allclose(P, predict(X, W.astype(float), b.astype(float))[1], atol=1e-5)
+
+    # exp() overflows float32 above 88, so the largest logit is subtracted first
+    z = np.mat([100., 99.], dtype=np.float32).T
+    with np.errstate(all='ignore'):
+        a = compute_a(z)
+    assert a.dtype == np.float32
+    assert np.allclose(a.T, [0.731, 0.269], atol=1e-3)
+    assert np.allclose(z.T, [100., 99.])
+    with np.errstate(all='raise'):
+        a = compute_a(np.mat([200., 10.], dtype=np.float32).T)
+    assert a.dtype == np.float32
+    assert np.allclose(a.T, [1., 0.])
+
+
+#-------------------------------------------------------------------------
+def test_train_pass_array():
+    ''' train_pass on the ndarray engine'''
+    import scipy.sparse as sp
+    X, y = make_classification(n_samples=40, n_features=5, n_redundant=0, n_informative=4,
+                               n_classes=3, random_state=1)
+    W0, b0 = np.asmatrix(np.random.randn(3,5)), np.asmatrix(np.random.randn(3,1))
+    # a new optimizer for each call, so that every call starts from the same state
+    for options in [dict, lambda: {'batch_size': 8}, lambda: {'optimizer': optim.Adam()}]:
+        W_true, b_true = train_pass(np.asmatrix(X), y, W0, b0, 0.1, **options())
+        assert type(W_true) == np.matrixlib.defmatrix.matrix and W_true.shape == (3,5)
+        assert type(b_true) == np.matrixlib.defmatrix.matrix and b_true.shape == (3,1)
+        # plain arrays in any memory layout give the same results, and the given parameters are not modified
+        for X_ in [X, np.asfortranarray(X)]:
+            W, b = train_pass(X_, y, np.asarray(W0), np.asarray(b0), 0.1, **options())
+            assert np.allclose(W, W_true) and np.allclose(b, b_true)
+        W, b = train_pass(sp.csr_matrix(X), y, W0, b0, 0.1, **options())
+        assert np.allclose(W, W_true) and np.allclose(b, b_true)
+    assert np.allclose(forward_array(X, np.asarray(W0), np.asarray(b0).ravel()), compute_a_batch(compute_z_batch(X, W0, b0)))
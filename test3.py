@@ -2,6 +2,8 @@ from neuralnet import *
 import numpy as np
 import sys
 from sklearn.datasets import make_classification
+import optim
+import schedules
 
 '''
     Unit test 3:
@@ -476,3 +478,668 @@ def test_fully_connected():
     print('Test accuracy:', accuracy)
     assert accuracy > 0.9
 
+
+
+#-------------------------------------------------------------------------
+def test_forward_batch():
+    ''' forward_batch and predict match the per-instance forward pass'''
+    for _ in range(20):
+        n = np.random.randint(1,20)
+        p = np.random.randint(2,10)
+        c = np.random.randint(2,10)
+        h = np.random.randint(2,10)
+        X = np.asmatrix(10*np.random.random((n,p))-5)
+        W1 = np.asmatrix(2*np.random.random((h,p))-1)
+        b1 = np.asmatrix(np.random.random((h,1)))
+        W2 = np.asmatrix(2*np.random.random((c,h))-1)
+        b2 = np.asmatrix(np.random.random((c,1)))
+        z1, a1, z2, a2 = forward_batch(X, W1, b1, W2, b2)
+        assert type(a2) == np.matrixlib.defmatrix.matrix
+        assert z1.shape == (n,h)
+        assert a1.shape == (n,h)
+        assert z2.shape == (n,c)
+        assert a2.shape == (n,c)
+        Y, P = predict(X, W1, b1, W2, b2)
+        assert Y.shape == (n,)
+        assert np.allclose(P, a2)
+        for i, x in enumerate(X):
+            z1_i, a1_i, z2_i, a2_i = forward(x.T, W1, b1, W2, b2)
+            assert np.allclose(a1[i].T, a1_i, atol = 1e-8)
+            assert np.allclose(a2[i].T, a2_i, atol = 1e-8)
+            assert Y[i] == np.argmax(a2_i)
+
+
+#-------------------------------------------------------------------------
+def test_compute_gradients_from_dz2():
+    ''' fused softmax + cross entropy gradients'''
+    for _ in range(20):
+        p = np.random.randint(2,10) # number of features
+        c = np.random.randint(2,10) # number of classes
+        h = np.random.randint(2,10) # number of neurons in the 1st layer
+        x = np.asmatrix(10*np.random.random((p,1))-5)
+        y = np.random.randint(c)
+        W1 = np.asmatrix(2*np.random.random((h,p))-1)
+        b1 = np.asmatrix(np.random.random((h,1)))
+        W2 = np.asmatrix(2*np.random.random((c,h))-1)
+        b2 = np.asmatrix(np.random.random((c,1)))
+        z1, a1, z2, a2 = forward(x, W1, b1, W2, b2)
+        dL_da2, da2_dz2, dz2_dW2, dz2_db2, dz2_da1, da1_dz1, dz1_dW1, dz1_db1= backward(x,y,a1,a2, W2)
+
+        gradients_true = compute_gradients(dL_da2, da2_dz2, dz2_dW2, dz2_db2, dz2_da1, da1_dz1, dz1_dW1, dz1_db1)
+        dL_dz2 = sr.compute_dL_dz_fused(a2, y)
+        gradients = compute_gradients_from_dz2(dL_dz2, dz2_dW2, dz2_db2, dz2_da1, da1_dz1, dz1_dW1, dz1_db1)
+        for g, g_true in zip(gradients, gradients_true):
+            assert g.shape == g_true.shape
+            assert np.allclose(g, g_true, atol=1e-8)
+
+
+#-------------------------------------------------------------------------
+def test_compute_da2_dz2_lazy():
+    ''' implicit softmax Jacobian in the 2nd layer'''
+    for _ in range(20):
+        p = np.random.randint(2,10) # number of features
+        c = np.random.randint(2,10) # number of classes
+        h = np.random.randint(2,10) # number of neurons in the 1st layer
+        x = np.asmatrix(10*np.random.random((p,1))-5)
+        y = np.random.randint(c)
+        W1 = np.asmatrix(2*np.random.random((h,p))-1)
+        b1 = np.asmatrix(np.random.random((h,1)))
+        W2 = np.asmatrix(2*np.random.random((c,h))-1)
+        b2 = np.asmatrix(np.random.random((c,1)))
+        z1, a1, z2, a2 = forward(x, W1, b1, W2, b2)
+        assert np.allclose(compute_da2_dz2(a2, lazy=True).todense(), compute_da2_dz2(a2), atol=1e-8)
+
+        gradients_true = compute_gradients(*backward(x,y,a1,a2,W2))
+        gradients = compute_gradients(*backward(x,y,a1,a2,W2,lazy=True))
+        for g, g_true in zip(gradients, gradients_true):
+            assert np.allclose(g, g_true, atol=1e-8)
+
+
+#-------------------------------------------------------------------------
+def test_train_sparse():
+    ''' train and predict on a sparse (CSR) feature matrix'''
+    import scipy.sparse as sp
+    X = sp.random(30, 50, density=0.1, format='csr', random_state=1)
+    Y = np.random.RandomState(1).randint(0,3,30)
+    Xd = np.asmatrix(X.toarray())
+
+    W1, b1, W2, b2 = train(X, Y, h=4, alpha=0.1, n_epoch=5)
+    params_true = train(Xd, Y, h=4, alpha=0.1, n_epoch=5)
+    assert type(W1) == np.matrixlib.defmatrix.matrix
+    assert W1.shape == (4,50)
+    for param, param_true in zip((W1, b1, W2, b2), params_true):
+        assert np.allclose(param, param_true, atol=1e-8)
+
+    Yp, P = predict(X, W1, b1, W2, b2)
+    Yp_true, P_true = predict(Xd, W1, b1, W2, b2)
+    assert np.allclose(P, P_true)
+    assert np.allclose(Yp, Yp_true)
+
+
+#-------------------------------------------------------------------------
+def test_train_stream(tmp_path):
+    ''' train on a memory-mapped dataset one chunk at a time'''
+    X, y = make_classification(n_samples=50, n_features=5, n_redundant=0, n_informative=4,
+                               n_classes=3, random_state=1)
+    np.save(tmp_path / 'X.npy', X)
+    np.save(tmp_path / 'Y.npy', y)
+    source = (str(tmp_path / 'X.npy'), str(tmp_path / 'Y.npy'))
+
+    params_true = train(np.asmatrix(X), y, alpha=0.01, n_epoch=3)
+    params = train_stream(source, alpha=0.01, n_epoch=3, chunk_size=7)
+    assert type(params[0]) == np.matrixlib.defmatrix.matrix
+    assert params[0].shape == (3,5)
+    for param, param_true in zip(params, params_true):
+        assert np.allclose(param, param_true, atol=1e-8)
+
+
+#-------------------------------------------------------------------------
+def test_partial_fit():
+    ''' continue training on new batches'''
+    X, y = make_classification(n_samples=60, n_features=5, n_redundant=0, n_informative=4,
+                               n_classes=3, random_state=1)
+    X = np.asmatrix(X)
+
+    # two calls of one epoch each give two epochs of train()
+    params_true = train(X, y, h=3, alpha=0.01, n_epoch=2)
+    params = partial_fit(X, y, h=3, alpha=0.01)
+    params = partial_fit(X, y, *params, alpha=0.01)
+    for param, param_true in zip(params, params_true):
+        assert np.allclose(param, param_true, atol=1e-8)
+
+    # a class not seen yet grows the output layer
+    W1, b1, W2, b2 = partial_fit(X[y < 2], y[y < 2], h=3, alpha=0.01)
+    assert W2.shape == (2,3)
+    W1, b1, W2, b2 = partial_fit(X, y, W1, b1, W2, b2, alpha=0.01)
+    assert W1.shape == (3,5)
+    assert W2.shape == (3,3)
+    assert b2.shape == (3,1)
+    Y, P = predict(X, W1, b1, W2, b2)
+    assert P.shape == (60,3)
+
+    # the biases start as 0 when only the weights are given, and the weights go together
+    params_true = partial_fit(X, y, W1, np.zeros((3,1)), W2, np.zeros((3,1)), alpha=0.01)
+    params = partial_fit(X, y, W1, W2=W2, alpha=0.01)
+    for param, param_true in zip(params, params_true):
+        assert np.allclose(param, param_true)
+    for kwargs in [{'W1': W1}, {'W2': W2}, {'b1': b1}]:
+        try:
+            partial_fit(X, y, alpha=0.01, **kwargs)
+            assert False
+        except ValueError:
+            pass
+
+
+#-------------------------------------------------------------------------
+def test_train_early_stopping():
+    ''' stop training once it converges'''
+    from stopping import EarlyStopping
+    X, y = make_classification(n_samples=200, n_features=5, n_redundant=0, n_informative=4,
+                               n_classes=3, random_state=1)
+    X = np.asmatrix(X)
+
+    es = EarlyStopping(tol=1e-3)
+    params = train(X, y, h=3, alpha=0.1, n_epoch=100, early_stopping=es)
+    assert es.stopped
+    assert es.n_epoch < 100
+    params_true = train(X, y, h=3, alpha=0.1, n_epoch=es.n_epoch)
+    for param, param_true in zip(params, params_true):
+        assert np.allclose(param, param_true)
+
+    es = EarlyStopping(tol=1e-3, patience=2, validation=(X[150:], y[150:]))
+    params = train(X[:150], y[:150], h=3, alpha=0.1, n_epoch=100, early_stopping=es)
+    assert np.isclose(compute_loss(X[150:], y[150:], *params), min(es.history['val_loss']))
+
+    # gtol cannot be combined with an adaptive optimizer
+    for trainer in [train, train_parallel]:
+        try:
+            trainer(X, y, h=3, alpha=0.1, n_epoch=10, early_stopping=EarlyStopping(gtol=1e-3), optimizer=optim.Adam())
+            assert False
+        except ValueError:
+            pass
+
+
+#-------------------------------------------------------------------------
+def test_train_compiled():
+    ''' compiled per-sample kernel'''
+    import jit
+    X, y = make_classification(n_samples=100, n_features=5, n_redundant=0, n_informative=4,
+                               n_classes=3, random_state=1)
+    params_true = train(np.asmatrix(X), y, h=4, alpha=0.1, n_epoch=5)
+
+    # the kernel does the same updates in the same order as the Python loop
+    params = [np.zeros((4,5)), np.zeros(4), np.zeros((3,4)), np.zeros(3)]
+    for _ in range(5):
+        jit.neuralnet_epoch(X, y, *params, 0.1)
+    for param, param_true in zip(params, params_true):
+        assert np.allclose(param, np.asarray(param_true).reshape(param.shape), atol=1e-10)
+
+    # compiled if numba is installed, otherwise the Python loop
+    params = train(np.asmatrix(X), y, h=4, alpha=0.1, n_epoch=5, backend='numba')
+    assert params[1].shape == (4,1)
+    for param, param_true in zip(params, params_true):
+        assert type(param) == np.matrixlib.defmatrix.matrix
+        assert np.allclose(param, param_true, atol=1e-10)
+
+
+#-------------------------------------------------------------------------
+def test_compute_gradients_fused():
+    ''' single-pass fused back propagation'''
+    for _ in range(20):
+        p = np.random.randint(2,10) # number of features
+        c = np.random.randint(2,10) # number of classes
+        h = np.random.randint(2,10) # number of neurons in the 1st layer
+        x = np.asmatrix(10*np.random.random((p,1))-5)
+        y = np.random.randint(c)
+        W1 = np.asmatrix(2*np.random.random((h,p))-1)
+        b1 = np.asmatrix(np.random.random((h,1)))
+        W2 = np.asmatrix(2*np.random.random((c,h))-1)
+        b2 = np.asmatrix(np.random.random((c,1)))
+        z1, a1, z2, a2 = forward(x, W1, b1, W2, b2)
+        gradients_true = compute_gradients(*backward(x,y,a1,a2, W2))
+
+        gradients = compute_gradients_fused(x, y, a1, a2, W2)
+        for g, g_true in zip(gradients, gradients_true):
+            assert type(g) == np.matrixlib.defmatrix.matrix
+            assert g.shape == g_true.shape
+            assert np.allclose(g, g_true, atol=1e-8)
+
+        # the same on plain arrays
+        gradients = compute_gradients_fused(np.asarray(x), y, np.asarray(a1), np.asarray(a2), np.asarray(W2))
+        for g, g_true in zip(gradients, gradients_true):
+            assert type(g) == np.ndarray
+            assert np.allclose(g, g_true, atol=1e-8)
+
+
+#-------------------------------------------------------------------------
+def test_train_batch():
+    ''' mini-batch forward and backward passes'''
+    X, y = make_classification(n_samples=40, n_features=6, n_redundant=0, n_informative=4,
+                               n_classes=3, random_state=1)
+    X = np.asmatrix(X)
+    W1 = np.asmatrix(np.random.randn(5,6))
+    b1 = np.asmatrix(np.random.randn(5,1))
+    W2 = np.asmatrix(np.random.randn(3,5))
+    b2 = np.asmatrix(np.random.randn(3,1))
+
+    # the batch gradients are the average of the per-instance gradients
+    z1, a1, z2, a2 = forward_batch(X, W1, b1, W2, b2)
+    gradients = compute_gradients_batch(X, y, a1, a2, W2)
+    gradients_true = [0., 0., 0., 0.]
+    for i in range(40):
+        x = X[i].T
+        z1, a1, z2, a2 = forward(x, W1, b1, W2, b2)
+        gradients_i = compute_gradients_fused(x, y[i], a1, a2, W2)
+        gradients_true = [g + g_i / 40 for g, g_i in zip(gradients_true, gradients_i)]
+    for g, g_true in zip(gradients, gradients_true):
+        assert type(g) == np.matrixlib.defmatrix.matrix
+        assert g.shape == g_true.shape
+        assert np.allclose(g, g_true, atol=1e-8)
+
+    # batch_size=1 is the per-instance path
+    params = train(X, y, h=4, alpha=0.1, n_epoch=3, batch_size=1)
+    params_true = train(X, y, h=4, alpha=0.1, n_epoch=3)
+    for param, param_true in zip(params, params_true):
+        assert np.allclose(param, param_true)
+
+    # one block of all the instances is one step of gradient descent
+    W1_new, b1_new, W2_new, b2_new = train_pass(X, y, W1, b1, W2, b2, alpha=0.1, batch_size=40)
+    assert np.allclose(W1_new, W1 - 0.1 * gradients[2])
+    assert np.allclose(b1_new, b1 - 0.1 * gradients[3])
+    assert np.allclose(W2_new, W2 - 0.1 * gradients[0])
+    assert np.allclose(b2_new, b2 - 0.1 * gradients[1])
+
+    params = train(X, y, h=4, alpha=0.1, n_epoch=5, batch_size=8)
+    assert params[0].shape == (4,6)
+    assert params[2].shape == (3,4)
+
+#-------------------------------------------------------------------------
+def test_activations():
+    ''' relu, leaky relu and tanh in the 1st layer'''
+    z1 = np.mat([-2., -0.5, 0.5, 2.]).T
+    assert np.allclose(compute_a1(z1, 'relu').T, [0., 0., .5, 2.])
+    assert np.allclose(compute_a1(z1, 'leaky_relu').T, [-.02, -.005, .5, 2.])
+    assert np.allclose(compute_a1(z1, 'tanh').T, np.tanh([-2., -.5, .5, 2.]))
+    for activation in ['sigmoid', 'relu', 'leaky_relu', 'tanh']:
+        a1 = compute_a1(z1, activation)
+        assert type(a1) == np.matrixlib.defmatrix.matrix
+        da1_dz1 = compute_da1_dz1(a1, activation)
+        assert type(da1_dz1) == np.matrixlib.defmatrix.matrix
+        assert da1_dz1.shape == (4,1)
+        assert np.allclose(da1_dz1, check_da1_dz1(z1, activation=activation), atol=1e-5)
+        # the batch activations are the same as the per-instance ones
+        assert np.allclose(compute_a1_batch(z1.T, activation), a1.T)
+
+    # gradient checking of the whole network
+    for activation in ['relu', 'leaky_relu', 'tanh']:
+        for _ in range(5):
+            p, c, h = np.random.randint(2,10), np.random.randint(2,10), np.random.randint(2,10)
+            x = np.asmatrix(10*np.random.random((p,1))-5)
+            y = np.random.randint(c)
+            W1 = np.asmatrix(2*np.random.random((h,p))-1)
+            b1 = np.asmatrix(np.random.random((h,1)))
+            W2 = np.asmatrix(2*np.random.random((c,h))-1)
+            b2 = np.asmatrix(np.random.random((c,1)))
+            z1, a1, z2, a2 = forward(x, W1, b1, W2, b2, activation)
+            dL_dW2, dL_db2, dL_dW1, dL_db1 = compute_gradients_fused(x, y, a1, a2, W2, activation)
+            assert np.allclose(dL_dW2, check_dL_dW2(x,y, W1,b1,W2,b2, activation=activation), atol=1e-4)
+            assert np.allclose(dL_dW1, check_dL_dW1(x,y, W1,b1,W2,b2, activation=activation), atol=1e-4)
+
+    # per-sample and mini-batch training
+    X, y = make_classification(n_samples=200, n_features=5, n_redundant=0, n_informative=4,
+                               n_classes=3, class_sep=2., random_state=1)
+    X = np.asmatrix(X)
+    rng = np.random.RandomState(0)
+    params = (np.asmatrix(0.5 * rng.randn(8,5)), np.asmatrix(np.zeros((8,1))),
+              np.asmatrix(0.5 * rng.randn(3,8)), np.asmatrix(np.zeros((3,1))))
+    for activation in ['relu', 'leaky_relu', 'tanh']:
+        for batch_size in [1, 10]:
+            W1, b1, W2, b2 = partial_fit(X, y, *params, alpha=0.05, n_epoch=20, batch_size=batch_size, activation=activation)
+            Y, P = predict(X, W1, b1, W2, b2, activation)
+            assert np.mean(Y == y) > 0.8
+            assert compute_loss(X, y, W1, b1, W2, b2, activation) < compute_loss(X, y, *params, activation=activation)
+
+
+#-------------------------------------------------------------------------
+def test_train_optimizer():
+    ''' train with an optimizer'''
+    X, y = make_classification(n_samples=300, n_features=8, n_redundant=0, n_informative=5,
+                               n_classes=3, random_state=0)
+    X = np.asmatrix(X)
+    for batch_size in [1, 10]:
+        params = train(X, y, h=4, alpha=0.01, n_epoch=3, batch_size=batch_size, optimizer=optim.SGD())
+        params_true = train(X, y, h=4, alpha=0.01, n_epoch=3, batch_size=batch_size)
+        for param, param_true in zip(params, params_true):
+            assert type(param) == np.matrixlib.defmatrix.matrix
+            assert np.allclose(param, param_true)
+
+    # Adam reaches a much lower loss than gradient descent with the same step-size
+    params = train(X, y, h=4, alpha=0.01, n_epoch=10)
+    params_adam = train(X, y, h=4, alpha=0.01, n_epoch=10, optimizer=optim.Adam())
+    assert compute_loss(X, y, *params_adam) < compute_loss(X, y, *params) - 0.2
+
+
+#-------------------------------------------------------------------------
+def test_train_schedule():
+    ''' train with a learning-rate schedule'''
+    X, y = make_classification(n_samples=300, n_features=8, n_redundant=0, n_informative=5,
+                               n_classes=3, random_state=0)
+    X = np.asmatrix(X)
+    params = train(X, y, h=4, alpha=schedules.ExponentialDecay(0.01, gamma=1., unit='step'), n_epoch=2)
+    params_true = train(X, y, h=4, alpha=0.01, n_epoch=2)
+    for param, param_true in zip(params, params_true):
+        assert np.allclose(param, param_true)
+
+    # starting large and decaying beats the small constant step-size
+    params_true = train(X, y, h=4, alpha=0.01, n_epoch=10)
+    for schedule in [schedules.InverseTimeDecay(0.5, decay=0.5), schedules.CosineRestarts(0.5, period=5),
+                     schedules.OneCycle(0.5, total=10*300)]:
+        params = train(X, y, h=4, alpha=schedule, n_epoch=10)
+        assert compute_loss(X, y, *params) < compute_loss(X, y, *params_true) - 0.3
+
+
+#-------------------------------------------------------------------------
+def test_initialize():
+    ''' random initialization'''
+    W1, b1, W2, b2 = initialize(50, 40, 3)
+    assert np.allclose(W1, 0) and np.allclose(W2, 0)
+    for init in ['uniform', 'xavier', 'he']:
+        W1, b1, W2, b2 = initialize(50, 40, 3, init, seed=1)
+        assert type(W1) == np.matrixlib.defmatrix.matrix
+        assert W1.shape == (40,50) and b1.shape == (40,1) and W2.shape == (3,40) and b2.shape == (3,1)
+        assert np.allclose(b1, 0) and np.allclose(b2, 0)
+        # the same seed gives the same weights
+        W1_, b1_, W2_, b2_ = initialize(50, 40, 3, init, seed=1)
+        assert np.allclose(W1, W1_) and np.allclose(W2, W2_)
+        assert not np.allclose(W1, initialize(50, 40, 3, init, seed=2)[0])
+    # the scale of the weights
+    assert np.max(np.abs(initialize(50, 40, 3, 'uniform', seed=1)[0])) <= 1. / np.sqrt(50)
+    assert np.max(np.abs(initialize(50, 40, 3, 'xavier', seed=1)[0])) <= np.sqrt(6. / 90)
+    assert np.allclose(np.std(initialize(50, 40, 3, 'he', seed=1)[0]), np.sqrt(2. / 50), rtol=0.1)
+
+    # the default scheme follows the activation: relu, leaky_relu and tanh start from random weights
+    for activation, init in [('sigmoid', 'zeros'), ('relu', 'he'), ('leaky_relu', 'he'), ('tanh', 'xavier')]:
+        assert get_init(None, activation) == init
+        assert get_init('uniform', activation) == 'uniform'
+        for param, param_true in zip(initialize(50, 40, 3, seed=1, activation=activation), initialize(50, 40, 3, init, seed=1)):
+            assert np.allclose(param, param_true)
+        assert np.allclose(init_weights(40, 50, seed=1, activation=activation), init_weights(40, 50, init, seed=1))
+    for init, activation in [(None, 'unknown'), ('zeros', 'relu'), ('zeros', 'tanh')]:
+        try:
+            get_init(init, activation)
+            assert False
+        except ValueError:
+            pass
+
+    # the hidden layer of relu and tanh learns with the default initialization, and a dead one is rejected
+    X, y = make_classification(n_samples=100, n_features=5, n_redundant=0, n_informative=4,
+                               n_classes=3, random_state=0)
+    for activation in ['relu', 'leaky_relu', 'tanh']:
+        W1_0, b1_0, W2_0, b2_0 = initialize(5, 3, 3, seed=0, activation=activation)
+        W1, b1, W2, b2 = train(X, y, h=3, activation=activation, n_epoch=5, alpha=0.1, seed=0)
+        assert not np.allclose(W1, W1_0) and not np.allclose(b1, 0)
+        assert not np.allclose(W1, W1[0])
+        for trainer in [lambda: train(X, y, h=3, activation=activation, init='zeros'),
+                        lambda: partial_fit(X, y, h=3, activation=activation, init='zeros'),
+                        lambda: train_stream((X, y), h=3, activation=activation, init='zeros'),
+                        lambda: train_parallel(X, y, h=3, n_jobs=2, activation=activation, init='zeros')]:
+            try:
+                trainer()
+                assert False
+            except ValueError:
+                pass
+
+    # with zero weights all the hidden neurons stay the same, random weights break the symmetry
+    X, y = make_classification(n_samples=400, n_features=10, n_redundant=0, n_informative=6,
+                               n_classes=4, class_sep=1.5, random_state=0)
+    X = np.asmatrix(X)
+    W1, b1, W2, b2 = train(X, y, h=8, alpha=0.05, n_epoch=10)
+    assert np.allclose(W1, W1[0])
+    Y, P = predict(X, W1, b1, W2, b2)
+    accuracy_zeros = np.mean(Y == y)
+    for init in ['uniform', 'xavier', 'he']:
+        W1, b1, W2, b2 = train(X, y, h=8, alpha=0.05, n_epoch=10, init=init, seed=0)
+        assert not np.allclose(W1, W1[0])
+        Y, P = predict(X, W1, b1, W2, b2)
+        assert np.mean(Y == y) > accuracy_zeros + 0.2
+        params = train(X, y, h=8, alpha=0.05, n_epoch=10, init=init, seed=0)
+        for param, param_ in zip(params, (W1, b1, W2, b2)):
+            assert np.allclose(param, param_)
+
+
+#-------------------------------------------------------------------------
+def test_train_parallel():
+    ''' synchronous data-parallel training'''
+    X, y = make_classification(n_samples=200, n_features=6, n_redundant=0, n_informative=4,
+                               n_classes=3, random_state=1)
+    X = np.asmatrix(X)
+
+    # the flat parameter vector
+    params = initialize(6, 4, 3, 'xavier', seed=0)
+    theta = pack_params(params)
+    assert theta.shape == (4*6 + 4 + 3*4 + 3,)
+    for param, param_ in zip(params, unpack_params(theta, 6, 4, 3)):
+        assert type(param_) == np.matrixlib.defmatrix.matrix
+        assert param_.shape == param.shape
+        assert np.allclose(param, param_)
+
+    # the same steps as single-process mini-batch training, with shards of different sizes and with more workers than rows
+    params_true = train(X, y, h=4, alpha=0.1, n_epoch=5, batch_size=30, init='xavier', seed=0)
+    for n_jobs in [1, 3, 40]:
+        params = train_parallel(X, y, h=4, alpha=0.1, n_epoch=5, batch_size=30, n_jobs=n_jobs, init='xavier', seed=0)
+        for param, param_true in zip(params, params_true):
+            assert type(param) == np.matrixlib.defmatrix.matrix
+            assert param.shape == param_true.shape
+            assert np.allclose(param, param_true, atol=1e-10)
+
+    # deterministic, and the optimizer updates in the parent process
+    params_true = train(X, y, h=4, alpha=0.01, n_epoch=3, batch_size=50, optimizer=optim.Adam(), activation='tanh', init='he', seed=2)
+    for _ in range(2):
+        params = train_parallel(X, y, h=4, alpha=0.01, n_epoch=3, batch_size=50, n_jobs=2, optimizer=optim.Adam(), activation='tanh', init='he', seed=2)
+        for param, param_true in zip(params, params_true):
+            assert np.allclose(param, param_true, atol=1e-10)
+
+    # the arguments are checked before the workers are started, as in train()
+    for kwargs in [{'activation': 'unknown'}, {'init': 'unknown'}]:
+        try:
+            train_parallel(X, y, h=4, n_epoch=1, n_jobs=2, **kwargs)
+            assert False
+        except ValueError:
+            pass
+
+    # a worker killed by a signal (for example by the out-of-memory killer) stops the training instead of hanging it
+    import os, signal, multiprocessing
+    class KillWorker:
+        ''' a constant step-size that sends a signal to a worker process at the second step'''
+        last = 0.1
+        def __init__(self, sig):
+            self.sig = sig
+            self.n_steps = 0
+        def __call__(self):
+            self.n_steps += 1
+            if self.n_steps == 2:
+                os.kill(multiprocessing.active_children()[0].pid, self.sig)
+            return self.last
+        def reset(self):
+            pass
+        def end_epoch(self):
+            pass
+    # a stopped worker is still running, so the training stops after the timeout
+    for sig in [signal.SIGKILL, signal.SIGSTOP]:
+        try:
+            train_parallel(X, y, h=4, alpha=KillWorker(sig), n_epoch=1, batch_size=30, n_jobs=2, timeout=1.)
+            assert False
+        except RuntimeError:
+            pass
+        assert multiprocessing.active_children() == []
+
+
+#-------------------------------------------------------------------------
+def test_predict_chunks():
+    ''' chunked and threaded predict'''
+    import scipy.sparse as sp
+    Xtest = np.asmatrix(np.random.randn(103, 6))
+    W1, b1, W2, b2 = initialize(6, 5, 4, 'xavier', seed=0)
+    b1 = np.asmatrix(np.random.randn(5,1))
+    Y_true, P_true = predict(Xtest, W1, b1, W2, b2, chunk_size=103)
+    for chunk_size, n_jobs in [(1, 1), (10, 1), (10, 4), (200, 4), (7, None)]:
+        Y, P = predict(Xtest, W1, b1, W2, b2, chunk_size=chunk_size, n_jobs=n_jobs)
+        assert type(P) == np.matrixlib.defmatrix.matrix
+        assert P.shape == (103,4)
+        assert np.allclose(P, P_true)
+        assert np.allclose(Y, Y_true)
+    Y, P = predict(sp.csr_matrix(Xtest), W1, b1, W2, b2, 'relu', chunk_size=10, n_jobs=3)
+    assert np.allclose(P, predict(Xtest, W1, b1, W2, b2, 'relu')[1])
+
+    # the same as the per-instance forward pass
+    for i in range(0, 103, 17):
+        z1, a1, z2, a2 = forward(Xtest[i].T, W1, b1, W2, b2)
+        assert np.allclose(P_true[i].T, a2)
+
+
+#-------------------------------------------------------------------------
+def test_train_step():
+    ''' in-place training step without allocations'''
+    import tracemalloc
+    from workspace import Workspace
+    X, y = make_classification(n_samples=50, n_features=6, n_redundant=0, n_informative=4,
+                               n_classes=3, random_state=1)
+    for activation in ['sigmoid', 'relu', 'leaky_relu', 'tanh']:
+        # the same updates as forward(), compute_gradients_fused() and softmax.update_W()
+        params = [np.array(param) for param in initialize(6, 4, 3, 'xavier', seed=0)]
+        workspace = Workspace()
+        for x_, y_ in zip(X, y):
+            a2 = train_step(x_.reshape((-1,1)), y_, *params, 0.1, workspace, activation)
+        params_true = train(np.asmatrix(X), y, h=4, alpha=0.1, n_epoch=1, activation=activation, init='xavier', seed=0)
+        for param, param_true in zip(params, params_true):
+            assert np.allclose(param, param_true, atol=1e-12)
+
+        # once the buffers exist, a step allocates no array of the size of the parameters
+        W1, b1 = 0.05 * np.random.randn(20,1000), np.zeros((20,1))
+        W2, b2 = 0.1 * np.random.randn(5,20), np.zeros((5,1))
+        x = np.random.randn(1000,1)
+        train_step(x, 2, W1, b1, W2, b2, 0.001, workspace, activation)
+        tracemalloc.start()
+        start = tracemalloc.get_traced_memory()[0]
+        for _ in range(100):
+            train_step(x, 2, W1, b1, W2, b2, 0.001, workspace, activation)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        assert peak - start < W1.nbytes / 10
+        assert current - start < 1000
+
+    # the out= forms give the same values as the allocating forms
+    z1 = np.asmatrix(np.random.randn(7,1))
+    for activation in ['sigmoid', 'relu', 'leaky_relu', 'tanh']:
+        a1 = compute_a1(z1, activation)
+        out = np.empty((7,1))
+        assert compute_a1(z1, activation, out) is out
+        assert np.allclose(out, a1)
+        assert compute_da1_dz1(a1, activation, out) is out
+        assert np.allclose(out, compute_da1_dz1(a1, activation))
+    out = np.empty((7,1))
+    assert compute_a2(z1, out) is out
+    assert np.allclose(out, compute_a2(z1))
+
+
+#-------------------------------------------------------------------------
+def test_backward_workspace():
+    ''' constant local gradients and broadcasting views'''
+    from workspace import Workspace
+    x = np.asmatrix(np.random.randn(6,1))
+    W1, b1, W2, b2 = initialize(6, 4, 3, 'xavier', seed=0)
+    z1, a1, z2, a2 = forward(x, W1, b1, W2, b2)
+    workspace = Workspace()
+    gradients = backward(x, 1, a1, a2, W2, workspace=workspace)
+    dL_da2, da2_dz2, dz2_dW2, dz2_db2, dz2_da1, da1_dz1, dz1_dW1, dz1_db1 = gradients
+
+    # the replicated local gradients are views of a1 and x
+    assert np.shares_memory(dz2_dW2, a1) and dz2_dW2.shape == (3,4)
+    assert np.shares_memory(dz1_dW1, x) and dz1_dW1.shape == (4,6)
+    # the vectors of ones come from the workspace
+    assert np.shares_memory(dz1_db1, workspace.constant((4,1)))
+    assert np.shares_memory(dz2_db2, workspace.constant((3,1)))
+
+    for g, g_true in zip(compute_gradients(*gradients), compute_gradients(*backward(x, 1, a1, a2, W2))):
+        assert type(g) == np.matrixlib.defmatrix.matrix
+        assert np.allclose(g, g_true)
+
+
+#-------------------------------------------------------------------------
+def test_float32():
+    ''' float32 compute mode'''
+    import scipy.sparse as sp
+    import config
+    X, y = make_classification(n_samples=200, n_features=6, n_redundant=0, n_informative=4,
+                               n_classes=3, random_state=1)
+    X = np.asmatrix(X)
+    for kwargs in [{}, {'batch_size': 10}, {'optimizer': optim.Adam()}, {'activation': 'relu'}]:
+        params = train(X, y, h=5, alpha=0.01, n_epoch=3, init='xavier', seed=0, dtype='float32', **kwargs)
+        params_true = train(X, y, h=5, alpha=0.01, n_epoch=3, init='xavier', seed=0, **kwargs)
+        for param, param_true in zip(params, params_true):
+            assert type(param) == np.matrixlib.defmatrix.matrix
+            assert param.dtype == np.float32 and param_true.dtype == np.float64
+            assert np.allclose(param, param_true, atol=1e-4)
+    params = train(sp.csr_matrix(X), y, h=5, n_epoch=2, dtype=np.float32)
+    assert all(param.dtype == np.float32 for param in params)
+    params = partial_fit(X, y, *params_true, dtype='float32')
+    assert all(param.dtype == np.float32 for param in params)
+    params = train_stream((np.asarray(X), y), h=5, n_epoch=2, chunk_size=50, init='xavier', seed=0, dtype='float32')
+    assert all(param.dtype == np.float32 for param in params)
+    params_true = train(X, y, h=5, alpha=0.01, n_epoch=3, batch_size=20, init='xavier', seed=0, dtype='float32')
+    params = train_parallel(X, y, h=5, alpha=0.01, n_epoch=3, batch_size=20, n_jobs=2, init='xavier', seed=0, dtype='float32')
+    for param, param_true in zip(params, params_true):
+        assert param.dtype == np.float32
+        assert np.allclose(param, param_true, atol=1e-5)
+
+    Y, P = predict(X, *params)
+    assert type(P) == np.matrixlib.defmatrix.matrix
+    assert P.dtype == np.float32
+    assert np.allclose(P, predict(X, *[param.astype(float) for param in params])[1], atol=1e-5)
+
+    # the global dtype applies to the calls without their own dtype
+    config.set_dtype('float32')
+    try:
+        assert all(param.dtype == np.float32 for param in train(X, y, h=5, n_epoch=1))
+        assert all(param.dtype == np.float32 for param in train_parallel(X, y, h=5, n_epoch=1, n_jobs=2))
+        assert all(param.dtype == np.float64 for param in train(X, y, h=5, n_epoch=1, dtype='float64'))
+    finally:
+        config.set_dtype(None)
+    assert all(param.dtype == np.float64 for param in train(X, y, h=5, n_epoch=1))
+
+    # exp() overflows float32 above 88: the activations stay finite and keep the dtype
+    z1 = np.mat([-95., 95., 0.], dtype=np.float32).T
+    for errors in ['ignore', 'raise']:
+        with np.errstate(all=errors):
+            a1 = compute_a1(z1)
+            a2 = compute_a2(np.mat([100., 99.], dtype=np.float32).T)
+        assert a1.dtype == np.float32 and a2.dtype == np.float32
+        assert np.allclose(a1.T, [0., 1., 0.5])
+        assert np.allclose(a2.T, [0.731, 0.269], atol=1e-3)
+
+
+#-------------------------------------------------------------------------
+def test_train_pass_array():
+    ''' train_pass on the ndarray engine'''
+    import scipy.sparse as sp
+    X, y = make_classification(n_samples=40, n_features=5, n_redundant=0, n_informative=4,
+                               n_classes=3, random_state=1)
+    params0 = initialize(5, 4, 3, init='xavier', seed=1)
+    # a new optimizer for each call, so that every call starts from the same state
+    for options in [dict, lambda: {'batch_size': 8}, lambda: {'optimizer': optim.Adam()}, lambda: {'activation': 'relu', 'batch_size': 8}]:
+        params_true = train_pass(np.asmatrix(X), y, *params0, alpha=0.1, **options())
+        for param, param0 in zip(params_true, params0):
+            assert type(param) == np.matrixlib.defmatrix.matrix and param.shape == param0.shape
+        # plain arrays in any memory layout give the same results, and the given parameters are not modified
+        for X_ in [X, np.asfortranarray(X), sp.csr_matrix(X)]:
+            params = train_pass(X_, y, *[np.asarray(param) for param in params0], alpha=0.1, **options())
+            for param, param_true in zip(params, params_true):
+                assert np.allclose(param, param_true)
+    W1, b1, W2, b2 = params0
+    a1, a2 = forward_array(X, np.asarray(W1), np.asarray(b1).ravel(), np.asarray(W2), np.asarray(b2).ravel())
+    assert np.allclose(a2, forward_batch(X, *params0)[3])
+    # the mini-batch gradients of the engine are the ones of compute_gradients_batch()
+    z1, a1, z2, a2 = forward_batch(X, *params0)
+    grads = compute_gradients_array(X, y, np.asarray(a1), np.array(a2), np.asarray(W2))
+    for grad, grad_true in zip(grads, compute_gradients_batch(np.asmatrix(X), y, a1, a2, W2)):
+        assert np.allclose(np.asarray(grad).ravel(), np.asarray(grad_true).ravel())
@@ -0,0 +1,448 @@
+from stream import *
+from parallel import *
+from hashing import *
+from stopping import *
+from optim import *
+from schedules import *
+from workspace import *
+from config import *
+from engine import *
+import numpy as np
+import sys
+
+'''
+    Unit test 4
+    This file includes unit tests for the shared training utilities (streaming data sources, parallel training, feature hashing, early stopping, ...).
+    You could test the correctness of your code by typing `nosetests -v test4.py` in the terminal.
+'''
+#-------------------------------------------------------------------------
+def test_python_version():
+    ''' ----------- Utilities --------------'''
+    assert sys.version_info[0]==3 # require python 3 (instead of python 2)
+
+
+#-------------------------------------------------------------------------
+def test_iter_chunks(tmp_path):
+    ''' iter_chunks'''
+    X = np.random.random((10,3))
+    Y = np.arange(10) % 3
+
+    # a pair of arrays
+    chunks = list(iter_chunks((X, Y), chunk_size=4))
+    assert len(chunks) == 3
+    assert [Xc.shape for Xc, Yc in chunks] == [(4,3), (4,3), (2,3)]
+    assert type(chunks[0][0]) == np.matrixlib.defmatrix.matrix
+    assert np.allclose(np.vstack([Xc for Xc, Yc in chunks]), X)
+    assert np.allclose(np.hstack([Yc for Xc, Yc in chunks]), Y)
+
+    # a pair of .npy files
+    np.save(tmp_path / 'X.npy', X)
+    np.save(tmp_path / 'Y.npy', Y)
+    Xm, Ym = load_npy(str(tmp_path / 'X.npy'), str(tmp_path / 'Y.npy'))
+    assert isinstance(Xm, np.memmap)
+    chunks = list(iter_chunks((str(tmp_path / 'X.npy'), str(tmp_path / 'Y.npy')), chunk_size=4))
+    assert len(chunks) == 3
+    assert np.allclose(np.vstack([Xc for Xc, Yc in chunks]), X)
+
+    # float32 chunks stay float32, integer features become float64
+    np.save(tmp_path / 'X32.npy', X.astype(np.float32))
+    chunks = list(iter_chunks((str(tmp_path / 'X32.npy'), str(tmp_path / 'Y.npy')), chunk_size=4))
+    assert all(Xc.dtype == np.float32 for Xc, Yc in chunks)
+    assert next(iter_chunks((np.arange(6).reshape(3,2), Y[:3])))[0].dtype == np.float64
+
+    # a list of chunks, and a function returning chunks
+    blocks = [(X[:5], Y[:5]), (X[5:], Y[5:])]
+    assert len(list(iter_chunks(blocks))) == 2
+    assert len(list(iter_chunks(lambda: iter(blocks)))) == 2
+
+    # a one-shot iterator cannot be read once per epoch
+    try:
+        list(iter_chunks(iter(blocks)))
+        assert False
+    except ValueError:
+        pass
+
+    assert count_classes((X, Y)) == 3
+    assert count_classes(blocks) == 3
+
+
+#-------------------------------------------------------------------------
+def test_shared():
+    ''' shared memory and shards'''
+    assert split_rows(10, 3) == [(0,3), (3,6), (6,10)]
+    assert split_rows(2, 4) == [(0,1), (1,2)]
+    assert get_n_jobs(0) == 1
+    assert get_n_jobs(None) >= 1
+
+    shm, arr = create_shared((2,3))
+    try:
+        assert np.allclose(arr, 0)
+        shm2, arr2 = attach_shared(shm.name, (2,3))
+        arr2[1,2] = 5.
+        assert arr[1,2] == 5.
+        del arr2
+        shm2.close()
+    finally:
+        del arr
+        shm.close()
+        shm.unlink()
+
+
+#-------------------------------------------------------------------------
+def sleep_worker(seconds):
+    import time
+    time.sleep(seconds)
+
+def test_start_workers(monkeypatch):
+    ''' a worker that cannot be started stops the ones already started'''
+    import parallel
+    import multiprocessing
+    import types
+    ctx = parallel.get_context()
+    class FailingProcess(ctx.Process):
+        def start(self):
+            if self._args == (None,):
+                raise OSError('fork failed')
+            super().start()
+    monkeypatch.setattr(parallel, 'get_context', lambda: types.SimpleNamespace(Process=FailingProcess))
+    try:
+        start_workers(sleep_worker, [(60,), (60,), (None,), (60,)])
+        assert False
+    except OSError:
+        pass
+    assert multiprocessing.active_children() == []
+
+    workers = start_workers(sleep_worker, [(0,), (0,)])
+    assert all(worker.daemon for worker in workers)
+    join_workers(workers)
+
+
+#-------------------------------------------------------------------------
+def test_map_chunks():
+    ''' process the rows in blocks on a pool of threads'''
+    for n, chunk_size, n_jobs in [(0, 4, 2), (10, 3, 1), (10, 3, 4), (10, 20, 4), (1000, 7, None)]:
+        out = np.zeros(n)
+        blocks = []
+        def score(lo, hi):
+            assert hi - lo <= chunk_size
+            blocks.append((lo, hi))
+            out[lo:hi] += np.arange(lo, hi)
+        map_chunks(score, n, chunk_size, n_jobs)
+        assert np.allclose(out, np.arange(n))
+        assert len(blocks) == -(-n // chunk_size)
+
+    # an error in a block is raised in the caller
+    def fail(lo, hi):
+        raise ValueError
+    try:
+        map_chunks(fail, 10, 3, 2)
+        assert False
+    except ValueError:
+        pass
+
+
+#-------------------------------------------------------------------------
+def test_workspace():
+    ''' reusable buffers'''
+    workspace = Workspace()
+    a = workspace.get('a', (3,4))
+    assert a.shape == (3,4)
+    assert workspace.get('a', (3,4)) is a
+    assert workspace.get('b', (2,1)) is not a
+    assert workspace.nbytes() == 14 * 8
+    # a new shape replaces the buffer
+    a2 = workspace.get('a', (5,4))
+    assert a2.shape == (5,4)
+    assert workspace.get('a', (5,4)) is a2
+    assert workspace.nbytes() == 22 * 8
+
+    # constants are built once for each shape and value, and are read-only
+    ones = workspace.constant((3,1))
+    assert np.allclose(ones, 1.)
+    assert workspace.constant((3,1)) is ones
+    assert workspace.constant((4,1)) is not ones
+    assert np.allclose(workspace.constant((3,1), 0.), 0.)
+    assert not ones.flags.writeable
+    assert workspace.nbytes() == (22 + 3 + 4 + 3) * 8
+
+
+#-------------------------------------------------------------------------
+def test_config():
+    ''' float32 compute mode'''
+    assert get_dtype() == np.float64
+    assert get_dtype('float32') == np.float32
+    assert get_dtype(np.float64) == np.float64
+    for dtype in ['float16', int, 'complex128']:
+        try:
+            get_dtype(dtype)
+            assert False
+        except ValueError:
+            pass
+    set_dtype('float32')
+    try:
+        assert get_dtype() == np.float32
+        assert get_dtype('float64') == np.float64
+    finally:
+        set_dtype(None)
+    assert get_dtype() == np.float64
+
+    assert float_dtype(np.zeros(3, dtype=np.float32)) == np.float32
+    assert float_dtype(np.zeros(3, dtype=int)) == np.float64
+    assert float_dtype(1.) == np.float64
+
+    # the conversion keeps the type of container, and does not copy if the dtype is already right
+    X = np.asmatrix(np.random.randn(4,3))
+    assert cast(X, np.float64) is X
+    X32 = cast(X, 'float32')
+    assert type(X32) == np.matrixlib.defmatrix.matrix and X32.dtype == np.float32
+    assert cast(np.asarray(X), np.float32).dtype == np.float32
+    import scipy.sparse as sp
+    S = cast(sp.csr_matrix(X), np.float32)
+    assert sp.isspmatrix_csr(S) and S.dtype == np.float32
+
+    # workspace buffers and optimizer states follow the dtype
+    workspace = Workspace()
+    a = workspace.get('a', (3,1), np.float32)
+    assert a.dtype == np.float32
+    assert workspace.get('a', (3,1), np.float32) is a
+    assert workspace.get('a', (3,1)).dtype == np.float64
+    assert workspace.constant((3,1), dtype=np.float32).dtype == np.float32
+    for optimizer in [SGD(), Momentum(), AdaGrad(), RMSProp(), Adam()]:
+        W = np.asmatrix(np.ones((3,2), dtype=np.float32))
+        for _ in range(2):
+            W = optimizer.update('W', W, np.asmatrix(np.full((3,2), 0.5, dtype=np.float32)), 0.1)
+        assert W.dtype == np.float32
+        assert all(value.dtype == np.float32 for value in optimizer.state['W'].values() if isinstance(value, np.ndarray))
+
+
+#-------------------------------------------------------------------------
+def test_engine():
+    ''' ndarray engine'''
+    # the adapters do not copy data that already has the layout
+    X = np.random.randn(5,3)
+    assert as_rows(X) is X
+    M = np.asmatrix(X)
+    assert type(as_rows(M)) == np.ndarray and np.shares_memory(as_rows(M), X)
+    F = np.asfortranarray(X)
+    assert as_rows(F).flags['C_CONTIGUOUS'] and np.allclose(as_rows(F), X)
+    assert as_rows(X, np.float32).dtype == np.float32
+    import scipy.sparse as sp
+    S = as_rows(sp.csc_matrix(X), np.float32)
+    assert sp.isspmatrix_csr(S) and S.dtype == np.float32
+    assert issparse(S) and not issparse(X) and not issparse(M)
+    b = np.asmatrix(np.random.randn(4,1))
+    v = as_vector(b)
+    assert v.shape == (4,) and np.shares_memory(v, b)
+    c = as_column(v)
+    assert type(c) == np.matrixlib.defmatrix.matrix and c.shape == (4,1) and np.shares_memory(c, b)
+
+    # the same results as the np.matrix formulas
+    W = np.random.randn(4,3)
+    z = linear(X, W, v)
+    assert z.shape == (5,4)
+    assert np.allclose(z, M * np.asmatrix(W).T + b.T)
+    a = softmax(z)
+    assert np.allclose(a.sum(axis=1), 1.)
+    assert np.allclose(a, np.exp(z) / np.exp(z).sum(axis=1, keepdims=True))
+    assert np.allclose(softmax(np.array([[1000., 0.]])), [[1., 0.]])
+    assert np.allclose(sigmoid(z), 1. / (1. + np.exp(-z)))
+    with np.errstate(all='raise'):
+        assert np.allclose(sigmoid(np.array([-1000., 0., 1000.])), [0., .5, 1.])
+    dL_dW, dL_db = linear_gradients(X, a)
+    assert dL_dW.shape == (4,3) and dL_db.shape == (4,)
+    assert np.allclose(dL_dW, np.asmatrix(a).T * M / 5)
+    assert np.allclose(dL_db, a.mean(axis=0))
+    dL_dW_sparse, dL_db_sparse = linear_gradients(sp.csr_matrix(X), a)
+    assert np.allclose(dL_dW_sparse, dL_dW) and np.allclose(dL_db_sparse, dL_db)
+
+    # a gradient step keeps the type and dtype of the parameter
+    W32 = np.asmatrix(W, dtype=np.float32)
+    W_new = gradient_step(W32, np.asmatrix(dL_dW, dtype=np.float32), 0.1)
+    assert type(W_new) == np.matrixlib.defmatrix.matrix and W_new.dtype == np.float32
+    assert np.allclose(W_new, W - 0.1 * dL_dW, atol=1e-5)
+    assert np.allclose(W32, W, atol=1e-6) # the given parameter is not modified
+
+
+#-------------------------------------------------------------------------
+def test_hashing():
+    ''' feature hashing'''
+    # the mapping is deterministic
+    i, s = hash_key('color=red', 16)
+    assert 0 <= i < 16
+    assert s in (1., -1.)
+    assert hash_key('color=red', 16) == (i, s)
+    assert hash_key('color=red', 16, alternate_sign=False) == (i, 1.)
+
+    idx, val = hash_record({'color': 'red', 'size': 2.5}, 16)
+    assert len(idx) == 2
+    assert np.allclose(np.abs(val), [1., 2.5])
+    idx2, val2 = hash_record([('color', 'red'), ('size', 2.5)], 16)
+    assert np.allclose(idx, idx2) and np.allclose(val, val2)
+
+    records = [{'color': 'red'}, {'color': 'blue', 'size': 2.}, {}]
+    X = transform(records, 16)
+    assert X.shape == (3,16)
+    assert X.format == 'csr'
+    assert X[0].nnz == 1
+    assert X[2].nnz == 0
+
+    # colliding features are summed
+    X = transform([[('a', 1.), ('a', 2.)]], 16, alternate_sign=False)
+    assert X.nnz == 1
+    assert np.allclose(X.data, 3.)
+
+    stream = hash_stream([(records[:2], [0, 1]), (records[2:], [1])], 16)
+    chunks = list(stream())
+    assert len(chunks) == 2
+    assert chunks[0][0].shape == (2,16)
+    assert len(list(stream())) == 2
+
+
+#-------------------------------------------------------------------------
+def test_early_stopping():
+    ''' EarlyStopping'''
+    w = np.asmatrix(np.zeros((2,1)))
+    es = EarlyStopping(tol=0.1)
+    es.reset((w, 0.))
+    assert es.reason == 'n_epoch'
+
+    # the running loss is the average over the recorded instances
+    es.record(3., 2)
+    es.record(1.)
+    assert not es.end((w + 1., 0.), alpha=0.5)
+    assert np.allclose(es.history['loss'], [4. / 3])
+    # the parameters moved by sqrt(2) in 2 steps of size 0.5
+    assert np.allclose(es.history['grad_norm'], [np.sqrt(2)])
+    assert es.history['val_loss'] == [None]
+
+    # less than 10% improvement: stop
+    es.record(1.3)
+    assert es.end((w + 1., 0.), alpha=0.5)
+    assert es.stopped
+    assert es.reason == 'tol'
+    assert es.n_epoch == 2
+    assert es.best_epoch == 2
+
+    # the step-size of each step: the parameters moved by 1 in 2 steps of sizes 0.1 and 0.4
+    es = EarlyStopping(tol=0.)
+    es.reset((w, 0.))
+    es.record(1., alpha=0.1)
+    es.record(1., alpha=0.4)
+    es.end((w, 1.), alpha=0.4)
+    assert np.allclose(es.history['grad_norm'], [2.])
+
+    # the gradient norm falls below gtol
+    es = EarlyStopping(tol=0., gtol=1e-3)
+    es.reset((w, 0.))
+    es.record(1.)
+    assert es.end((w, 0.), alpha=0.1)
+    assert es.reason == 'gtol'
+
+    # gtol assumes plain gradient descent steps
+    es.reset((w, 0.), SGD())
+    for optimizer in [Momentum(), AdaGrad(), RMSProp(), Adam()]:
+        try:
+            es.reset((w, 0.), optimizer)
+            assert False
+        except ValueError:
+            pass
+    EarlyStopping(tol=0.1).reset((w, 0.), Adam())
+
+    # patience on a held-out split: the best parameters are returned
+    losses = iter([3., 2., 2.5, 2.4, 2.6])
+    es = EarlyStopping(patience=3, validation=(None, None))
+    es.reset((w, 0.))
+    for epoch in range(5):
+        es.record(1.)
+        if es.end((w + epoch, 0.), 0.1, lambda X, Y, w, b: next(losses)):
+            break
+    assert es.reason == 'patience'
+    assert es.n_epoch == 5
+    assert es.best_epoch == 2
+    assert np.allclose(es.params[0], w + 1)
+    assert es.history['val_loss'] == [3., 2., 2.5, 2.4, 2.6]
+
+
+#-------------------------------------------------------------------------
+def test_optimizers():
+    ''' optimizers'''
+    W = np.mat('1.,2.;3.,4.')
+    g = np.mat('1.,-1.;2.,0.')
+
+    # plain gradient descent
+    W_new = SGD().update('W', W, g, 0.1)
+    assert type(W_new) == np.matrixlib.defmatrix.matrix
+    assert np.allclose(W_new, W - 0.1 * g)
+    assert np.allclose(W, [[1., 2.], [3., 4.]])
+
+    # momentum accumulates the steps
+    opt = Momentum(beta=0.5)
+    W1 = opt.update('W', W, g, 0.1)
+    W2 = opt.update('W', W1, g, 0.1)
+    assert np.allclose(W1, W - 0.1 * g)
+    assert np.allclose(W2, W1 - 0.15 * g)
+    opt = Momentum(beta=0.5, nesterov=True)
+    assert np.allclose(opt.update('W', W, g, 0.1), W - 0.15 * g)
+
+    # the adaptive methods scale each weight by the size of its past gradients
+    assert np.allclose(AdaGrad().update('W', W, g, 0.1), W - 0.1 * np.sign(g), atol=1e-6)
+    assert np.allclose(RMSProp(rho=0.75).update('W', W, g, 0.1), W - 0.2 * np.sign(g), atol=1e-6)
+    opt = Adam()
+    W1 = opt.update('W', W, g, 0.1)
+    assert np.allclose(W1, W - 0.1 * np.sign(g), atol=1e-6)
+    assert opt.state['W']['t'] == 1
+    assert np.allclose(opt.update('W', W1, g, 0.1), W1 - 0.1 * np.sign(g), atol=1e-6)
+
+    # the parameters have separate states, and a scalar parameter stays a scalar
+    b = opt.update('b', 1., 2., 0.1)
+    assert np.ndim(b) == 0
+    assert np.allclose(b, 0.9)
+    assert opt.state['W']['t'] == 2 and opt.state['b']['t'] == 1
+    opt.reset()
+    assert opt.state == {}
+
+    # sparse update: only the given columns and their state change
+    opt = Adam()
+    W_ = np.array([[1., 2., 3.], [4., 5., 6.]])
+    opt.update_sparse('W', W_, (slice(None), [0, 2]), np.array([[1., 1.], [-1., 1.]]), 0.1)
+    assert np.allclose(W_, [[0.9, 2., 2.9], [4.1, 5., 5.9]])
+    assert np.allclose(opt.state['W']['m'][:, 1], 0)
+    assert np.allclose(opt.state['W']['m'][:, 0], [0.1, -0.1])
+
+    # the state grows with the output layer
+    opt = Momentum()
+    opt.update('W', W, g, 0.1)
+    W3 = opt.update('W', np.vstack([W, [[5., 6.]]]), np.vstack([g, [[1., 1.]]]), 0.1)
+    assert W3.shape == (3,2)
+    assert np.allclose(W3[2], [[4.9, 5.9]])
+
+
+#-------------------------------------------------------------------------
+def test_schedules():
+    ''' learning-rate schedules'''
+    def run(schedule, n):
+        values = []
+        for _ in range(n):
+            values.append(schedule())
+            schedule.end_epoch()
+        return values
+
+    assert np.allclose(run(StepDecay(1., step_size=2, gamma=0.5), 5), [1., 1., .5, .5, .25])
+    assert np.allclose(run(ExponentialDecay(1., gamma=0.5), 4), [1., .5, .25, .125])
+    assert np.allclose(run(InverseTimeDecay(1., decay=1.), 4), [1., 1./2, 1./3, 1./4])
+    # warm restarts: cycles of 2 then 4 epochs
+    assert np.allclose(run(CosineRestarts(1., period=2, mult=2), 7), [1., .5, 1., .853553, .5, .146447, 1.])
+    values = run(OneCycle(1., total=10, unit='epoch'), 12)
+    assert np.allclose(values[:4], [.04, .36, .68, 1.])
+    assert np.all(np.diff(values[3:10]) < 0)
+    assert np.allclose(values[9:], 1. / 25 / 1e4)
+
+    # a step schedule counts the calls within the epochs; reset() restarts it
+    schedule = ExponentialDecay(1., gamma=0.5, unit='step')
+    assert np.allclose([schedule(), schedule(), schedule()], [1., .5, .25])
+    schedule.end_epoch()
+    assert np.allclose(schedule(), .125)
+    assert np.allclose(schedule.last, .125)
+    schedule.reset()
+    assert schedule.n_step == 0 and schedule.epoch == 0
+    assert np.allclose(schedule(), 1.)
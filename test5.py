@@ -0,0 +1,253 @@
+from network import *
+import neuralnet
+import optim
+import numpy as np
+import sys
+from sklearn.datasets import make_classification
+
+'''
+    Unit test 5:
+    This file includes unit tests for network.py.
+    You could test the correctness of your code by typing `nosetests -v test5.py` in the terminal.
+'''
+#-------------------------------------------------------------------------
+def test_python_version():
+    ''' ----------- Networks of any depth --------------'''
+    assert sys.version_info[0]==3 # require python 3 (instead of python 2)
+
+
+#-------------------------------------------------------------------------
+def test_dense():
+    ''' Dense layer'''
+    # the layers work on plain arrays; numpy matrices are converted without a copy
+    W = np.mat('1.,2.,3.;4.,5.,6.')
+    layer = Dense(3, 2, W=W, b=np.mat('1.;-1.'))
+    assert type(layer.W) == np.ndarray and np.shares_memory(layer.W, W)
+    X = np.array([[1.,0.,0.],[0.,1.,1.]])
+    z = layer.forward(X)
+    assert type(z) == np.ndarray
+    assert np.allclose(z, [[2., 3.], [6., 10.]])
+
+    dL_dX = layer.backward(np.eye(2))
+    assert type(dL_dX) == np.ndarray
+    assert np.allclose(layer.dL_dW, [[1., 0., 0.], [0., 1., 1.]])
+    assert np.allclose(layer.dL_db, [1., 1.])
+    assert np.allclose(dL_dX, [[1., 2., 3.], [4., 5., 6.]])
+    assert layer.backward(np.eye(2), need_input_gradient=False) is None
+
+    layer = Dense(3, 2)
+    assert np.allclose(layer.W, np.zeros((2,3)))
+    assert layer.b.shape == (2,)
+
+    # the network converts at its public boundary
+    model = Sequential([Dense(3, 2, W=W, b=np.mat('1.;-1.'))])
+    assert type(model.forward(np.asmatrix(X))) == np.matrixlib.defmatrix.matrix
+    W_, b_ = model.params()
+    assert type(W_) == np.matrixlib.defmatrix.matrix and b_.shape == (2,1)
+
+
+#-------------------------------------------------------------------------
+def test_backward():
+    ''' back propagation through a deep network'''
+    X, y = make_classification(n_samples=10, n_features=4, n_redundant=0, n_informative=3,
+                               n_classes=3, random_state=1)
+    X = np.asmatrix(X)
+    model = Sequential([Dense(4, 5, np.random.randn(5,4), np.random.randn(5,1)), Sigmoid(),
+                        Dense(5, 4, np.random.randn(4,5), np.random.randn(4,1)), Sigmoid(),
+                        Dense(4, 3, np.random.randn(3,4), np.random.randn(3,1))])
+    a = model.forward(X)
+    assert a.shape == (10,3)
+    assert np.allclose(a.sum(axis=1), 1)
+    model.backward(y, a)
+    grads = model.grads()
+    assert len(grads) == 6
+
+    # gradient checking
+    params = model.params()
+    L = model.compute_loss(X, y)
+    for k in range(6):
+        i, j = np.random.randint(params[k].shape[0]), np.random.randint(params[k].shape[1])
+        params_d = [param.copy() for param in params]
+        params_d[k][i, j] += 1e-7
+        dL = (model.compute_loss(X, y, *params_d) - L) / 1e-7
+        assert np.allclose(dL, grads[k][i, j], atol=1e-4)
+    # the parameters are restored after evaluating other parameters
+    assert all(np.allclose(p, q) for p, q in zip(model.params(), params))
+
+
+#-------------------------------------------------------------------------
+def test_two_layer():
+    ''' the two-layer model of neuralnet.py'''
+    X, y = make_classification(n_samples=60, n_features=6, n_redundant=0, n_informative=4,
+                               n_classes=3, random_state=1)
+    X = np.asmatrix(X)
+
+    params_true = neuralnet.train(X, y, h=4, alpha=0.1, n_epoch=3, batch_size=8)
+    model = two_layer(6, 4, 3).train(X, y, alpha=0.1, n_epoch=3, batch_size=8)
+    for param, param_true in zip(model.params(), params_true):
+        assert type(param) == np.matrixlib.defmatrix.matrix
+        assert np.allclose(param, param_true, atol=1e-8)
+
+    params_true = neuralnet.train(X, y, h=4, alpha=0.1, n_epoch=3)
+    model = two_layer(6, 4, 3).train(X, y, alpha=0.1, n_epoch=3)
+    for param, param_true in zip(model.params(), params_true):
+        assert np.allclose(param, param_true, atol=1e-8)
+
+    Y, P = model.predict(X)
+    Y_true, P_true = neuralnet.predict(X, *params_true)
+    assert np.allclose(P, P_true)
+    assert np.allclose(Y, Y_true)
+
+    model = from_neuralnet(*params_true)
+    for param, param_true in zip(model.params(), params_true):
+        assert np.allclose(param, param_true)
+
+
+#-------------------------------------------------------------------------
+def test_train_deep():
+    ''' train a deeper network'''
+    X, y = make_classification(n_samples=200, n_features=6, n_redundant=0, n_informative=4,
+                               n_classes=3, random_state=1)
+    X = np.asmatrix(X)
+    rng = np.random.RandomState(0)
+    model = Sequential([Dense(6, 16, 0.5 * rng.randn(16,6)), Sigmoid(),
+                        Dense(16, 8, 0.5 * rng.randn(8,16)), Sigmoid(),
+                        Dense(8, 3, 0.5 * rng.randn(3,8))])
+    L0 = model.compute_loss(X, y)
+    model.train(X, y, alpha=0.5, n_epoch=30, batch_size=10)
+    assert model.compute_loss(X, y) < L0
+    Y, P = model.predict(X)
+    assert np.mean(Y == y) > 0.6
+
+
+#-------------------------------------------------------------------------
+def test_activations():
+    ''' activation layers'''
+    X, y = make_classification(n_samples=10, n_features=4, n_redundant=0, n_informative=3,
+                               n_classes=3, random_state=1)
+    X = np.asmatrix(X)
+    for layer in [ReLU(), LeakyReLU(), Tanh()]:
+        model = Sequential([Dense(4, 5, np.random.randn(5,4), np.random.randn(5,1)), layer,
+                            Dense(5, 3, np.random.randn(3,5), np.random.randn(3,1))])
+        a = model.forward(X)
+        model.backward(y, a)
+        grads = model.grads()
+        params = model.params()
+        L = model.compute_loss(X, y)
+        for k in range(4):
+            i, j = np.random.randint(params[k].shape[0]), np.random.randint(params[k].shape[1])
+            params_d = [param.copy() for param in params]
+            params_d[k][i, j] += 1e-7
+            dL = (model.compute_loss(X, y, *params_d) - L) / 1e-7
+            assert np.allclose(dL, grads[k][i, j], atol=1e-4)
+
+        # the same model as neuralnet.py with the same activation
+        Y, P = model.predict(X)
+        Y_true, P_true = neuralnet.predict(X, *params, activation=layer.activation)
+        assert np.allclose(P, P_true)
+        assert type(two_layer(4, 5, 3, layer.activation).layers[1]) == type(layer)
+
+
+#-------------------------------------------------------------------------
+def test_train_optimizer():
+    ''' train with an optimizer'''
+    X, y = make_classification(n_samples=60, n_features=6, n_redundant=0, n_informative=4,
+                               n_classes=3, random_state=1)
+    X = np.asmatrix(X)
+    params_true = neuralnet.train(X, y, h=4, alpha=0.01, n_epoch=3, batch_size=8, optimizer=optim.Adam())
+    model = two_layer(6, 4, 3).train(X, y, alpha=0.01, n_epoch=3, batch_size=8, optimizer=optim.Adam())
+    for param, param_true in zip(model.params(), params_true):
+        assert np.allclose(param, param_true)
+
+    # train() starts the optimizer over, partial_fit() continues with its state
+    opt = optim.Adam()
+    model = two_layer(6, 4, 3).train(X, y, alpha=0.01, n_epoch=1, batch_size=8, optimizer=opt)
+    model.train(X, y, alpha=0.01, n_epoch=1, batch_size=8, optimizer=opt)
+    assert opt.state[0]['t'] == 8
+    model.partial_fit(X, y, alpha=0.01, batch_size=8, optimizer=opt)
+    assert opt.state[0]['t'] == 16
+
+
+#-------------------------------------------------------------------------
+def test_train_stream():
+    ''' train on a dataset read one chunk at a time'''
+    from stopping import EarlyStopping
+    X, y = make_classification(n_samples=200, n_features=6, n_redundant=0, n_informative=4,
+                               n_classes=3, random_state=1)
+    X = np.asmatrix(X)
+    model = two_layer(6, 4, 3).train_stream((X, y), alpha=0.1, n_epoch=3, batch_size=10, chunk_size=50)
+    model_true = two_layer(6, 4, 3).train(X, y, alpha=0.1, n_epoch=3, batch_size=10)
+    for param, param_true in zip(model.params(), model_true.params()):
+        assert np.allclose(param, param_true)
+
+    # early stopping, as in train()
+    es = EarlyStopping(tol=1e-3)
+    model = two_layer(6, 4, 3).train_stream((X, y), alpha=0.1, n_epoch=100, batch_size=10, chunk_size=50, early_stopping=es)
+    es_true = EarlyStopping(tol=1e-3)
+    model_true = two_layer(6, 4, 3).train(X, y, alpha=0.1, n_epoch=100, batch_size=10, early_stopping=es_true)
+    assert es.stopped
+    assert es.n_epoch == es_true.n_epoch < 100
+    for param, param_true in zip(model.params(), model_true.params()):
+        assert np.allclose(param, param_true)
+
+    es = EarlyStopping(tol=1e-3, patience=2, validation=(X[150:], y[150:]))
+    model = two_layer(6, 4, 3).train_stream((X[:150], y[:150]), alpha=0.1, n_epoch=100, batch_size=10, chunk_size=50, early_stopping=es)
+    assert np.isclose(model.compute_loss(X[150:], y[150:]), min(es.history['val_loss']))
+
+
+#-------------------------------------------------------------------------
+def test_initialize():
+    ''' random initialization of the layers'''
+    model = two_layer(6, 4, 3, init='xavier', seed=1)
+    for param, param_true in zip(model.params(), neuralnet.initialize(6, 4, 3, 'xavier', seed=1)):
+        assert np.allclose(param, param_true)
+    layer = Dense(5, 3, init='he', seed=0)
+    assert layer.W.shape == (3,5)
+    assert np.allclose(layer.W, Dense(5, 3, init='he', seed=0).W)
+
+    # the default scheme follows the activation, as in neuralnet.initialize()
+    for activation in ['sigmoid', 'relu', 'tanh']:
+        model = two_layer(6, 4, 3, activation, seed=1)
+        for param, param_true in zip(model.params(), neuralnet.initialize(6, 4, 3, seed=1, activation=activation)):
+            assert np.allclose(param, param_true)
+    assert np.allclose(Dense(5, 3).W, 0)
+    assert np.allclose(Dense(5, 3, seed=0, activation='relu').W, Dense(5, 3, init='he', seed=0).W)
+
+
+#-------------------------------------------------------------------------
+def test_float32():
+    ''' float32 compute mode'''
+    import config
+    X, y = make_classification(n_samples=60, n_features=6, n_redundant=0, n_informative=4,
+                               n_classes=3, random_state=1)
+    X = np.asmatrix(X)
+
+    # the parameters follow the given dtype, the dtype of the given weights, or the global dtype
+    assert Dense(5, 3).W.dtype == np.float64
+    assert Dense(5, 3, dtype='float32').b.dtype == np.float32
+    assert Dense(5, 3, np.zeros((3,5), dtype=np.float32)).b.dtype == np.float32
+    config.set_dtype('float32')
+    try:
+        model = two_layer(6, 4, 3, 'tanh', seed=0)
+    finally:
+        config.set_dtype(None)
+    assert model.get_dtype() == np.float32
+
+    # the features are converted to the dtype of the network, and the training stays in float32
+    params_true = neuralnet.train(X, y, h=4, alpha=0.1, n_epoch=3, batch_size=8, activation='tanh', seed=0, dtype='float32')
+    model.train(X, y, alpha=0.1, n_epoch=3, batch_size=8)
+    for param, param_true in zip(model.params(), params_true):
+        assert param.dtype == np.float32
+        assert np.allclose(param, param_true, atol=1e-5)
+    model = from_neuralnet(*params_true, activation='tanh')
+    assert model.get_dtype() == np.float32
+    model.partial_fit(X, y, alpha=0.1, optimizer=optim.Adam())
+    assert all(param.dtype == np.float32 for param in model.params())
+
+    # inference runs in the dtype of the network, whatever the dtype of the features
+    Y, P = model.predict(X)
+    assert P.dtype == np.float32
+    assert np.allclose(P, neuralnet.predict(X, *model.params(), activation='tanh')[1], atol=1e-5)
+    model = two_layer(6, 4, 3, dtype=np.float32)
+    assert model.predict(X)[1].dtype == np.float32
+    assert np.isclose(model.compute_loss(X, y), np.log(3), atol=1e-5)
@@ -0,0 +1,78 @@
+import numpy as np
+#-------------------------------------------------------------------------
+'''
+    Reusable buffers for the training loops.
+    Per-sample gradient descent computes the same intermediate arrays (logits, activations, gradients) for every instance.
+    Instead of allocating them again for every instance, the in-place training steps (for example softmax.train_step())
+    write them into buffers of a Workspace object, which are allocated on the first instance and reused afterwards.
+    Together with in-place parameter updates, a training step then allocates no new array once the buffers exist.
+    A workspace also keeps the constant local gradients, such as dz_db (all ones), so that they are built once instead of once per instance.
+    train() creates one workspace per call and passes it to every epoch.
+
+    Notations:
+            name: the name of a buffer, a string, for example 'dL_dW'.
+            shape: the shape of a buffer, a tuple of integers.
+            value: the value of all the elements of a constant, a float scalar.
+            dtype: the floating point type of a buffer or a constant, float64 by default (see config.py).
+'''
+
+#--------------------------
+class Workspace:
+    '''
+        A set of named float buffers and of read-only constants.
+        Attributes:
+            buffers: the buffers, a dictionary {name: float numpy array}.
+            constants: the constants, a dictionary {(shape, value, dtype): read-only float numpy array}.
+    '''
+    #--------------------------
+    def __init__(self):
+        self.buffers = {}
+        self.constants = {}
+
+    #--------------------------
+    def get(self, name, shape, dtype=float):
+        '''
+            Get a buffer. It is allocated on first use, and again only if the requested shape or dtype changes
+            (for example when the output layer grows with new classes).
+            The content of the buffer is whatever was written to it last: the caller must overwrite it.
+            Input:
+                name: the name of the buffer, a string.
+                shape: the shape of the buffer, a tuple of integers.
+                dtype: the floating point type of the buffer.
+            Output:
+                buffer: a float numpy array of the given shape and dtype.
+        '''
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype=dtype)
+            self.buffers[name] = buffer
+        return buffer
+
+    #--------------------------
+    def constant(self, shape, value=1., dtype=float):
+        '''
+            Get an array with all its elements equal to a constant, for example the local gradient dz_db of the logits w.r.t. the biases (all ones).
+            It is created on first use and shared by all the callers asking for the same shape and value, so it is read-only.
+            Input:
+                shape: the shape of the array, a tuple of integers.
+                value: the value of the elements, a float scalar.
+                dtype: the floating point type of the array.
+            Output:
+                constant: a read-only float numpy array of the given shape and dtype.
+        '''
+        key = (shape, value, np.dtype(dtype))
+        constant = self.constants.get(key)
+        if constant is None:
+            constant = np.full(shape, value, dtype=dtype)
+            constant.flags.writeable = False
+            self.constants[key] = constant
+        return constant
+
+    #--------------------------
+    def nbytes(self):
+        '''
+            Get the memory used by the buffers and the constants.
+            Output:
+                nbytes: the total size of the buffers and the constants in bytes, an integer scalar.
+        '''
+        return sum(array.nbytes for array in list(self.buffers.values()) + list(self.constants.values()))